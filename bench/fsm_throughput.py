@@ -0,0 +1,79 @@
+"""
+Transition throughput of the compiled manuscript FSM:
+
+    python -m bench.fsm_throughput
+"""
+import argparse
+import timeit
+
+import data.manuscripts.query as qry
+
+NUMBER = 200_000
+
+# The walk a published manuscript takes, with long-form and code states.
+STATIC_PATH = [
+    (qry.IN_REF_REV, qry.ACCWITHREV),
+    (qry.AUTHOR_REVISIONS, qry.DONE),
+    (qry.EDITOR_REVIEW, qry.ACCEPT),
+    (qry.COPY_EDIT, qry.DONE),
+    (qry.AUTHOR_REV, qry.DONE),
+    (qry.FORMATTING, qry.DONE),
+    ('Submitted', qry.REJECT),
+]
+
+
+def legacy_handle_action(curr_state, action, **kwargs) -> str:
+    """
+    What handle_action used to do, for comparison: translate the state
+    name, walk the nested dicts and call a lambda.
+    """
+    curr_state = qry.STATE_NAME_TO_CODE.get(curr_state, curr_state)
+    if curr_state not in LEGACY_TABLE:
+        raise ValueError(f'Bad state: {curr_state}')
+    if action not in LEGACY_TABLE[curr_state]:
+        raise ValueError(f'Invalid action {action} for state {curr_state}')
+    return LEGACY_TABLE[curr_state][action][qry.FUNC](**kwargs)
+
+
+def make_legacy_entry(entry: dict) -> dict:
+    if qry.TARGET in entry:
+        target = entry[qry.TARGET]
+        return {qry.FUNC: lambda **kwargs: target}
+    return {qry.FUNC: entry[qry.FUNC]}
+
+
+LEGACY_TABLE = {
+    state: {action: make_legacy_entry(entry)
+            for action, entry in actions.items()}
+    for state, actions in qry.STATE_TABLE.items()
+}
+
+
+def walk(handler):
+    for state, action in STATIC_PATH:
+        handler(state, action, manu=qry.SAMPLE_MANU)
+
+
+def run(number: int = NUMBER) -> dict:
+    ret = {}
+    for name, handler in (('compiled', qry.handle_action),
+                          ('legacy', legacy_handle_action)):
+        secs = timeit.timeit(lambda: walk(handler), number=number)
+        ret[name] = round(number * len(STATIC_PATH) / secs)
+    secs = timeit.timeit(
+        lambda: qry.get_valid_actions_by_state(qry.IN_REF_REV),
+        number=number)
+    ret['valid_actions_lookups'] = round(number / secs)
+    return ret
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--number', type=int, default=NUMBER)
+    args = parser.parse_args()
+    for name, per_sec in run(args.number).items():
+        print(f'{name}: {per_sec:,} per second')
+
+
+if __name__ == '__main__':
+    main()
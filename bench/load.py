@@ -0,0 +1,456 @@
+"""
+HTTP load generator for the API in server/endpoints.py.
+Sends a weighted mix of requests (people reads, text page views,
+manuscript creates, transitions and valid-action lookups) either to the
+Flask app in-process or to a running server, and reports throughput,
+p50/p95/p99 latency and error rates per route template.
+
+Two ways to drive it:
+  - closed loop: --concurrency workers send requests back to back;
+  - open loop: --rate requests per second arrive at random (Poisson)
+    and are served by --concurrency workers. Latency is measured from
+    when a request was due, so time spent queued behind slow ones
+    counts, as it would for a real user.
+
+The manuscripts a run creates are deleted through the API when it
+ends. In-process runs write to whatever DB the app is configured for,
+so they refuse to start with CLOUD_MONGO=1; load a deployed server with
+--url instead.
+
+Reports are JSON with the same keys every run, so two can be compared:
+
+    python -m bench.load --mix deadline --rate 200 --out before.json
+    python -m bench.load --mix deadline --rate 200 --compare before.json
+    python -m bench.load --url http://localhost:8000 --concurrency 32
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import quote, urlsplit
+
+import data.db_connect as dbc
+import data.manuscripts.query as qry
+import data.people as ppl
+import data.text as txt
+from bench.search_latency import percentile
+
+DURATION_SECS = 30.0
+CONCURRENCY = 8
+PRELOAD = 50  # manuscripts created before the clock starts
+TIMEOUT_SECS = 30.0
+TOLERANCE = .25  # p99 this much worse than the compared run is flagged
+
+PEOPLE = 'GET /people'
+PERSON = 'GET /people/<email>'
+TEXT = 'GET /text/<key>'
+CREATE = 'PUT /manuscripts/create'
+TRANSITION = 'POST /manuscripts/receive_action'
+VALID_ACTIONS = 'GET /manuscripts/<id>/valid_actions'
+ROUTES = [PEOPLE, PERSON, TEXT, CREATE, TRANSITION, VALID_ACTIONS]
+
+# {mix: {route: weight}}
+MIXES = {
+    'default': {
+        PEOPLE: 5, PERSON: 15, TEXT: 30,
+        CREATE: 10, TRANSITION: 15, VALID_ACTIONS: 25,
+    },
+    'browse': {
+        PEOPLE: 10, PERSON: 20, TEXT: 50,
+        CREATE: 2, TRANSITION: 3, VALID_ACTIONS: 15,
+    },
+    # the week before a submission deadline
+    'deadline': {
+        PEOPLE: 2, PERSON: 8, TEXT: 10,
+        CREATE: 40, TRANSITION: 20, VALID_ACTIONS: 20,
+    },
+}
+
+META = 'meta'
+ROUTE_STATS = 'routes'
+TOTAL = 'total'
+COUNT = 'count'
+RPS = 'rps'
+P50 = 'p50_ms'
+P95 = 'p95_ms'
+P99 = 'p99_ms'
+MAX = 'max_ms'
+CLIENT_ERRORS = 'client_errors'  # 4xx, e.g. losing a transition race
+ERRORS = 'errors'  # 5xx and failed connections
+ERROR_RATE = 'error_rate'
+
+WORDS = ('manuscript journal theory model data result method proof '
+         'sample network review evidence measure figure table').split()
+
+
+def make_app_sender():
+    """
+    send(method, path, body) -> status, against the app in-process.
+    Each thread gets its own test client.
+    """
+    from server.endpoints import app
+    local = threading.local()
+
+    def send(method: str, path: str, body: dict = None) -> tuple:
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        resp = local.client.open(path, method=method, json=body)
+        return resp.status_code, resp.get_json(silent=True)
+    return send
+
+
+def make_http_sender(url: str, timeout: float = TIMEOUT_SECS):
+    """
+    send(method, path, body) -> status, against a server at `url`.
+    Each thread keeps one connection alive.
+    """
+    parts = urlsplit(url)
+    conn_class = (http.client.HTTPSConnection if parts.scheme == 'https'
+                  else http.client.HTTPConnection)
+    prefix = parts.path.rstrip('/')
+    local = threading.local()
+
+    def send(method: str, path: str, body: dict = None) -> tuple:
+        if not hasattr(local, 'conn'):
+            local.conn = conn_class(parts.netloc, timeout=timeout)
+        headers = {}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        try:
+            local.conn.request(method, prefix + path, payload, headers)
+            resp = local.conn.getresponse()
+            data = resp.read()
+        except (OSError, http.client.HTTPException):
+            local.conn.close()
+            del local.conn
+            raise
+        try:
+            return resp.status, json.loads(data)
+        except ValueError:
+            return resp.status, None
+    return send
+
+
+class Workload:
+    """
+    What the requests are about: the people and pages that exist, and
+    the manuscripts this run made, with the state each was last seen in.
+    """
+
+    def __init__(self, send, seed: int = 0):
+        self.send = send
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.manuscripts = {}
+        self.created = []  # every manuscript this run made, to clean up
+        status, people = send('GET', '/people')
+        self.emails = (list(people) if status == 200 and people
+                       else [ppl.TEST_EMAIL])
+        status, texts = send('GET', '/text')
+        keys = []
+        if status == 200 and texts:
+            keys = (list(texts) if isinstance(texts, dict)
+                    else [text.get(txt.KEY) for text in texts])
+        self.keys = [key for key in keys if key] or [txt.TEST_KEY]
+
+    def choice(self, seq):
+        with self.lock:
+            return self.rng.choice(seq)
+
+    def words(self, count: int) -> str:
+        with self.lock:
+            return ' '.join(self.rng.choices(WORDS, k=count))
+
+    def pick_manuscript(self):
+        with self.lock:
+            if not self.manuscripts:
+                return None, None
+            manu_id = self.rng.choice(list(self.manuscripts))
+            return manu_id, self.manuscripts[manu_id]
+
+    def seen(self, manu_id: str, state: str):
+        with self.lock:
+            if state in qry.TERMINAL_STATES:
+                self.manuscripts.pop(manu_id, None)
+            else:
+                self.manuscripts[manu_id] = state
+
+    def request(self, route: str) -> tuple:
+        """
+        The (method, path, body) for one request to `route`.
+        """
+        if route == PEOPLE:
+            return 'GET', '/people', None
+        if route == PERSON:
+            return 'GET', f'/people/{quote(self.choice(self.emails))}', None
+        if route == TEXT:
+            return 'GET', f'/text/{quote(self.choice(self.keys))}', None
+        manu_id, state = self.pick_manuscript()
+        if route == CREATE or manu_id is None:
+            return 'PUT', '/manuscripts/create', {
+                'author': self.words(2).title(),
+                'title': self.words(6).capitalize(),
+                'text': self.words(300),
+            }
+        if route == VALID_ACTIONS:
+            return 'GET', f'/manuscripts/{manu_id}/valid_actions', None
+        action = self.choice(qry.get_valid_actions_by_state(state))
+        return 'POST', '/manuscripts/receive_action', {
+            'id': manu_id, 'action': action}
+
+    def note(self, method: str, path: str, body: dict, status: int,
+             resp) -> None:
+        """
+        Keep track of the manuscripts from what the server said.
+        """
+        if status != 200 or not isinstance(resp, dict):
+            return
+        if path == '/manuscripts/create':
+            with self.lock:
+                self.created.append(resp['id'])
+            self.seen(resp['id'], qry.SUBMITTED)
+        elif path == '/manuscripts/receive_action':
+            self.seen(body['id'], resp['state'])
+
+    def clean_up(self) -> int:
+        """
+        Delete the manuscripts this run created. Returns how many went.
+        """
+        deleted = 0
+        for manu_id in self.created:
+            try:
+                status, _ = self.send('DELETE', f'/manuscripts/{manu_id}')
+            except Exception:
+                continue
+            deleted += status == 200
+        self.created = []
+        return deleted
+
+
+def route_of(method: str, path: str, route: str) -> str:
+    # a transition with nothing to transition becomes a create
+    if method == 'PUT' and path == '/manuscripts/create':
+        return CREATE
+    return route
+
+
+def call(send, work: Workload, route: str, due: float) -> tuple:
+    """
+    One request. Returns (route, status or None, seconds since `due`).
+    """
+    method, path, body = work.request(route)
+    try:
+        status, resp = send(method, path, body)
+    except Exception:
+        return route_of(method, path, route), None, time.perf_counter() - due
+    elapsed = time.perf_counter() - due
+    work.note(method, path, body, status, resp)
+    return route_of(method, path, route), status, elapsed
+
+
+def pick_routes(mix: dict, rng: random.Random):
+    routes, weights = list(mix), list(mix.values())
+    while True:
+        yield rng.choices(routes, weights)[0]
+
+
+def run_closed(send, work: Workload, mix: dict, concurrency: int,
+               duration: float, seed: int) -> list:
+    stop = time.perf_counter() + duration
+    samples = []
+    lock = threading.Lock()
+
+    def worker(num: int):
+        mine = []
+        for route in pick_routes(mix, random.Random(f'{seed}-{num}')):
+            start = time.perf_counter()
+            if start >= stop:
+                break
+            mine.append(call(send, work, route, start))
+        with lock:
+            samples.extend(mine)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    return samples
+
+
+def run_open(send, work: Workload, mix: dict, rate: float,
+             concurrency: int, duration: float, seed: int) -> list:
+    rng = random.Random(seed)
+    routes = pick_routes(mix, rng)
+    start = time.perf_counter()
+    due = start
+    futures = []
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        while True:
+            due += rng.expovariate(rate)
+            if due - start >= duration:
+                break
+            wait = due - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            futures.append(pool.submit(call, send, work, next(routes), due))
+    return [future.result() for future in futures]
+
+
+def summarize(samples: list, secs: float) -> dict:
+    latencies = [elapsed * 1000 for _, _, elapsed in samples]
+    client_errors = sum(1 for _, status, _ in samples
+                        if status and 400 <= status < 500)
+    errors = sum(1 for _, status, _ in samples
+                 if status is None or status >= 500)
+    if not samples:
+        return {COUNT: 0}
+    return {
+        COUNT: len(samples),
+        RPS: round(len(samples) / secs, 1),
+        P50: round(percentile(latencies, 50), 2),
+        P95: round(percentile(latencies, 95), 2),
+        P99: round(percentile(latencies, 99), 2),
+        MAX: round(max(latencies), 2),
+        CLIENT_ERRORS: client_errors,
+        ERRORS: errors,
+        ERROR_RATE: round(errors / len(samples), 4),
+    }
+
+
+def uses_cloud_db() -> bool:
+    return os.environ.get('CLOUD_MONGO', dbc.LOCAL) == dbc.CLOUD
+
+
+def run(url: str = None, mix: str = 'default',
+        concurrency: int = CONCURRENCY, rate: float = None,
+        duration: float = DURATION_SECS, preload: int = PRELOAD,
+        seed: int = 0) -> dict:
+    """
+    Drive the API for `duration` seconds and return the report.
+    Without a url the app is run in-process, against the local DB only.
+    """
+    if mix not in MIXES:
+        raise ValueError(f'Unknown mix: {mix}')
+    if not url and uses_cloud_db():
+        raise ValueError('Refusing to load the cloud DB in-process; '
+                         'give a --url or unset CLOUD_MONGO')
+    send = make_http_sender(url) if url else make_app_sender()
+    work = Workload(send, seed)
+    try:
+        for _ in range(preload):
+            call(send, work, CREATE, time.perf_counter())
+        start = time.perf_counter()
+        if rate:
+            samples = run_open(send, work, MIXES[mix], rate, concurrency,
+                               duration, seed)
+        else:
+            samples = run_closed(send, work, MIXES[mix], concurrency,
+                                 duration, seed)
+        secs = time.perf_counter() - start
+    finally:
+        work.clean_up()
+    return {
+        META: {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'target': url or 'in-process',
+            'mix': mix,
+            'concurrency': concurrency,
+            'rate': rate,
+            'duration': duration,
+            'seed': seed,
+            'node': platform.node(),
+        },
+        ROUTE_STATS: {route: summarize([s for s in samples if s[0] == route],
+                                       secs)
+                      for route in ROUTES},
+        TOTAL: summarize(samples, secs),
+    }
+
+
+def compare(report: dict, before: dict,
+            tolerance: float = TOLERANCE) -> list:
+    """
+    [(route, before p99, now p99)] for every route whose p99 got worse
+    by more than the tolerance, or whose error rate went up.
+    """
+    worse = []
+    rows = {**report[ROUTE_STATS], TOTAL: report[TOTAL]}
+    old_rows = {**before.get(ROUTE_STATS, {}), TOTAL: before.get(TOTAL, {})}
+    for route, stats in rows.items():
+        old = old_rows.get(route, {})
+        if not stats.get(COUNT) or not old.get(COUNT):
+            continue
+        if (stats[P99] > old[P99] * (1 + tolerance)
+                or stats[ERROR_RATE] > old[ERROR_RATE]):
+            worse.append((route, old[P99], stats[P99]))
+    return worse
+
+
+def format_report(report: dict, before: dict = None) -> str:
+    lines = [f'{"route":40} {"count":>7} {"rps":>8} {"p50":>8} {"p95":>8} '
+             f'{"p99":>8} {"4xx":>5} {"err%":>6}']
+    rows = {**report[ROUTE_STATS], TOTAL: report[TOTAL]}
+    for route, stats in rows.items():
+        if not stats.get(COUNT):
+            continue
+        line = (f'{route:40} {stats[COUNT]:>7} {stats[RPS]:>8} '
+                f'{stats[P50]:>8} {stats[P95]:>8} {stats[P99]:>8} '
+                f'{stats[CLIENT_ERRORS]:>5} {stats[ERROR_RATE]:>6.1%}')
+        old = (before or {}).get(ROUTE_STATS, {}).get(route)
+        if route == TOTAL and before:
+            old = before.get(TOTAL)
+        if old and old.get(COUNT):
+            line += f'  p99 was {old[P99]}'
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Put the API under load and report latency by route.')
+    parser.add_argument('--url', help='Server to load; default: run the '
+                                      'app in-process')
+    parser.add_argument('--mix', choices=MIXES, default='default')
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY)
+    parser.add_argument('--rate', type=float,
+                        help='Requests per second (open loop); default: '
+                             'as fast as the workers go')
+    parser.add_argument('--duration', type=float, default=DURATION_SECS)
+    parser.add_argument('--preload', type=int, default=PRELOAD,
+                        help='Manuscripts to create first')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='Write the report here as JSON')
+    parser.add_argument('--compare', help='A report from an earlier run')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    args = parser.parse_args()
+    if not args.url and uses_cloud_db():
+        parser.error('in-process runs need the local DB; give a --url or '
+                     'unset CLOUD_MONGO')
+    report = run(args.url, args.mix, args.concurrency, args.rate,
+                 args.duration, args.preload, args.seed)
+    before = None
+    if args.compare:
+        with open(args.compare) as old:
+            before = json.load(old)
+    print(format_report(report, before))
+    if args.out:
+        with open(args.out, 'w') as out:
+            json.dump(report, out, indent=2)
+            out.write('\n')
+    if before:
+        worse = compare(report, before, args.tolerance)
+        for route, old, now in worse:
+            print(f'REGRESSION {route}: p99 {old} -> {now} ms, or more '
+                  'errors')
+        if worse:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
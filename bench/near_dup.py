@@ -0,0 +1,108 @@
+"""
+Measure MinHash/LSH near-duplicate detection on a synthetic corpus.
+Builds the same band index similarity.py keeps in Mongo, but in memory,
+then plants edited copies of random manuscripts and looks them up:
+
+    python -m bench.near_dup --count 100000
+"""
+import argparse
+import random
+import statistics
+import time
+
+import numpy as np
+
+import data.manuscripts.similarity as simlr
+from bench.search_latency import make_vocab, percentile
+
+WORDS_PER_TEXT = 300
+QUERIES = 500
+EDITS = 3  # words changed in each planted duplicate, Jaccard ~0.9
+
+
+def make_text(rng, vocab) -> str:
+    return ' '.join(rng.choices(vocab, k=WORDS_PER_TEXT))
+
+
+def edit(rng, text: str, edits: int = EDITS) -> str:
+    words = text.split()
+    for _ in range(edits):
+        words[rng.randrange(len(words))] = 'edited'
+    return ' '.join(words)
+
+
+def build(texts: list) -> tuple:
+    """
+    Return ({band key: [doc numbers]}, signature matrix).
+    """
+    bands = {}
+    sigs = np.empty((len(texts), simlr.NUM_PERM), dtype=np.uint64)
+    for num, text in enumerate(texts):
+        sigs[num] = simlr.get_signature(text)
+        for key in simlr.get_band_keys(sigs[num]):
+            bands.setdefault(key, []).append(num)
+    return bands, sigs
+
+
+def lookup(bands: dict, sigs: np.ndarray, sig: np.ndarray) -> tuple:
+    """
+    Return (matches, number of candidates compared).
+    """
+    candidates = set()
+    for key in simlr.get_band_keys(sig):
+        candidates.update(bands.get(key, ()))
+    matches = [num for num in candidates
+               if simlr.estimate_similarity(sig, sigs[num])
+               >= simlr.DUP_THRESHOLD]
+    return matches, len(candidates)
+
+
+def run(count: int, queries: int = QUERIES) -> dict:
+    vocab = make_vocab()
+    rng = random.Random(1)
+    texts = [make_text(rng, vocab) for _ in range(count)]
+    start = time.perf_counter()
+    bands, sigs = build(texts)
+    build_secs = time.perf_counter() - start
+
+    timings = []
+    compared = []
+    found = 0
+    for _ in range(queries):
+        target = rng.randrange(count)
+        start = time.perf_counter()
+        matches, candidates = lookup(bands, sigs,
+                                     simlr.get_signature(
+                                         edit(rng, texts[target])))
+        timings.append((time.perf_counter() - start) * 1000)
+        compared.append(candidates)
+        found += target in matches
+
+    # What checking every stored signature would cost instead.
+    sig = simlr.get_signature(texts[0])
+    start = time.perf_counter()
+    np.mean(sigs == sig, axis=1)
+    brute_ms = (time.perf_counter() - start) * 1000
+    return {
+        'manuscripts': count,
+        'build_secs': round(build_secs, 1),
+        'signatures_per_sec': round(count / build_secs),
+        'queries': queries,
+        'recall': round(found / queries, 3),
+        'mean_candidates': round(statistics.mean(compared), 1),
+        'p50_ms': round(percentile(timings, 50), 2),
+        'p99_ms': round(percentile(timings, 99), 2),
+        'brute_force_ms': round(brute_ms, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=100_000)
+    parser.add_argument('--queries', type=int, default=QUERIES)
+    args = parser.parse_args()
+    print(run(args.count, args.queries))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Time referee recommendation against a large synthetic referee pool.
+Fills the in-memory model directly, so no DB is needed:
+
+    python -m bench.referee_recommend --referees 5000
+"""
+import argparse
+import random
+import statistics
+import time
+
+import numpy as np
+
+import data.manuscripts.recommend as rec
+from bench.search_latency import make_vocab, percentile
+
+REVIEWS_PER_REFEREE = 10
+WORDS_PER_TEXT = 400
+QUERIES = 200
+
+
+def make_text(rng, vocab) -> str:
+    return ' '.join(rng.choices(vocab, k=WORDS_PER_TEXT))
+
+
+def load(num_referees: int, vocab) -> None:
+    rng = random.Random(1)
+    rec.referees = {f'ref{i}@nyu.edu' for i in range(num_referees)}
+    rec.emails.clear()
+    rec.rows.clear()
+    rec.profiles = np.zeros((0, rec.N_FEATURES), dtype=np.float32)
+    rec.norms = np.zeros(0, dtype=np.float32)
+    rec.doc_freq = np.zeros(rec.N_FEATURES, dtype=np.float32)
+    rec.num_docs = 0
+    rec.built_at = time.time()
+    for email in sorted(rec.referees):
+        for _ in range(REVIEWS_PER_REFEREE):
+            text = make_text(rng, vocab)
+            rec.add_manuscript(text)
+            rec.add_review(email, text)
+
+
+def run(num_referees: int, queries: int = QUERIES) -> dict:
+    vocab = make_vocab()
+    start = time.perf_counter()
+    load(num_referees, vocab)
+    load_secs = time.perf_counter() - start
+    rng = random.Random(2)
+    timings = []
+    for _ in range(queries):
+        text = make_text(rng, vocab)
+        start = time.perf_counter()
+        rec.recommend(text, k=rec.DEFAULT_K)
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        'referees': num_referees,
+        'load_secs': round(load_secs, 1),
+        'queries': queries,
+        'mean_ms': round(statistics.mean(timings), 2),
+        'p50_ms': round(percentile(timings, 50), 2),
+        'p99_ms': round(percentile(timings, 99), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--referees', type=int, default=5_000)
+    parser.add_argument('--queries', type=int, default=QUERIES)
+    args = parser.parse_args()
+    print(run(args.referees, args.queries))
+
+
+if __name__ == '__main__':
+    main()
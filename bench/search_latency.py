@@ -0,0 +1,95 @@
+"""
+Measure manuscript search latency on a synthetic corpus.
+Loads the corpus into a scratch database so seDB is never touched:
+
+    python -m bench.search_latency --count 100000
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime
+
+import data.db_connect as dbc
+import data.manuscripts.manuscripts as ms
+import data.manuscripts.search as srch
+
+BENCH_DB = 'seBenchDB'
+BATCH_SIZE = 5_000
+VOCAB_SIZE = 20_000
+WORDS_PER_TEXT = 400
+QUERIES = 200
+
+dbc.connect_db()
+
+
+def make_vocab(size: int = VOCAB_SIZE) -> list:
+    rng = random.Random(0)
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    return [''.join(rng.choices(letters, k=rng.randint(4, 10)))
+            for _ in range(size)]
+
+
+def make_manuscript(rng, vocab) -> dict:
+    # Zipf-ish word choice so common words really are common.
+    words = [vocab[min(int(rng.paretovariate(1.2)), len(vocab)) - 1]
+             for _ in range(WORDS_PER_TEXT)]
+    return {
+        ms.AUTHOR_NAME: ' '.join(rng.choices(vocab, k=2)).title(),
+        ms.MANUSCRIPT_CREATED: datetime.now(),
+        ms.LATEST_VERSION: {
+            ms.STATE: 'SUB',
+            ms.TITLE: ' '.join(rng.choices(vocab, k=6)),
+            ms.TEXT: ' '.join(words),
+        },
+    }
+
+
+def load(count: int, vocab) -> None:
+    rng = random.Random(1)
+    dbc.delete_many(ms.MANUSCRIPTS_COLLECT, {}, db=BENCH_DB)
+    for start in range(0, count, BATCH_SIZE):
+        batch = [make_manuscript(rng, vocab)
+                 for _ in range(min(BATCH_SIZE, count - start))]
+        dbc.create_many(ms.MANUSCRIPTS_COLLECT, batch, db=BENCH_DB)
+    srch.ensure_index(db=BENCH_DB)
+
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run(count: int, queries: int = QUERIES) -> dict:
+    vocab = make_vocab()
+    start = time.perf_counter()
+    load(count, vocab)
+    load_secs = time.perf_counter() - start
+    rng = random.Random(2)
+    timings = []
+    for _ in range(queries):
+        query = ' '.join(rng.choices(vocab[:2_000], k=rng.randint(1, 3)))
+        start = time.perf_counter()
+        srch.search(query, db=BENCH_DB)
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        'manuscripts': count,
+        'load_secs': round(load_secs, 1),
+        'queries': queries,
+        'mean_ms': round(statistics.mean(timings), 2),
+        'p50_ms': round(percentile(timings, 50), 2),
+        'p95_ms': round(percentile(timings, 95), 2),
+        'p99_ms': round(percentile(timings, 99), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=100_000)
+    parser.add_argument('--queries', type=int, default=QUERIES)
+    args = parser.parse_args()
+    print(run(args.count, args.queries))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,323 @@
+"""
+Micro-benchmarks for the hot paths under every request: the FSM, the
+security check, person validation, roles and the db_connect helpers.
+Each benchmark is timed with timeit, best of REPEAT runs, and reported
+in nanoseconds per call. The DB ones run once per backend that is up:
+a local mongod, and mongomock in-process if it is installed.
+
+Results can be saved as the baseline (bench/baseline.json); later runs
+are compared with it, and anything slower than the tolerance allows is
+flagged and makes the run exit non-zero:
+
+    python -m bench.suite --save        # record a baseline
+    python -m bench.suite               # compare with it
+    python -m bench.suite --only fsm --only security
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+from datetime import datetime
+
+import pymongo as pm
+
+import bench.fsm_throughput as fsm
+import data.db_connect as dbc
+import data.manuscripts.query as qry
+import data.people as ppl
+import data.roles as rls
+import security.security as sec
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+BENCH_DB = 'seBenchDB'
+BENCH_COLLECT = 'micro'
+SEED_DOCS = 1000
+MANY = 100  # docs per read_many / create_many call
+
+REPEAT = 5
+TOLERANCE = .25  # flag anything this much slower than the baseline
+DB_TOLERANCE = .5  # round trips are noisier
+PING_MS = 2000
+
+META = 'meta'
+RESULTS = 'results'
+NS_PER_OP = 'ns_per_op'
+NUMBER = 'number'
+
+# name: {fn, db, tolerance}
+BENCHMARKS = {}
+
+
+def benchmark(name: str, db: bool = False, tolerance: float = None):
+    """
+    Register `fn()` as benchmark `name`. DB benchmarks are run once for
+    each backend, against BENCH_DB.
+    """
+    def register(fn):
+        if name in BENCHMARKS:
+            raise ValueError(f'Benchmark {name} is already defined')
+        BENCHMARKS[name] = {
+            'fn': fn,
+            'db': db,
+            'tolerance': tolerance if tolerance is not None
+            else DB_TOLERANCE if db else TOLERANCE,
+        }
+        return fn
+    return register
+
+
+@benchmark('fsm.handle_action')
+def bench_handle_action():
+    qry.handle_action(qry.IN_REF_REV, qry.ACCWITHREV, manu=qry.SAMPLE_MANU)
+
+
+@benchmark('fsm.walk')
+def bench_fsm_walk():
+    fsm.walk(qry.handle_action)
+
+
+@benchmark('fsm.get_valid_actions_by_state')
+def bench_valid_actions():
+    qry.get_valid_actions_by_state(qry.IN_REF_REV)
+
+
+@benchmark('security.is_permitted')
+def bench_is_permitted():
+    sec.is_permitted(sec.TEXTS, sec.DELETE, sec.GOOD_USER_ID,
+                     login_key='key', ip_address='127.0.0.1')
+
+
+@benchmark('security.is_permitted.unprotected')
+def bench_is_permitted_open():
+    sec.is_permitted(sec.PEOPLE, sec.READ, sec.GOOD_USER_ID)
+
+
+@benchmark('people.is_valid_email')
+def bench_is_valid_email():
+    ppl.is_valid_email('ejc369@nyu.edu')
+
+
+@benchmark('people.is_valid_person')
+def bench_is_valid_person():
+    ppl.is_valid_person('Eugene Callahan', 'NYU', 'ejc369@nyu.edu',
+                        roles=[rls.ED_CODE, rls.AUTHOR_CODE])
+
+
+@benchmark('roles.get_masthead_roles')
+def bench_masthead_roles():
+    rls.get_masthead_roles()
+
+
+def seed_db():
+    dbc.delete_many(BENCH_COLLECT, {}, db=BENCH_DB)
+    dbc.create_many(BENCH_COLLECT,
+                    [{'num': num, 'group': num % (SEED_DOCS // MANY),
+                      'name': f'doc {num}'}
+                     for num in range(SEED_DOCS)], db=BENCH_DB)
+    dbc.create_index(BENCH_COLLECT, [('num', 1)], db=BENCH_DB)
+    dbc.create_index(BENCH_COLLECT, [('group', 1)], db=BENCH_DB)
+
+
+@benchmark('db.read_one', db=True)
+def bench_read_one():
+    dbc.read_one(BENCH_COLLECT, {'num': SEED_DOCS // 2}, db=BENCH_DB)
+
+
+@benchmark('db.read_many', db=True)
+def bench_read_many():
+    dbc.read_many(BENCH_COLLECT, {'group': 1}, db=BENCH_DB)
+
+
+@benchmark('db.count', db=True)
+def bench_count():
+    dbc.count(BENCH_COLLECT, {'group': 1}, db=BENCH_DB)
+
+
+@benchmark('db.update', db=True)
+def bench_update():
+    dbc.update(BENCH_COLLECT, {'num': SEED_DOCS // 2}, {'name': 'updated'},
+               db=BENCH_DB)
+
+
+@benchmark('db.create_delete', db=True)
+def bench_create_delete():
+    dbc.create(BENCH_COLLECT, {'num': -1}, db=BENCH_DB)
+    dbc.delete(BENCH_COLLECT, {'num': -1}, db=BENCH_DB)
+
+
+@benchmark('db.create_many', db=True)
+def bench_create_many():
+    dbc.create_many(BENCH_COLLECT, [{'num': -2} for _ in range(MANY)],
+                    db=BENCH_DB)
+    dbc.delete_many(BENCH_COLLECT, {'num': -2}, db=BENCH_DB)
+
+
+def connect_mongod():
+    client = pm.MongoClient(serverSelectionTimeoutMS=PING_MS)
+    client.admin.command('ping')
+    return client
+
+
+def connect_mongomock():
+    if mongomock is None:
+        raise ImportError('mongomock is not installed')
+    return mongomock.MongoClient()
+
+
+BACKENDS = {
+    'mongod': connect_mongod,
+    'mongomock': connect_mongomock,
+}
+
+
+def time_it(fn, repeat: int = REPEAT) -> dict:
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat, number))
+    return {NS_PER_OP: round(best / number * 1e9, 1), NUMBER: number}
+
+
+def selected(name: str, only: list) -> bool:
+    return not only or any(name.startswith(prefix) for prefix in only)
+
+
+def run(only: list = None, backends: list = None,
+        repeat: int = REPEAT) -> dict:
+    """
+    {result name: {ns_per_op, number}}. DB results are named
+    'db.read_one[mongod]' and so on. Backends that can't be reached
+    are skipped, with a note on stderr.
+    """
+    results = {}
+    for name, bench in BENCHMARKS.items():
+        if not bench['db'] and selected(name, only):
+            results[name] = time_it(bench['fn'], repeat)
+    db_benches = {name: bench for name, bench in BENCHMARKS.items()
+                  if bench['db'] and selected(name, only)}
+    if not db_benches:
+        return results
+    saved = dbc.client
+    try:
+        for backend in backends or BACKENDS:
+            try:
+                dbc.client = BACKENDS[backend]()
+            except Exception as err:
+                print(f'Skipping {backend}: {str(err).split(",")[0]}',
+                      file=sys.stderr)
+                continue
+            seed_db()
+            for name, bench in db_benches.items():
+                results[f'{name}[{backend}]'] = time_it(bench['fn'], repeat)
+            dbc.client.drop_database(BENCH_DB)
+    finally:
+        dbc.client = saved
+    return results
+
+
+def get_tolerance(result_name: str) -> float:
+    return BENCHMARKS[result_name.split('[')[0]]['tolerance']
+
+
+def compare(results: dict, baseline: dict) -> list:
+    """
+    [(name, baseline ns, current ns, ratio)] for every result slower
+    than its baseline by more than its tolerance.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline.get(RESULTS, {}):
+            continue
+        base = baseline[RESULTS][name][NS_PER_OP]
+        ratio = result[NS_PER_OP] / base
+        if ratio > 1 + get_tolerance(name):
+            regressions.append((name, base, result[NS_PER_OP], ratio))
+    return regressions
+
+
+def get_meta() -> dict:
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'node': platform.node(),
+        'processor': platform.processor(),
+    }
+
+
+def read_baseline(path: str = BASELINE) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as baseline:
+        return json.load(baseline)
+
+
+def save_baseline(results: dict, path: str = BASELINE) -> dict:
+    """
+    Write results as the new baseline. Entries that weren't run this
+    time keep their old numbers.
+    """
+    baseline = read_baseline(path)
+    baseline[META] = get_meta()
+    baseline[RESULTS] = {**baseline.get(RESULTS, {}), **results}
+    with open(path, 'w') as out:
+        json.dump(baseline, out, indent=2, sort_keys=True)
+        out.write('\n')
+    return baseline
+
+
+def report(results: dict, baseline: dict) -> str:
+    lines = []
+    for name, result in results.items():
+        line = f'{name:45} {result[NS_PER_OP]:>14,.1f} ns'
+        if name in baseline.get(RESULTS, {}):
+            ratio = result[NS_PER_OP] / baseline[RESULTS][name][NS_PER_OP]
+            line += f'  x{ratio:.2f}'
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run the micro-benchmarks and compare with a baseline.')
+    parser.add_argument('--only', action='append',
+                        help='Only benchmarks starting with this; repeat '
+                             'for more')
+    parser.add_argument('--backend', action='append', choices=BACKENDS,
+                        help='DB backend to use; repeat for more. '
+                             'Default: every one that is up')
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save', action='store_true',
+                        help='Record these results as the baseline')
+    parser.add_argument('--out', help='Also write the results here as JSON')
+    args = parser.parse_args()
+    results = run(args.only, args.backend, args.repeat)
+    baseline = read_baseline(args.baseline)
+    if baseline and baseline.get(META, {}).get('node') != platform.node():
+        print('The baseline was recorded on another machine; '
+              'expect noise.', file=sys.stderr)
+    print(report(results, baseline))
+    if args.out:
+        with open(args.out, 'w') as out:
+            json.dump({META: get_meta(), RESULTS: results}, out, indent=2)
+    if args.save:
+        save_baseline(results, args.baseline)
+        print(f'Saved the baseline to {args.baseline}')
+        return
+    regressions = compare(results, baseline)
+    for name, base, now, ratio in regressions:
+        print(f'REGRESSION {name}: {base:,.1f} -> {now:,.1f} ns '
+              f'(x{ratio:.2f})')
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
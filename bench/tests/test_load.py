@@ -0,0 +1,67 @@
+import pytest
+
+import bench.load as load
+
+
+def make_stats(p99: float, error_rate: float = 0.0, count: int = 100) -> dict:
+    return {load.COUNT: count, load.P99: p99, load.ERROR_RATE: error_rate}
+
+
+def make_report(**routes) -> dict:
+    return {load.ROUTE_STATS: {load.PEOPLE: routes.get('people', {}),
+                               load.TEXT: routes.get('text', {})},
+            load.TOTAL: routes.get('total', {})}
+
+
+def test_summarize():
+    samples = [(load.TEXT, 200, .001 * ms) for ms in range(1, 101)]
+    samples += [(load.TEXT, 409, .05), (load.TEXT, 500, .05),
+                (load.TEXT, None, .05)]
+    stats = load.summarize(samples, secs=2.0)
+    assert stats[load.COUNT] == 103
+    assert stats[load.RPS] == 51.5
+    assert stats[load.MAX] == 100.0
+    assert stats[load.P50] <= stats[load.P95] <= stats[load.P99]
+    assert stats[load.CLIENT_ERRORS] == 1
+    assert stats[load.ERRORS] == 2
+    assert stats[load.ERROR_RATE] == round(2 / 103, 4)
+
+
+def test_summarize_empty():
+    assert load.summarize([], secs=1.0) == {load.COUNT: 0}
+
+
+def test_compare():
+    before = make_report(people=make_stats(10), text=make_stats(10),
+                         total=make_stats(10))
+    now = make_report(people=make_stats(12), text=make_stats(20),
+                      total=make_stats(10, error_rate=.01))
+    assert load.compare(now, before) == [(load.TEXT, 10, 20),
+                                         (load.TOTAL, 10, 10)]
+
+
+def test_compare_skips_routes_not_run():
+    before = make_report(people=make_stats(10))
+    now = make_report(people={load.COUNT: 0}, text=make_stats(99))
+    assert load.compare(now, before) == []
+
+
+def test_in_process_refuses_cloud(monkeypatch):
+    monkeypatch.setenv('CLOUD_MONGO', load.dbc.CLOUD)
+    with pytest.raises(ValueError):
+        load.run(duration=0, preload=0)
+
+
+def test_clean_up():
+    sent = []
+
+    def send(method, path, body=None):
+        sent.append((method, path))
+        return 200, None
+    work = load.Workload(send)
+    for manu_id in ('a', 'b'):
+        work.note('PUT', '/manuscripts/create', {}, 200, {'id': manu_id})
+    assert work.clean_up() == 2
+    assert sent[-2:] == [('DELETE', '/manuscripts/a'),
+                         ('DELETE', '/manuscripts/b')]
+    assert work.created == []
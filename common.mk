@@ -7,7 +7,7 @@ export CLOUD_MONGO = 0
 PYTHONFILES = $(shell ls *.py)
 PYTESTFLAGS = -vv --verbose --cov-branch --cov-report term-missing --tb=short -W ignore::FutureWarning
 
-MAIL_METHOD = api
+export MAIL_METHOD = file
 
 FORCE:
 
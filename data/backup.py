@@ -0,0 +1,251 @@
+"""
+Backup and restore of the whole database, through db_connect.
+A dump is a directory with one gzipped NDJSON file per slice of each
+collection, in MongoDB extended JSON so types such as ObjectId and
+dates survive, plus manifest.json with each file's doc count and
+SHA-256, and each collection's indexes.
+Collections with ObjectId keys are cut into _id ranges at sampled
+split points, so a big collection is read by several cursors at once.
+Each slice is read by its own cursor with no shared snapshot, so a dump
+taken while the app is writing is not a point-in-time copy: a write
+that lands mid-dump may or may not be in it, and related docs (a
+manuscript and its history) can come from different moments. Stop the
+writers first if that matters.
+Restore checks the files against the manifest and then loads them
+with unordered bulk inserts, skipping docs whose _id is already there.
+Indexes are built after the data is in, which is much faster than
+keeping them up to date on every insert.
+  python -m data.backup dump data/bkup/2024-10-01
+  python -m data.backup restore data/bkup/2024-10-01
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pymongo as pm
+from bson import json_util
+from bson.objectid import ObjectId
+
+import data.db_connect as dbc
+
+MANIFEST = 'manifest.json'
+DB = 'db'
+CREATED = 'created'
+COLLECTIONS = 'collections'
+FILES = 'files'
+FILE = 'file'
+COUNT = 'count'
+SHA256 = 'sha256'
+INDEXES = 'indexes'
+KEY = 'key'
+
+DEFAULT_WORKERS = min(16, 2 * (os.cpu_count() or 2))
+PARTS_PER_COLLECTION = 8
+SAMPLES_PER_PART = 16
+MIN_PARTITION_DOCS = 50_000  # smaller collections get one cursor
+BATCH_SIZE = 1000
+
+JSON_OPTIONS = json_util.CANONICAL_JSON_OPTIONS
+
+dbc.connect_db()
+
+
+def get_slices(collection: str, db=dbc.SE_DB,
+               parts: int = PARTS_PER_COLLECTION) -> list:
+    """
+    Filters that between them cover the whole collection.
+    If the sampled _ids are all ObjectIds, they are ranges at the
+    sample's quantiles, plus one for any _ids of another type, since
+    range queries only match values of the same type.
+    """
+    if dbc.count(collection, {}, db=db) < MIN_PARTITION_DOCS:
+        return [{}]
+    sample = [doc[dbc.MONGO_ID] for doc in dbc.aggregate(collection, [
+        {'$sample': {'size': parts * SAMPLES_PER_PART}},
+        {'$project': {dbc.MONGO_ID: 1}},
+    ], db=db)]
+    if not all(ObjectId.is_valid(obj_id) for obj_id in sample):
+        return [{}]
+    ids = sorted({ObjectId(obj_id) for obj_id in sample})
+    step = max(1, len(ids) // parts)
+    cuts = ids[step::step][:parts - 1]
+    slices = []
+    for low, high in zip([None, *cuts], [*cuts, None]):
+        bounds = {'$type': 'objectId'}
+        if low:
+            bounds['$gte'] = low
+        if high:
+            bounds['$lt'] = high
+        slices.append({dbc.MONGO_ID: bounds})
+    slices.append({dbc.MONGO_ID: {'$not': {'$type': 'objectId'}}})
+    return slices
+
+
+def dump_slice(collection: str, filt: dict, path: str,
+               db=dbc.SE_DB) -> dict:
+    """
+    Stream one slice to a gzipped NDJSON file.
+    The checksum is of the uncompressed lines.
+    """
+    digest = hashlib.sha256()
+    count = 0
+    with gzip.open(path, 'wb', compresslevel=6) as out:
+        for doc in dbc.read_iter(collection, filt, db=db, raw=True):
+            line = (json_util.dumps(doc, json_options=JSON_OPTIONS)
+                    + '\n').encode()
+            digest.update(line)
+            out.write(line)
+            count += 1
+    return {FILE: os.path.basename(path), COUNT: count,
+            SHA256: digest.hexdigest()}
+
+
+def dump(out_dir: str, collections: list = None, db=dbc.SE_DB,
+         workers: int = DEFAULT_WORKERS) -> dict:
+    """
+    Dump the collections (default: all of them) into out_dir and
+    return the manifest.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    collections = collections or dbc.list_collections(db)
+    manifest = {DB: db, CREATED: datetime.now().isoformat(),
+                COLLECTIONS: {}}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for collection in collections:
+            manifest[COLLECTIONS][collection] = {
+                INDEXES: dbc.list_indexes(collection, db=db)}
+            for i, filt in enumerate(get_slices(collection, db=db)):
+                path = os.path.join(out_dir,
+                                    f'{collection}.{i:03d}.ndjson.gz')
+                futures[pool.submit(dump_slice, collection, filt, path,
+                                    db)] = collection
+        for future, collection in futures.items():
+            entry = manifest[COLLECTIONS][collection]
+            entry.setdefault(FILES, []).append(future.result())
+    for entry in manifest[COLLECTIONS].values():
+        entry[COUNT] = sum(part[COUNT] for part in entry.get(FILES, []))
+    with open(os.path.join(out_dir, MANIFEST), 'w') as out:
+        json.dump(manifest, out, indent=2, default=json_util.default)
+    return manifest
+
+
+def read_manifest(in_dir: str) -> dict:
+    with open(os.path.join(in_dir, MANIFEST)) as manifest:
+        return json_util.loads(manifest.read())
+
+
+def iter_lines(path: str):
+    with gzip.open(path, 'rb') as lines:
+        yield from lines
+
+
+def verify_file(in_dir: str, part: dict):
+    digest = hashlib.sha256()
+    count = 0
+    for line in iter_lines(os.path.join(in_dir, part[FILE])):
+        digest.update(line)
+        count += 1
+    if count != part[COUNT] or digest.hexdigest() != part[SHA256]:
+        raise ValueError(f'{part[FILE]} does not match the manifest')
+
+
+def insert_batch(collection: str, batch: list, db=dbc.SE_DB) -> int:
+    """
+    Insert what we can of a batch. Docs that are already there (say,
+    restoring with --keep) are skipped; any other error is raised.
+    Returns the number inserted.
+    """
+    try:
+        return len(dbc.create_many(collection, batch, db=db).inserted_ids)
+    except pm.errors.BulkWriteError as err:
+        if not dbc.only_duplicates(err):
+            raise
+        return err.details['nInserted']
+
+
+def load_file(collection: str, path: str, db=dbc.SE_DB,
+              batch_size: int = BATCH_SIZE) -> int:
+    loaded = 0
+    batch = []
+    for line in iter_lines(path):
+        batch.append(json_util.loads(line, json_options=JSON_OPTIONS))
+        if len(batch) >= batch_size:
+            loaded += insert_batch(collection, batch, db)
+            batch = []
+    if batch:
+        loaded += insert_batch(collection, batch, db)
+    return loaded
+
+
+def build_indexes(collection: str, specs: list, db=dbc.SE_DB):
+    for spec in specs:
+        if spec['name'] == '_id_':
+            continue
+        options = {k: v for k, v in spec.items() if k != KEY}
+        dbc.create_index(collection, [tuple(key) for key in spec[KEY]],
+                         db=db, **options)
+
+
+def restore(in_dir: str, collections: list = None, db: str = None,
+            workers: int = DEFAULT_WORKERS, drop: bool = True) -> dict:
+    """
+    Load a dump into `db` (default: the one it came from), replacing
+    the collections in it unless drop is False.
+    Returns {collection: docs loaded}.
+    """
+    manifest = read_manifest(in_dir)
+    db = db or manifest[DB]
+    entries = {name: entry for name, entry in manifest[COLLECTIONS].items()
+               if not collections or name in collections}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(lambda part: verify_file(in_dir, part),
+                      [part for entry in entries.values()
+                       for part in entry.get(FILES, [])]))
+        if drop:
+            for name in entries:
+                dbc.drop_collection(name, db=db)
+        futures = [(name, pool.submit(load_file, name,
+                                      os.path.join(in_dir, part[FILE]), db))
+                   for name, entry in entries.items()
+                   for part in entry.get(FILES, [])]
+        loaded = {name: 0 for name in entries}
+        for name, future in futures:
+            loaded[name] += future.result()
+        list(pool.map(lambda name: build_indexes(
+            name, entries[name][INDEXES], db), entries))
+    return loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Back up or restore the DB.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    dump_cmd = sub.add_parser('dump')
+    dump_cmd.add_argument('dir')
+    restore_cmd = sub.add_parser('restore')
+    restore_cmd.add_argument('dir')
+    restore_cmd.add_argument('--db', help='Restore into this database')
+    restore_cmd.add_argument('--keep', action='store_true',
+                             help="Don't drop the collections first")
+    for cmd in (dump_cmd, restore_cmd):
+        cmd.add_argument('--collection', action='append',
+                         help='Only this collection; repeat for more')
+        cmd.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    args = parser.parse_args()
+    if args.command == 'dump':
+        manifest = dump(args.dir, args.collection, workers=args.workers)
+        for name, entry in manifest[COLLECTIONS].items():
+            print(f'{name}: {entry[COUNT]} docs')
+    else:
+        loaded = restore(args.dir, args.collection, db=args.db,
+                         workers=args.workers, drop=not args.keep)
+        for name, count in loaded.items():
+            print(f'{name}: {count} docs')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,8 @@
-#!/bin/sh
-# Script to backup production database to JSON files.
-
-. ./common.sh
-
-for collection in ${GameCollections[@]}; do
-    echo "Backing up $collection"
-    $EXP --collection=$collection --db=$DB --out=$BKUP_DIR/$collection.json $CONNECT_STR --username $USER --password $MONGO_PASSWD
-done
-
-git add $BKUP_DIR/*.json
-git add $BKUP_DIR/*.json
-git commit $BKUP_DIR/*.json -m "Mongo DB backup"
-git pull origin master
-git push origin master
+#!/bin/sh
+# Script to back up the database to compressed NDJSON.
+# Each run goes in its own timestamped directory under $BKUP_DIR,
+# which is not kept in git. See data/backup.py.
+
+. "$(dirname "$0")/common.sh"
+
+python3 -m data.backup dump "$BKUP_DIR/$(date +%Y%m%d-%H%M%S)" "$@"
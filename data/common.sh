@@ -1,23 +1,11 @@
-#!/bin/sh
-# Some common shell stuff.
-
-echo "Importing from common.sh"
-
-DB=gamesDB
-USER=gcallah
-CONNECT_STR="mongodb+srv://koukoumongo1.yud9b.mongodb.net/"
-if [ -z $DATA_DIR ]
-then
-    DATA_DIR=/Users/gcallah/Classes/demo-repo4/data
-fi
-BKUP_DIR=$DATA_DIR/bkup
-EXP=/usr/local/bin/mongoexport
-IMP=/usr/local/bin/mongoimport
-
-if [ -z $MONGO_PASSWD ]
-then
-    echo "You must set MONGO_PASSWD in your env before running this script."
-    exit 1
-fi
-
-declare -a GameCollections=("games" "users")
+#!/bin/sh
+# Some common shell stuff for the backup scripts.
+# The database and credentials come from data/db_connect.py: set
+# CLOUD_MONGO=1 and MONGO_PASSWD to back up the cloud database.
+
+ROOT_DIR=$(cd "$(dirname "$0")/.." && pwd)
+export PYTHONPATH=$ROOT_DIR
+if [ -z "$BKUP_DIR" ]
+then
+    BKUP_DIR=$ROOT_DIR/data/bkup
+fi
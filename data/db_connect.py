@@ -2,7 +2,9 @@
 All interaction with MongoDB should be through this file!
 We may be required to use a new database at any point.
 """
+import contextvars
 import os
+from functools import wraps
 
 import pymongo as pm
 import json
@@ -15,6 +17,34 @@ SE_DB = 'seDB'
 client = None
 
 MONGO_ID = '_id'
+DUPLICATE_KEY = 11000  # server error code
+
+# {helper name: calls} while someone (e.g. a request) is counting
+call_counts = contextvars.ContextVar('call_counts', default=None)
+
+
+def start_counting() -> dict:
+    """
+    Count the helper calls made from here on in this context, into the
+    dict returned. It is filled in as the calls happen.
+    """
+    counts = {}
+    call_counts.set(counts)
+    return counts
+
+
+def stop_counting():
+    call_counts.set(None)
+
+
+def counted(fn):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        counts = call_counts.get()
+        if counts is not None:
+            counts[fn.__name__] = counts.get(fn.__name__, 0) + 1
+        return fn(*args, **kwargs)
+    return wrapper
 
 
 def connect_db():
@@ -48,12 +78,23 @@ def connect_db():
     return client
 
 
+def only_duplicates(err: pm.errors.BulkWriteError) -> bool:
+    """
+    True if every error in a failed bulk write was a duplicate key.
+    """
+    details = err.details
+    return (not details.get('writeConcernErrors')
+            and all(error['code'] == DUPLICATE_KEY
+                    for error in details.get('writeErrors', [])))
+
+
 def convert_mongo_id(doc: dict):
     if MONGO_ID in doc:
         # Convert mongo ID to a string so it works as JSON
         doc[MONGO_ID] = str(doc[MONGO_ID])
 
 
+@counted
 def create(collection, doc, db=SE_DB):
     """
     Insert a single doc into collection.
@@ -64,6 +105,7 @@ def create(collection, doc, db=SE_DB):
     return client[db][collection].insert_one(doc)
 
 
+@counted
 def read_one(collection, filt, db=SE_DB):
     """
     Find with a filter and return on the first doc found.
@@ -74,6 +116,7 @@ def read_one(collection, filt, db=SE_DB):
         return doc
 
 
+@counted
 def delete(collection: str, filt: dict, db=SE_DB):
     """
     Find with a filter and return on the first doc found.
@@ -83,12 +126,14 @@ def delete(collection: str, filt: dict, db=SE_DB):
     return del_result.deleted_count
 
 
+@counted
 def update(collection, filters, update_dict, db=SE_DB, action='$set'):
     # previously was
     # client[db][collection].update_one(filters, {'$set': update_dict})
     return client[db][collection].update_one(filters, {action: update_dict})
 
 
+@counted
 def read(collection, db=SE_DB, no_id=True) -> list:
     """
     Returns a list from the db.
@@ -117,9 +162,161 @@ def read_dict(collection, key, db=SE_DB, no_id=True) -> dict:
     return recs_as_dict
 
 
+@counted
 def fetch_all_as_dict(key, collection, db=SE_DB):
     ret = {}
     for doc in client[db][collection].find():
         del doc[MONGO_ID]
         ret[doc[key]] = doc
     return ret
+
+
+@counted
+def read_many(collection, filt, db=SE_DB, projection=None, sort=None,
+              skip=0, limit=0) -> list:
+    """
+    Find with a filter and return a list of the docs found.
+    `sort` is a list of (field, direction) pairs.
+    """
+    cursor = client[db][collection].find(filt, projection)
+    if sort:
+        cursor = cursor.sort(sort)
+    if skip:
+        cursor = cursor.skip(skip)
+    if limit:
+        cursor = cursor.limit(limit)
+    ret = []
+    for doc in cursor:
+        convert_mongo_id(doc)
+        ret.append(doc)
+    return ret
+
+
+@counted
+def count(collection, filt, db=SE_DB) -> int:
+    return client[db][collection].count_documents(filt)
+
+
+@counted
+def create_index(collection, keys, db=SE_DB, **kwargs):
+    """
+    Create an index if it doesn't already exist.
+    `keys` is a list of (field, direction) pairs.
+    """
+    return client[db][collection].create_index(keys, **kwargs)
+
+
+@counted
+def create_many(collection, docs, db=SE_DB, ordered=False):
+    """
+    Insert a list of docs in one round trip.
+    """
+    return client[db][collection].insert_many(docs, ordered=ordered)
+
+
+@counted
+def delete_many(collection: str, filt: dict, db=SE_DB):
+    del_result = client[db][collection].delete_many(filt)
+    return del_result.deleted_count
+
+
+@counted
+def bulk_write(collection, ops, db=SE_DB, ordered=False):
+    """
+    Send a list of pymongo write ops (UpdateOne etc.) in one round trip.
+    """
+    if not ops:
+        return None
+    return client[db][collection].bulk_write(ops, ordered=ordered)
+
+
+@counted
+def aggregate(collection, pipeline, db=SE_DB) -> list:
+    ret = []
+    for doc in client[db][collection].aggregate(pipeline):
+        convert_mongo_id(doc)
+        ret.append(doc)
+    return ret
+
+
+@counted
+def update_many(collection, filters, update, db=SE_DB):
+    """
+    `update` is either an update document or an aggregation pipeline.
+    """
+    return client[db][collection].update_many(filters, update)
+
+
+@counted
+def explain(collection, filt, db=SE_DB, sort=None) -> dict:
+    """
+    Return the query planner's winning plan for a find.
+    Only the planner runs: no candidate plan is executed.
+    """
+    find = {'find': collection, 'filter': filt}
+    if sort:
+        find['sort'] = dict(sort)
+    ret = client[db].command('explain', find, verbosity='queryPlanner')
+    return ret['queryPlanner']['winningPlan']
+
+
+@counted
+def find_one_and_update(collection, filt, update, db=SE_DB, sort=None):
+    """
+    Atomically update the first matching doc and return it as it is
+    after the update, or None if nothing matched.
+    """
+    doc = client[db][collection].find_one_and_update(
+        filt, update, sort=sort, return_document=pm.ReturnDocument.AFTER)
+    if doc:
+        convert_mongo_id(doc)
+    return doc
+
+
+@counted
+def read_iter(collection, filt, db=SE_DB, projection=None, sort=None,
+              raw=False):
+    """
+    Like read_many(), but yields docs one at a time off the cursor, so
+    only a batch is ever held in memory. `raw` leaves _id as stored.
+    """
+    cursor = client[db][collection].find(filt, projection)
+    if sort:
+        cursor = cursor.sort(sort)
+    for doc in cursor:
+        if not raw:
+            convert_mongo_id(doc)
+        yield doc
+
+
+@counted
+def update_one(collection, filters, update, db=SE_DB, upsert=False):
+    """
+    Like update(), but `update` is a whole update document, so one
+    atomic write can combine operators such as $set and $push.
+    """
+    return client[db][collection].update_one(filters, update, upsert=upsert)
+
+
+@counted
+def list_collections(db=SE_DB) -> list:
+    return sorted(client[db].list_collection_names())
+
+
+@counted
+def list_indexes(collection, db=SE_DB) -> list:
+    """
+    The collection's index specs, as create_index() would want them:
+    [{'key': [(field, direction), ...], <options>}].
+    """
+    specs = []
+    for index in client[db][collection].list_indexes():
+        spec = {k: v for k, v in index.items() if k not in ('v', 'ns')}
+        spec['key'] = list(spec['key'].items())
+        specs.append(spec)
+    return specs
+
+
+@counted
+def drop_collection(collection, db=SE_DB):
+    return client[db].drop_collection(collection)
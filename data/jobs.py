@@ -0,0 +1,325 @@
+"""
+Background jobs, so CPU-heavy work stays out of request handlers.
+A job is a document in the jobs collection. Endpoints enqueue() one and
+return at once. Running `python -m data.jobs` claims queued jobs and
+runs them in a pool of worker processes, so the work never holds the
+web server's GIL. A failed job is retried with exponential backoff,
+up to its max_attempts. A failure's message is kept in `error`, for
+clients; its traceback in `traceback`, for us.
+
+A claim leases the job for LEASE_SECS, and the worker renews the lease
+while the job runs. A job whose lease runs out anyway (its worker died)
+is claimed again, or failed if it is out of attempts. Each claim bumps
+`attempts`, and a run's outcome is only recorded if `attempts` is still
+what it claimed, so a run that lost its lease can't overwrite a newer
+one.
+
+Handlers register themselves with @handler(kind) in the modules listed
+in TASK_MODULES.
+"""
+import argparse
+import importlib
+import multiprocessing
+import os
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from functools import wraps
+
+from bson.objectid import ObjectId
+from pymongo import UpdateOne
+
+import data.db_connect as dbc
+
+JOBS_COLLECT = 'jobs'
+
+KIND = 'kind'
+ARGS = 'args'
+STATUS = 'status'
+ATTEMPTS = 'attempts'
+MAX_ATTEMPTS = 'max_attempts'
+RUN_AFTER = 'run_after'
+LEASED_UNTIL = 'leased_until'
+CREATED = 'created'
+UPDATED = 'updated'
+RESULT = 'result'
+ERROR = 'error'
+TRACEBACK = 'traceback'
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+DEFAULT_MAX_ATTEMPTS = 3
+RETRY_DELAY_SECS = 30  # doubled after each failure
+LEASE_SECS = 10 * 60  # a job whose lease isn't renewed is presumed dead
+HEARTBEAT_SECS = LEASE_SECS / 4  # how often running jobs' leases renew
+POLL_SECS = 1.0
+DEFAULT_PROCS = os.cpu_count() or 2
+
+TASK_MODULES = ['data.manuscripts.tasks']
+
+HANDLERS = {}
+
+indexed = False
+
+dbc.connect_db()
+
+
+def needs_index(fn):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        global indexed
+        if not indexed:
+            dbc.create_index(JOBS_COLLECT, [(STATUS, 1), (RUN_AFTER, 1)])
+            indexed = True
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+def handler(kind: str):
+    """
+    Register a function as the handler for jobs of `kind`.
+    It is called with the job's args as keyword arguments, and whatever
+    it returns is stored as the job's result.
+    """
+    def register(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+def load_handlers():
+    for module in TASK_MODULES:
+        importlib.import_module(module)
+
+
+@needs_index
+def enqueue(kind: str, args: dict = None,
+            max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> str:
+    """
+    Queue a job and return its id.
+    """
+    now = datetime.now()
+    ret = dbc.create(JOBS_COLLECT, {
+        KIND: kind,
+        ARGS: args or {},
+        STATUS: QUEUED,
+        ATTEMPTS: 0,
+        MAX_ATTEMPTS: max_attempts,
+        RUN_AFTER: now,
+        CREATED: now,
+        UPDATED: now,
+    })
+    return str(ret.inserted_id)
+
+
+def read_one(job_id: str) -> dict:
+    """
+    A job's status, for polling. None if there is no such job.
+    """
+    if not ObjectId.is_valid(job_id):
+        return None
+    job = dbc.read_one(JOBS_COLLECT, {dbc.MONGO_ID: ObjectId(job_id)})
+    if not job:
+        return None
+    for fld in (RUN_AFTER, LEASED_UNTIL, CREATED, UPDATED):
+        if job.get(fld):
+            job[fld] = job[fld].isoformat()
+    return job
+
+
+@needs_index
+def claim(kinds: list = None) -> dict:
+    """
+    Atomically take the next runnable job, or None if there isn't one.
+    Jobs whose lease ran out (their worker died) are runnable again.
+    With `kinds`, only jobs of those kinds are taken.
+    """
+    now = datetime.now()
+    filt = {'$or': [{STATUS: QUEUED, RUN_AFTER: {'$lte': now}},
+                    {STATUS: RUNNING, LEASED_UNTIL: {'$lt': now},
+                     '$expr': {'$lt': [f'${ATTEMPTS}',
+                                       f'${MAX_ATTEMPTS}']}}]}
+    if kinds is not None:
+        filt[KIND] = {'$in': list(kinds)}
+    return dbc.find_one_and_update(
+        JOBS_COLLECT, filt,
+        {'$set': {STATUS: RUNNING,
+                  LEASED_UNTIL: now + timedelta(seconds=LEASE_SECS),
+                  UPDATED: now},
+         '$inc': {ATTEMPTS: 1}},
+        sort=[(RUN_AFTER, 1)])
+
+
+def fail_expired() -> int:
+    """
+    Fail the jobs whose lease ran out on their last attempt. Returns
+    how many there were.
+    """
+    now = datetime.now()
+    return dbc.update_many(
+        JOBS_COLLECT,
+        {STATUS: RUNNING, LEASED_UNTIL: {'$lt': now},
+         '$expr': {'$gte': [f'${ATTEMPTS}', f'${MAX_ATTEMPTS}']}},
+        {'$set': {STATUS: FAILED, LEASED_UNTIL: None, UPDATED: now,
+                  ERROR: 'The job ran out of time on its last attempt',
+                  TRACEBACK: None}}).modified_count
+
+
+def claimed(job: dict) -> dict:
+    """
+    Matches `job` only while it is still running under our claim.
+    """
+    return {dbc.MONGO_ID: ObjectId(job[dbc.MONGO_ID]), STATUS: RUNNING,
+            ATTEMPTS: job[ATTEMPTS]}
+
+
+def renew(running_jobs) -> int:
+    """
+    Extend the leases of jobs we are still running. Returns how many
+    were renewed; a job that was reclaimed elsewhere isn't.
+    """
+    now = datetime.now()
+    ops = [UpdateOne(claimed(job), {'$set': {
+        LEASED_UNTIL: now + timedelta(seconds=LEASE_SECS), UPDATED: now}})
+        for job in running_jobs]
+    result = dbc.bulk_write(JOBS_COLLECT, ops)
+    return result.modified_count if result else 0
+
+
+def describe(err: Exception) -> str:
+    return f'{type(err).__name__}: {err}'
+
+
+def finish(job: dict, result=None, error: Exception = None) -> bool:
+    """
+    Record how a run went, requeueing failures that have tries left.
+    Returns False if the job has been claimed again since, in which
+    case this run's outcome is dropped.
+    """
+    now = datetime.now()
+    update = {UPDATED: now, LEASED_UNTIL: None}
+    if error is None:
+        update.update({STATUS: DONE, RESULT: result, ERROR: None,
+                       TRACEBACK: None})
+    elif job[ATTEMPTS] < job[MAX_ATTEMPTS]:
+        delay = RETRY_DELAY_SECS * 2 ** (job[ATTEMPTS] - 1)
+        update.update({STATUS: QUEUED,
+                       RUN_AFTER: now + timedelta(seconds=delay)})
+    else:
+        update[STATUS] = FAILED
+    if error is not None:
+        update.update({ERROR: describe(error),
+                       TRACEBACK: ''.join(traceback.format_exception(
+                           error, limit=5))})
+    return dbc.update(JOBS_COLLECT, claimed(job), update).matched_count > 0
+
+
+def execute(kind: str, args: dict):
+    """
+    Run one job's handler. This is what the worker processes call.
+    """
+    if not HANDLERS:
+        load_handlers()
+    if kind not in HANDLERS:
+        raise ValueError(f'No handler for job kind {kind!r}')
+    return HANDLERS[kind](**args)
+
+
+def run_job(job: dict):
+    """
+    Run a claimed job in this process and record the outcome.
+    """
+    try:
+        finish(job, result=execute(job[KIND], job[ARGS]))
+    except Exception as err:
+        finish(job, error=err)
+
+
+def make_pool(procs: int) -> ProcessPoolExecutor:
+    # spawn, not fork: a forked child would share the parent's Mongo
+    # connection pool.
+    return ProcessPoolExecutor(max_workers=procs,
+                               mp_context=multiprocessing.get_context('spawn'))
+
+
+def record(done, running: dict) -> bool:
+    """
+    Finish the jobs of `done` futures. Returns True if one of them
+    found the pool broken.
+    """
+    broken = False
+    for future in done:
+        job = running.pop(future)
+        try:
+            finish(job, result=future.result())
+        except Exception as err:
+            broken = broken or isinstance(err, BrokenProcessPool)
+            finish(job, error=err)
+    return broken
+
+
+def work(procs: int = DEFAULT_PROCS, poll_secs: float = POLL_SECS,
+         once: bool = False):
+    """
+    Keep `procs` worker processes busy with queued jobs.
+    The parent claims jobs, renews their leases and records results; the
+    children only run handlers, and only jobs they have a handler for
+    are claimed. If a child dies (say, killed for running out of
+    memory) the pool is broken: its jobs fail, to be retried, and a new
+    pool takes over. With `once`, return when the queue is empty.
+    """
+    load_handlers()
+    kinds = list(HANDLERS)
+    pool = make_pool(procs)
+    running = {}
+    renewed_at = time.monotonic()
+    try:
+        while True:
+            fail_expired()
+            broken = False
+            while len(running) < procs and not broken:
+                job = claim(kinds)
+                if not job:
+                    break
+                try:
+                    running[pool.submit(execute, job[KIND], job[ARGS])] = job
+                except BrokenProcessPool as err:
+                    finish(job, error=err)
+                    broken = True
+            if not running and not broken:
+                if once:
+                    return
+                time.sleep(poll_secs)
+                continue
+            if not broken:
+                done, _ = wait(running, timeout=poll_secs,
+                               return_when=FIRST_COMPLETED)
+                broken = record(done, running)
+            if broken:
+                # a broken pool fails everything still in it
+                record(wait(running).done, running)
+                pool.shutdown(wait=False)
+                pool = make_pool(procs)
+            if time.monotonic() - renewed_at > HEARTBEAT_SECS:
+                renew(running.values())
+                renewed_at = time.monotonic()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run background jobs.')
+    parser.add_argument('--procs', type=int, default=DEFAULT_PROCS)
+    parser.add_argument('--once', action='store_true',
+                        help='exit when the queue is empty')
+    args = parser.parse_args()
+    work(args.procs, once=args.once)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+"""
+Hot/cold archival of finished manuscripts.
+Manuscripts that have sat in a terminal state (published, rejected or
+withdrawn) for longer than a threshold are moved, with their history,
+out of the hot collections and into archive collections, a batch at a
+time. That keeps the hot collections and their indexes sized to work
+in progress. ms.read_one_manuscript() falls back to the archive, and
+anything that changes an archived manuscript moves it back first.
+Run it from cron: `python -m data.manuscripts.archive --days 365`.
+"""
+import argparse
+from datetime import timedelta
+from functools import wraps
+
+from pymongo import DeleteOne, ReplaceOne, UpdateOne
+
+import data.db_connect as dbc
+import data.manuscripts.manuscripts as ms
+import data.manuscripts.query as qry
+
+ARCHIVE_COLLECT = 'manuscripts_archive'
+HISTORY_ARCHIVE_COLLECT = 'manuscript_history_archive'
+ARCHIVED_AT = 'archived_at'
+
+DEFAULT_AGE_DAYS = 365
+BATCH_SIZE = 500
+MOVE_TRIES = 3  # copy-and-delete rounds for docs that keep changing
+
+indexed = False
+
+
+def needs_index(fn):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        global indexed
+        if not indexed:
+            dbc.create_index(ms.MANUSCRIPTS_COLLECT,
+                             [(ms.STATE_FLD, 1), (ms.STATE_SINCE_FLD, 1)])
+            indexed = True
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+def get_terminal_states() -> list:
+    return [alias for state in qry.TERMINAL_STATES
+            for alias in qry.STATE_ALIASES[state]]
+
+
+def archive_filter(cutoff) -> dict:
+    """
+    Terminal manuscripts that got there before `cutoff` and have no
+    notifications still waiting to go out. Ones from before we kept
+    state_since go by their creation date.
+    """
+    return {
+        ms.STATE_FLD: {'$in': get_terminal_states()},
+        f'{ms.OUTBOX}.0': {'$exists': False},
+        '$or': [
+            {ms.STATE_SINCE_FLD: {'$lt': cutoff}},
+            {ms.STATE_SINCE_FLD: None, ms.MANUSCRIPT_CREATED: {'$lt': cutoff}},
+        ],
+    }
+
+
+def copy_ops(docs, extra: dict = None) -> list:
+    """
+    Upserts keyed by _id, so copying the same doc twice is harmless.
+    """
+    ops = []
+    for doc in docs:
+        obj_id = ms.create_mongo_id_object(doc[ms.MONGO_ID])
+        ops.append(ReplaceOne({ms.MONGO_ID: obj_id},
+                              {**doc, ms.MONGO_ID: obj_id, **(extra or {})},
+                              upsert=True))
+    return ops
+
+
+def insert_ops(docs) -> list:
+    """
+    Inserts that leave alone a doc that is already there.
+    """
+    ops = []
+    for doc in docs:
+        fields = {fld: value for fld, value in doc.items()
+                  if fld != ms.MONGO_ID}
+        ops.append(UpdateOne(
+            {ms.MONGO_ID: ms.create_mongo_id_object(doc[ms.MONGO_ID])},
+            {'$setOnInsert': fields}, upsert=True))
+    return ops
+
+
+def unchanged_manuscript(manu: dict) -> dict:
+    """
+    Matches the hot manuscript only if nothing has been written to it
+    since `manu` was read (every change stamps a new token) and it has
+    no notifications waiting.
+    """
+    return {ms.MONGO_ID: ms.create_mongo_id_object(manu[ms.MONGO_ID]),
+            f'{ms.LATEST_VERSION}.{ms.LAST_TRANSITION}':
+                manu[ms.LATEST_VERSION].get(ms.LAST_TRANSITION),
+            f'{ms.OUTBOX}.0': {'$exists': False}}
+
+
+def unchanged_history(history: dict) -> dict:
+    """
+    Matches the hot history only if no entry has been added since
+    `history` was read; entries are only ever appended.
+    """
+    return {ms.MONGO_ID: ms.create_mongo_id_object(history[ms.MONGO_ID]),
+            ms.HISTORY: {'$size': len(history.get(ms.HISTORY, []))}}
+
+
+def get_history_ids(manus) -> list:
+    return [ms.create_mongo_id_object(manu[ms.MANUSCRIPT_HISTORY_FK])
+            for manu in manus if manu.get(ms.MANUSCRIPT_HISTORY_FK)]
+
+
+def get_ids(docs) -> list:
+    return [ms.create_mongo_id_object(doc[ms.MONGO_ID]) for doc in docs]
+
+
+def move_docs(collection: str, archive_collection: str, docs: list,
+              unchanged, reread, extra: dict = None) -> list:
+    """
+    Copy docs to the archive, then delete each one from `collection`
+    only if it is unchanged since it was read. Ones that changed in
+    between are read again with `reread(ids)` (which leaves out any
+    that shouldn't move any more) and tried again, up to MOVE_TRIES
+    times. Returns the docs moved; archive copies of the rest are
+    dropped.
+    """
+    moved = []
+    copied = set()
+    for _ in range(MOVE_TRIES):
+        if not docs:
+            break
+        dbc.bulk_write(archive_collection, copy_ops(docs, extra))
+        copied.update(get_ids(docs))
+        dbc.bulk_write(collection, [DeleteOne(unchanged(doc))
+                                    for doc in docs])
+        left = {doc[ms.MONGO_ID] for doc in dbc.read_many(
+            collection, {ms.MONGO_ID: {'$in': get_ids(docs)}},
+            projection={ms.MONGO_ID: 1})}
+        moved += [doc for doc in docs if str(doc[ms.MONGO_ID]) not in left]
+        docs = reread([ms.create_mongo_id_object(doc_id)
+                       for doc_id in left]) if left else []
+    moved_ids = set(get_ids(moved))
+    dbc.delete_many(archive_collection,
+                    {ms.MONGO_ID: {'$in': list(copied - moved_ids)}})
+    return moved
+
+
+@needs_index
+def archive_batch(cutoff, batch_size: int = BATCH_SIZE) -> int:
+    """
+    Move one batch of manuscripts to the archive. Copies are written
+    before anything is deleted, so a crash part way through leaves a
+    manuscript in both places, never neither. A manuscript that changed
+    after it was copied (say it was withdrawn again, or given a new
+    editor) isn't deleted with the stale copy; it is copied again, or
+    left in place if it shouldn't be archived any more. Histories go
+    the same way once their manuscripts have moved. Returns the number
+    moved.
+    """
+    manus = dbc.read_many(ms.MANUSCRIPTS_COLLECT, archive_filter(cutoff),
+                          limit=batch_size)
+    if not manus:
+        return 0
+
+    def reread_manus(manu_ids):
+        return dbc.read_many(ms.MANUSCRIPTS_COLLECT,
+                             {**archive_filter(cutoff),
+                              ms.MONGO_ID: {'$in': manu_ids}})
+
+    def reread_histories(his_ids):
+        return dbc.read_many(ms.MANUSCRIPT_HISTORY_COLLECT,
+                             {ms.MONGO_ID: {'$in': his_ids}})
+
+    moved = move_docs(ms.MANUSCRIPTS_COLLECT, ARCHIVE_COLLECT, manus,
+                      unchanged_manuscript, reread_manus,
+                      {ARCHIVED_AT: ms.get_est_time()})
+    move_docs(ms.MANUSCRIPT_HISTORY_COLLECT, HISTORY_ARCHIVE_COLLECT,
+              reread_histories(get_history_ids(moved)),
+              unchanged_history, reread_histories)
+    return len(moved)
+
+
+def archive(age_days: float = DEFAULT_AGE_DAYS,
+            batch_size: int = BATCH_SIZE) -> int:
+    """
+    Archive every manuscript that has been terminal for `age_days`.
+    Returns the number archived.
+    """
+    cutoff = ms.get_est_time() - timedelta(days=age_days)
+    total = 0
+    while True:
+        moved = archive_batch(cutoff, batch_size)
+        if not moved:
+            return total
+        total += moved
+
+
+def read_archived(manu_id) -> dict:
+    return dbc.read_one(ARCHIVE_COLLECT,
+                        {ms.MONGO_ID: ms.create_mongo_id_object(manu_id)})
+
+
+def read_archived_history(his_id) -> dict:
+    return dbc.read_one(HISTORY_ARCHIVE_COLLECT,
+                        {ms.MONGO_ID: ms.create_mongo_id_object(his_id)})
+
+
+def restore(manu_id) -> dict:
+    """
+    Move an archived manuscript and its history back into the hot
+    collections. Returns the restored manuscript, or None if it isn't
+    archived.
+    """
+    manu = read_archived(manu_id)
+    if not manu:
+        return None
+    manu.pop(ARCHIVED_AT)
+    history = None
+    if manu.get(ms.MANUSCRIPT_HISTORY_FK):
+        history = read_archived_history(manu[ms.MANUSCRIPT_HISTORY_FK])
+    # Insert only: if someone else restored it first, their copy (and
+    # anything done to it since) wins.
+    if history:
+        dbc.bulk_write(ms.MANUSCRIPT_HISTORY_COLLECT, insert_ops([history]))
+    result = dbc.bulk_write(ms.MANUSCRIPTS_COLLECT, insert_ops([manu]))
+    dbc.delete(ARCHIVE_COLLECT,
+               {ms.MONGO_ID: ms.create_mongo_id_object(manu_id)})
+    if history:
+        dbc.delete(HISTORY_ARCHIVE_COLLECT,
+                   {ms.MONGO_ID: ms.create_mongo_id_object(
+                       history[ms.MONGO_ID])})
+    if not result.upserted_count:
+        return dbc.read_one(ms.MANUSCRIPTS_COLLECT,
+                            {ms.MONGO_ID: ms.create_mongo_id_object(manu_id)})
+    return manu
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Archive long-finished manuscripts.')
+    parser.add_argument('--days', type=float, default=DEFAULT_AGE_DAYS,
+                        help='How long a manuscript must have been finished')
+    parser.add_argument('--batch', type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+    print(f'Archived {archive(args.days, args.batch)} manuscripts.')
+
+
+if __name__ == '__main__':
+    main()
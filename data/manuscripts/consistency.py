@@ -0,0 +1,227 @@
+"""
+Consistency checker for manuscripts and their history.
+create_manuscript() and delete_manuscript() each take several writes, so
+a crash part way through can leave:
+  - history docs whose manuscript is gone, or points elsewhere
+    (archived manuscripts count as still there),
+  - manuscripts with no history doc, or one that doesn't exist,
+  - manuscripts in a state the FSM doesn't know.
+Each collection's _id space is cut into ranges at sampled split points,
+and the ranges are scanned at once by a thread pool. References are
+checked a batch at a time with one $in lookup. With --repair, orphaned
+history is deleted and missing history is recreated. Bad states are
+only reported, since there is no telling what they should be.
+Docs younger than GRACE_SECS are skipped: they may be mid-create.
+  python -m data.manuscripts.consistency --threads 16 --repair
+"""
+import argparse
+import itertools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from bson.objectid import ObjectId
+from pymongo import UpdateOne
+
+import data.db_connect as dbc
+import data.manuscripts.archive as arch
+import data.manuscripts.manuscripts as ms
+import data.manuscripts.query as qry
+
+ORPHAN_HISTORY = 'orphan_history'
+MISSING_HISTORY = 'missing_history'
+BAD_STATE = 'bad_state'
+PROBLEMS = [ORPHAN_HISTORY, MISSING_HISTORY, BAD_STATE]
+SCANNED = 'scanned'
+REPAIRED = 'repaired'
+EXAMPLES = 'examples'
+
+DEFAULT_THREADS = min(32, 4 * (os.cpu_count() or 2))
+RANGES_PER_THREAD = 4  # so one slow range doesn't hold up the rest
+SAMPLES_PER_RANGE = 16
+BATCH_SIZE = 1000
+GRACE_SECS = 10 * 60
+MAX_EXAMPLES = 20
+
+
+def new_report() -> dict:
+    report = {SCANNED: 0, EXAMPLES: {problem: [] for problem in PROBLEMS}}
+    for problem in PROBLEMS:
+        report[problem] = 0
+        report[f'{REPAIRED}_{problem}'] = 0
+    return report
+
+
+def note(report: dict, problem: str, examples: list):
+    report[problem] += len(examples)
+    room = MAX_EXAMPLES - len(report[EXAMPLES][problem])
+    report[EXAMPLES][problem] += examples[:max(0, room)]
+
+
+def merge_reports(reports) -> dict:
+    total = new_report()
+    for report in reports:
+        for key, value in report.items():
+            if key == EXAMPLES:
+                for problem, examples in value.items():
+                    room = MAX_EXAMPLES - len(total[EXAMPLES][problem])
+                    total[EXAMPLES][problem] += examples[:max(0, room)]
+            else:
+                total[key] += value
+    return total
+
+
+def get_cutoff_id(grace_secs: float = GRACE_SECS) -> ObjectId:
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=grace_secs)
+    return ObjectId.from_datetime(cutoff)
+
+
+def split_ranges(collection: str, parts: int, upto: ObjectId) -> list:
+    """
+    Cut [start, upto) into about `parts` ranges of similar size, using
+    split points from a $sample, which doesn't have to read everything.
+    """
+    sample = dbc.aggregate(collection, [
+        {'$sample': {'size': parts * SAMPLES_PER_RANGE}},
+        {'$project': {ms.MONGO_ID: 1}},
+    ])
+    ids = sorted({ObjectId(doc[ms.MONGO_ID]) for doc in sample
+                  if ObjectId(doc[ms.MONGO_ID]) < upto})
+    step = max(1, len(ids) // parts)
+    cuts = ids[step::step][:parts - 1]
+    return list(zip([None, *cuts], [*cuts, upto]))
+
+
+def range_filter(low: ObjectId, high: ObjectId) -> dict:
+    bounds = {'$lt': high}
+    if low:
+        bounds['$gte'] = low
+    return {ms.MONGO_ID: bounds}
+
+
+def batches(collection: str, low, high, projection: dict):
+    docs = dbc.read_iter(collection, range_filter(low, high),
+                         projection=projection, sort=[(ms.MONGO_ID, 1)])
+    while True:
+        batch = list(itertools.islice(docs, BATCH_SIZE))
+        if not batch:
+            return
+        yield batch
+
+
+def check_manuscripts(low, high, repair: bool = False) -> dict:
+    report = new_report()
+    for batch in batches(ms.MANUSCRIPTS_COLLECT, low, high,
+                         {ms.STATE_FLD: 1, ms.MANUSCRIPT_HISTORY_FK: 1}):
+        report[SCANNED] += len(batch)
+        note(report, BAD_STATE, [
+            (doc[ms.MONGO_ID], doc.get(ms.LATEST_VERSION, {}).get(ms.STATE))
+            for doc in batch
+            if doc.get(ms.LATEST_VERSION, {}).get(ms.STATE)
+            not in qry.STATE_INDEX])
+        his_ids = [doc[ms.MANUSCRIPT_HISTORY_FK] for doc in batch
+                   if doc.get(ms.MANUSCRIPT_HISTORY_FK)]
+        found = {doc[ms.MONGO_ID] for doc in dbc.read_many(
+            ms.MANUSCRIPT_HISTORY_COLLECT,
+            {ms.MONGO_ID: {'$in': [ms.create_mongo_id_object(his_id)
+                                   for his_id in his_ids]}},
+            projection={ms.MONGO_ID: 1})}
+        missing = [doc[ms.MONGO_ID] for doc in batch
+                   if str(doc.get(ms.MANUSCRIPT_HISTORY_FK)) not in found]
+        note(report, MISSING_HISTORY, missing)
+        if repair and missing:
+            report[f'{REPAIRED}_{MISSING_HISTORY}'] += add_histories(missing)
+    return report
+
+
+def add_histories(manu_ids: list) -> int:
+    """
+    Give each manuscript a fresh, empty history doc.
+    """
+    manu_ids = [ObjectId(manu_id) for manu_id in manu_ids]
+    inserted = dbc.create_many(ms.MANUSCRIPT_HISTORY_COLLECT, [
+        {ms.MANUSCRIPT_FK: manu_id, ms.HISTORY: []} for manu_id in manu_ids])
+    result = dbc.bulk_write(ms.MANUSCRIPTS_COLLECT, [
+        UpdateOne({ms.MONGO_ID: manu_id},
+                  {'$set': {ms.MANUSCRIPT_HISTORY_FK: his_id}})
+        for manu_id, his_id in zip(manu_ids, inserted.inserted_ids)])
+    return result.modified_count
+
+
+def owned_histories(manu_ids: list) -> set:
+    """
+    The history ids that these manuscripts point to, live or archived.
+    archive.restore() writes the live copy before it deletes the
+    archived one, so reading the archive first can't miss a manuscript
+    that is being restored.
+    """
+    filt = {ms.MONGO_ID: {'$in': [manu_id for manu_id in manu_ids
+                                  if manu_id]}}
+    owned = set()
+    for collection in (arch.ARCHIVE_COLLECT, ms.MANUSCRIPTS_COLLECT):
+        owned |= {str(manu.get(ms.MANUSCRIPT_HISTORY_FK))
+                  for manu in dbc.read_many(
+                      collection, filt,
+                      projection={ms.MANUSCRIPT_HISTORY_FK: 1})}
+    return owned
+
+
+def find_orphans(docs: list) -> list:
+    owned = owned_histories([doc.get(ms.MANUSCRIPT_FK) for doc in docs])
+    return [doc for doc in docs if doc[ms.MONGO_ID] not in owned]
+
+
+def check_histories(low, high, repair: bool = False) -> dict:
+    report = new_report()
+    for batch in batches(ms.MANUSCRIPT_HISTORY_COLLECT, low, high,
+                         {ms.MANUSCRIPT_FK: 1}):
+        report[SCANNED] += len(batch)
+        orphans = find_orphans(batch)
+        note(report, ORPHAN_HISTORY, [doc[ms.MONGO_ID] for doc in orphans])
+        if repair and orphans:
+            # a restore or create may have finished since; look again
+            # right before deleting anything
+            orphans = find_orphans(orphans)
+            report[f'{REPAIRED}_{ORPHAN_HISTORY}'] += dbc.delete_many(
+                ms.MANUSCRIPT_HISTORY_COLLECT,
+                {ms.MONGO_ID: {'$in': [ObjectId(doc[ms.MONGO_ID])
+                                       for doc in orphans]}})
+    return report
+
+
+def check(threads: int = DEFAULT_THREADS, repair: bool = False,
+          grace_secs: float = GRACE_SECS) -> dict:
+    """
+    Scan both collections in parallel and return a report with a count
+    and some example ids for each kind of problem.
+    """
+    upto = get_cutoff_id(grace_secs)
+    parts = threads * RANGES_PER_THREAD
+    work = [(check_manuscripts, rng) for rng in
+            split_ranges(ms.MANUSCRIPTS_COLLECT, parts, upto)]
+    work += [(check_histories, rng) for rng in
+             split_ranges(ms.MANUSCRIPT_HISTORY_COLLECT, parts, upto)]
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        futures = [pool.submit(fn, low, high, repair)
+                   for fn, (low, high) in work]
+        return merge_reports(future.result() for future in futures)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Check manuscripts and history for broken links.')
+    parser.add_argument('--threads', type=int, default=DEFAULT_THREADS)
+    parser.add_argument('--repair', action='store_true')
+    parser.add_argument('--grace', type=float, default=GRACE_SECS,
+                        help='Skip docs created in the last GRACE seconds')
+    args = parser.parse_args()
+    report = check(args.threads, args.repair, args.grace)
+    print(f'Scanned {report[SCANNED]} docs.')
+    for problem in PROBLEMS:
+        print(f'{problem}: {report[problem]} found, '
+              f'{report[f"{REPAIRED}_{problem}"]} repaired. '
+              f'e.g. {report[EXAMPLES][problem][:5]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""
+Per-state manuscript counters for editorial dashboards.
+There is one counter doc per state for the whole journal, plus one per
+(state, editor) pair. They are kept current with $inc on every create,
+transition and delete, so reading them costs O(number of states).
+reconcile() rebuilds them from the manuscripts themselves.
+"""
+from functools import wraps
+
+from pymongo import ReplaceOne, UpdateOne
+
+import data.db_connect as dbc
+import data.manuscripts.archive as arch
+import data.manuscripts.manuscripts as ms
+import data.manuscripts.query as qry
+
+COUNTERS_COLLECT = 'manuscript_counters'
+
+STATE = 'state'
+EDITOR = 'editor'
+COUNT = 'count'
+ALL_EDITORS = ''  # the journal-wide counter for a state
+
+indexed = False
+
+
+def needs_index(fn):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        global indexed
+        if not indexed:
+            dbc.create_index(COUNTERS_COLLECT,
+                             [(EDITOR, 1), (STATE, 1)],
+                             unique=True)
+            indexed = True
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+def to_code(state: str) -> str:
+    """
+    Stored states may be long form ("Submitted") or codes ("SUB").
+    Counters are always keyed by code.
+    """
+    return qry.STATE_NAME_TO_CODE.get(state, state)
+
+
+def inc_ops(state: str, editors, delta: int) -> list:
+    state = to_code(state)
+    ops = []
+    for editor in [ALL_EDITORS, *editors]:
+        ops.append(UpdateOne({STATE: state, EDITOR: editor},
+                             {'$inc': {COUNT: delta}},
+                             upsert=True))
+    return ops
+
+
+@needs_index
+def record_create(state: str, editors=()):
+    return dbc.bulk_write(COUNTERS_COLLECT, inc_ops(state, editors, 1))
+
+
+@needs_index
+def record_delete(state: str, editors=()):
+    return dbc.bulk_write(COUNTERS_COLLECT, inc_ops(state, editors, -1))
+
+
+@needs_index
+def record_deletes(deleted):
+    """
+    Take many deleted (state, editors) manuscripts off the counters in
+    one bulk write.
+    """
+    deltas = {}
+    for state, editors in deleted:
+        for editor in [ALL_EDITORS, *editors]:
+            key = (to_code(state), editor)
+            deltas[key] = deltas.get(key, 0) - 1
+    return dbc.bulk_write(COUNTERS_COLLECT, [
+        UpdateOne({STATE: state, EDITOR: editor},
+                  {'$inc': {COUNT: delta}},
+                  upsert=True)
+        for (state, editor), delta in deltas.items()])
+
+
+@needs_index
+def record_transition(old_state: str, new_state: str, editors=()):
+    """
+    Move one manuscript's worth of count from old_state to new_state.
+    """
+    return record_transitions([(old_state, new_state, editors)])
+
+
+@needs_index
+def record_transitions(moves):
+    """
+    Apply many (old_state, new_state, editors) moves in one bulk write.
+    Moves that hit the same counter are summed first.
+    """
+    deltas = {}
+    for old_state, new_state, editors in moves:
+        if to_code(old_state) == to_code(new_state):
+            continue
+        for state, delta in ((old_state, -1), (new_state, 1)):
+            for editor in [ALL_EDITORS, *editors]:
+                key = (to_code(state), editor)
+                deltas[key] = deltas.get(key, 0) + delta
+    ops = [UpdateOne({STATE: state, EDITOR: editor},
+                     {'$inc': {COUNT: delta}},
+                     upsert=True)
+           for (state, editor), delta in deltas.items() if delta]
+    return dbc.bulk_write(COUNTERS_COLLECT, ops)
+
+
+@needs_index
+def record_editor_change(state: str, editor: str, delta: int):
+    """
+    An editor was added to (+1) or taken off (-1) a manuscript in `state`.
+    """
+    return dbc.bulk_write(COUNTERS_COLLECT, [
+        UpdateOne({STATE: to_code(state), EDITOR: editor},
+                  {'$inc': {COUNT: delta}},
+                  upsert=True)])
+
+
+def get_counts(editor: str = ALL_EDITORS) -> dict:
+    """
+    Return {state code: count} for every valid state.
+    """
+    counts = {state: 0 for state in qry.get_states()}
+    for doc in dbc.read_many(COUNTERS_COLLECT, {EDITOR: editor},
+                             projection={STATE: 1, COUNT: 1}):
+        counts[doc[STATE]] = doc[COUNT]
+    return counts
+
+
+def count_manuscripts() -> list:
+    """
+    Count manuscripts by (state, editor) straight from the source,
+    archived ones included.
+    Returns [{state, editor, count}], with editor '' for the totals.
+    """
+    state_fld = f'${ms.LATEST_VERSION}.{ms.STATE}'
+    editors_fld = f'${ms.LATEST_VERSION}.{ms.EDITORS}'
+    pipeline = [
+        {'$unionWith': arch.ARCHIVE_COLLECT},
+        {'$project': {
+            STATE: state_fld,
+            EDITOR: {'$concatArrays': [
+                [ALL_EDITORS],
+                {'$cond': [
+                    {'$isArray': editors_fld},
+                    {'$map': {'input': editors_fld,
+                              'in': f'$$this.{ms.EDITOR_EMAIL}'}},
+                    # not migrated yet: {email: role}
+                    {'$map': {
+                        'input': {'$objectToArray': {
+                            '$ifNull': [editors_fld, {}]}},
+                        'in': '$$this.k',
+                    }},
+                ]},
+            ]},
+        }},
+        {'$unwind': f'${EDITOR}'},
+        {'$group': {
+            ms.MONGO_ID: {STATE: f'${STATE}', EDITOR: f'${EDITOR}'},
+            COUNT: {'$sum': 1},
+        }},
+    ]
+    ret = {}
+    for row in dbc.aggregate(ms.MANUSCRIPTS_COLLECT, pipeline):
+        key = (to_code(row[ms.MONGO_ID][STATE]), row[ms.MONGO_ID][EDITOR])
+        ret[key] = ret.get(key, 0) + row[COUNT]
+    return [{STATE: state, EDITOR: editor, COUNT: cnt}
+            for (state, editor), cnt in ret.items()]
+
+
+@needs_index
+def reconcile() -> int:
+    """
+    Rebuild the counters from an aggregation over the manuscripts.
+    Run this after bulk data fixes, or if a crash lands between a state
+    change and its $inc. Returns the number of counter docs written.
+    """
+    rows = count_manuscripts()
+    ops = [ReplaceOne({STATE: row[STATE], EDITOR: row[EDITOR]}, row,
+                      upsert=True)
+           for row in rows]
+    dbc.bulk_write(COUNTERS_COLLECT, ops)
+    # Zero anything the aggregation no longer sees.
+    seen = {(row[STATE], row[EDITOR]) for row in rows}
+    stale = [UpdateOne({STATE: doc[STATE], EDITOR: doc[EDITOR]},
+                       {'$set': {COUNT: 0}})
+             for doc in dbc.read_many(COUNTERS_COLLECT, {COUNT: {'$ne': 0}})
+             if (doc[STATE], doc[EDITOR]) not in seen]
+    dbc.bulk_write(COUNTERS_COLLECT, stale)
+    return len(ops)
+
+
+def main():
+    print(f'Reconciled {reconcile()} counters.')
+    print(get_counts())
+
+
+if __name__ == '__main__':
+    main()
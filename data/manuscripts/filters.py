@@ -0,0 +1,196 @@
+"""
+Filtered manuscript listings for the editorial UI.
+Filter parameters are validated and compiled into a Mongo query, and
+the first query of each shape (its fields and sort) is run through
+explain(). Shapes the planner would answer with a collection scan,
+with an index we didn't declare, or with an index that doesn't start
+with a field being filtered on (e.g. walking the whole created-date
+index to find one author) are refused, so no combination of filters
+can make the DB read every manuscript.
+"""
+from datetime import datetime
+from functools import wraps
+
+import data.db_connect as dbc
+import data.manuscripts.manuscripts as ms
+import data.manuscripts.query as qry
+
+# filter parameters
+STATE = 'state'
+AUTHOR = 'author'
+EDITOR = 'editor'
+REFEREE = 'referee'
+CREATED_AFTER = 'created_after'
+CREATED_BEFORE = 'created_before'
+ORDER = 'order'
+
+ASC = 'asc'
+DESC = 'desc'
+ORDERS = {ASC: 1, DESC: -1}
+
+FILTER_FLDS = {
+    STATE: ms.STATE_FLD,
+    AUTHOR: ms.AUTHOR_NAME,
+    EDITOR: ms.EDITOR_EMAIL_FLD,
+    REFEREE: ms.REFEREES_FLD,
+}
+
+# Indexes on top of ms.MANUSCRIPT_INDEXES that filters rely on.
+FILTER_INDEXES = [
+    [(ms.STATE_FLD, 1), (ms.MANUSCRIPT_CREATED, -1)],
+    [(ms.REFEREES_FLD, 1), (ms.MANUSCRIPT_CREATED, -1)],
+    [(ms.MANUSCRIPT_CREATED, -1)],
+]
+
+COLLSCAN = 'COLLSCAN'
+
+indexed = False
+checked_shapes = {}  # shape -> None if fine, else why not
+
+
+def get_index_name(keys: list) -> str:
+    """
+    The name Mongo gives an index by default.
+    """
+    return '_'.join(f'{fld}_{direction}' for fld, direction in keys)
+
+
+def get_declared_indexes() -> dict:
+    """
+    {index name: keys} for every index we rely on.
+    """
+    return {get_index_name(keys): keys
+            for keys in ms.MANUSCRIPT_INDEXES + FILTER_INDEXES}
+
+
+def ensure_indexes():
+    global indexed
+    ms.ensure_indexes()
+    for keys in FILTER_INDEXES:
+        dbc.create_index(ms.MANUSCRIPTS_COLLECT, keys)
+    indexed = True
+
+
+def needs_indexes(fn):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not indexed:
+            ensure_indexes()
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+def parse_date(value: str, param: str) -> datetime:
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{param} must be an ISO date, not {value!r}')
+
+
+def compile_filters(params: dict) -> tuple:
+    """
+    Turn filter parameters into a (filter, sort) pair.
+    `state` may be a list; every other filter takes one value.
+    Raises ValueError on anything we don't understand.
+    """
+    unknown = set(params) - set(FILTER_FLDS) - {CREATED_AFTER,
+                                                CREATED_BEFORE, ORDER}
+    if unknown:
+        raise ValueError(f'Unknown filters: {", ".join(sorted(unknown))}')
+    filt = {}
+    states = params.get(STATE)
+    if states:
+        if isinstance(states, str):
+            states = [states]
+        aliases = []
+        for state in states:
+            if state not in qry.STATE_INDEX:
+                raise ValueError(f'Bad state: {state}')
+            aliases += qry.STATE_ALIASES[qry.STATES[qry.STATE_INDEX[state]]]
+        filt[ms.STATE_FLD] = {'$in': aliases}
+    for param in (AUTHOR, EDITOR, REFEREE):
+        value = params.get(param)
+        if value:
+            if not isinstance(value, str):
+                raise ValueError(f'{param} takes a single value')
+            filt[FILTER_FLDS[param]] = value.strip()
+    created = {}
+    if params.get(CREATED_AFTER):
+        created['$gte'] = parse_date(params[CREATED_AFTER], CREATED_AFTER)
+    if params.get(CREATED_BEFORE):
+        created['$lt'] = parse_date(params[CREATED_BEFORE], CREATED_BEFORE)
+    if created:
+        filt[ms.MANUSCRIPT_CREATED] = created
+    order = params.get(ORDER) or DESC
+    if order not in ORDERS:
+        raise ValueError(f'{ORDER} must be {ASC!r} or {DESC!r}')
+    return filt, [(ms.MANUSCRIPT_CREATED, ORDERS[order])]
+
+
+def get_shape(filt: dict, sort: list) -> tuple:
+    """
+    Queries with the same fields and sort get the same plan.
+    """
+    return tuple(sorted(filt)), tuple(sort)
+
+
+def get_plan_stages(plan: dict):
+    """
+    Yield (stage, index name) for every stage in an explain() plan.
+    """
+    plan = plan.get('queryPlan', plan)
+    yield plan.get('stage'), plan.get('indexName')
+    children = plan.get('inputStages', [])
+    if 'inputStage' in plan:
+        children = [plan['inputStage']] + children
+    for child in children:
+        yield from get_plan_stages(child)
+
+
+def check_plan(plan: dict, filt: dict) -> str:
+    """
+    Return why a plan for `filt` is unacceptable, or None if it's fine.
+    An index is only any good if the filter narrows its first field;
+    with no filter at all we are just paging through in date order.
+    """
+    declared = get_declared_indexes()
+    for stage, index_name in get_plan_stages(plan):
+        if stage == COLLSCAN:
+            return 'it would scan every manuscript'
+        if not index_name:
+            continue
+        if index_name not in declared:
+            return f'it would use the undeclared index {index_name}'
+        lead = declared[index_name][0][0]
+        if filt and lead not in filt:
+            return f'it would walk all of the index {index_name}'
+    return None
+
+
+def check_query(filt: dict, sort: list):
+    shape = get_shape(filt, sort)
+    if shape not in checked_shapes:
+        checked_shapes[shape] = check_plan(
+            dbc.explain(ms.MANUSCRIPTS_COLLECT, filt, sort=sort), filt)
+    if checked_shapes[shape]:
+        raise ValueError(f'Filtering on {", ".join(shape[0])} '
+                         f'is not supported: {checked_shapes[shape]}')
+
+
+@needs_indexes
+def filter_manuscripts(params: dict, page: int = 1,
+                       page_size: int = ms.DEFAULT_PAGE_SIZE) -> dict:
+    """
+    One page of the manuscripts matching `params`, as summaries.
+    """
+    filt, sort = compile_filters(params)
+    check_query(filt, sort)
+    return ms.read_summary_page(filt, page, page_size, sort)
+
+
+def main():
+    print(filter_manuscripts({STATE: [qry.SUBMITTED]}))
+
+
+if __name__ == '__main__':
+    main()
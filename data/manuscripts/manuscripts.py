@@ -2,9 +2,19 @@ import data.db_connect as dbc
 from datetime import datetime
 import  data.manuscripts.states as states
 import data.people as ppl
+import data.roles as rls
 from bson.objectid import ObjectId
+from pymongo import UpdateOne
 from copy import deepcopy
+from functools import wraps
 from . import query
+import data.manuscripts.counters as cntrs
+import data.manuscripts.referees as refs
+import data.manuscripts.similarity as simlr
+import data.manuscripts.recommend as rec
+import data.manuscripts.notifications as ntfy
+import data.manuscripts.archive as arch
+import data.manuscripts.uploads as upl
 
 
 # --- Collection Names ---
@@ -16,6 +26,10 @@ MANUSCRIPT_HISTORY_COLLECT = 'manuscript_history'
 AUTHOR_FK = "author_fk"
 AUTHOR_NAME = 'author'  # reference to a PERSON document
 MANUSCRIPT_CREATED = 'manuscript_created'
+POSSIBLE_DUPLICATES = 'possible_duplicates'  # [{manu_id, similarity}]
+WORD_COUNT = 'word_count'  # in LATEST_VERSION, set by tasks.py
+FILE = 'file'  # in LATEST_VERSION, set by uploads.py
+OUTBOX = 'outbox'  # state change events not yet sent, see notifications.py
 MANUSCRIPT_HISTORY_FK = 'manuscript_history_fk'
 LATEST_VERSION = 'latest_version'  # array of version objects
 STATE = 'state'
@@ -25,17 +39,38 @@ TEXT = 'text'
 EDITORS = 'editors'
 EDITOR_COMMENTS = 'editor_comments'
 REFEREES = 'referees'
+STATE_SINCE = 'state_since'  # when the manuscript entered its state
+LAST_TRANSITION = 'last_transition'  # token of the last change written
+RECENT_TRANSITIONS = 'recent_transitions'  # the last few tokens
+RECENT_TRANSITIONS_KEEP = 16
 
 
 # --- EDITORS --- #
 EDITOR_FK = 'editor_fk'
 EDITOR_NAME = 'editor_name'
 EDITOR_ROLE = 'role'
+EDITOR_EMAIL = 'email'
 EDITOR_COMMENTS = 'comments'
 
+# --- PAGINATION --- #
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+TOTAL = 'total'
+PAGE = 'page'
+PAGE_SIZE = 'page_size'
+RESULTS = 'results'
+
 # --- MANUSCRIPT HISTORY COLLECT  --- #
 MANUSCRIPT_FK = 'manuscript_id_fk'
 HISTORY = 'history'
+# one HISTORY entry per state change
+HIST_FROM = 'from'
+HIST_TO = 'to'
+HIST_ACTION = 'action'
+HIST_AT = 'at'
+HIST_ENTERED = 'entered'  # when the manuscript reached HIST_FROM
+HIST_EDITORS = 'editors'
+HISTORY_AT_FLD = f'{HISTORY}.{HIST_AT}'
 
 
 # --- ADDITIONAL KEY --- #
@@ -50,6 +85,39 @@ SET = '$set'
 # establishing a mongodb connection
 dbc.connect_db()
 
+STATE_FLD = f'{LATEST_VERSION}.{STATE}'
+EDITOR_EMAIL_FLD = f'{LATEST_VERSION}.{EDITORS}.{EDITOR_EMAIL}'
+TEXT_FLD = f'{LATEST_VERSION}.{TEXT}'
+REFEREES_FLD = f'{LATEST_VERSION}.{REFEREES}'
+STATE_SINCE_FLD = f'{LATEST_VERSION}.{STATE_SINCE}'
+
+MANUSCRIPT_INDEXES = [
+    # "my queue": an editor's manuscripts, by state, newest first
+    [(EDITOR_EMAIL_FLD, 1), (STATE_FLD, 1), (MANUSCRIPT_CREATED, -1)],
+    # an author's manuscripts, by submission date
+    [(AUTHOR_NAME, 1), (MANUSCRIPT_CREATED, -1), (MONGO_ID, -1)],
+    # a referee's open reviews
+    [(REFEREES_FLD, 1), (STATE_FLD, 1)],
+]
+
+indexed = False
+
+
+def ensure_indexes():
+    global indexed
+    for keys in MANUSCRIPT_INDEXES:
+        dbc.create_index(MANUSCRIPTS_COLLECT, keys)
+    indexed = True
+
+
+def needs_indexes(fn):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not indexed:
+            ensure_indexes()
+        return fn(*args, **kwargs)
+    return wrapper
+
 def get_est_time():
     return datetime.now()
 
@@ -84,18 +152,19 @@ def create_manuscript_history(manu_id):
 
 def create_simple_manuscript(author_name,  title, text):
 
-
+    created = get_est_time()
     manu_template = {
     AUTHOR_NAME: author_name,
-    MANUSCRIPT_CREATED: get_est_time(),
+    MANUSCRIPT_CREATED: created,
     LATEST_VERSION:
         {
             STATE: states.DEFAULT_STATE,  # initial state can be 'Draft'
+            STATE_SINCE: created,
             TITLE: title,
             VERSION: states.DEFAULT_VERSION,
             TEXT: text,
             REFEREES: [],
-            EDITORS: {},
+            EDITORS: [],  # [{EDITOR_EMAIL, EDITOR_ROLE}], so it can be indexed
             EDITOR_COMMENTS: {}
         }
     }
@@ -138,32 +207,64 @@ def create_manuscript(author_name, title, text):
         return None
         raise Exception("Failed to create manuscript document.")
 
+    cntrs.record_create(states.DEFAULT_STATE)
+    rec.add_manuscript(text)
 
     return dbc.read_one(MANUSCRIPTS_COLLECT, {MONGO_ID: manu_id})
 
 
+def flag_duplicates(manu_id, text: str) -> list:
+    """
+    Index a manuscript's text for near-duplicate detection and record
+    any existing manuscripts it closely matches.
+    """
+    manu_id = create_mongo_id_object(manu_id)
+    duplicates = simlr.index_manuscript(manu_id, text)
+    dbc.update(MANUSCRIPTS_COLLECT, {MONGO_ID: manu_id},
+               {POSSIBLE_DUPLICATES: duplicates})
+    return duplicates
+
+
 def read_one_manuscript(manu_id) :
     manu_obj_id = ObjectId(manu_id)
     if not manu_obj_id:
         return None
-    return dbc.read_one(MANUSCRIPTS_COLLECT, {MONGO_ID: manu_obj_id})
+    manu = dbc.read_one(MANUSCRIPTS_COLLECT, {MONGO_ID: manu_obj_id})
+    if manu:
+        return manu
+    # long-finished manuscripts live in the archive
+    return arch.read_archived(manu_obj_id)
 
 def read_all_manuscripts():
     return dbc.read(MANUSCRIPTS_COLLECT,dbc.SE_DB, False)
 
+
+def update_manuscript(manu_id, title: str, text: str) -> bool:
+    """
+    Update the title and text of a manuscript's latest version.
+    Returns False if there is no such manuscript.
+    """
+    update_result = dbc.update(
+        MANUSCRIPTS_COLLECT,
+        {MONGO_ID: create_mongo_id_object(manu_id)},
+        {
+            f"{LATEST_VERSION}.{TITLE}": title,
+            f"{LATEST_VERSION}.{TEXT}": text,
+            **new_token(),
+        }
+    )
+    return update_result.matched_count > 0
+
 def delete_manuscript_history(his_id):
     his_id = ObjectId(his_id)
     return dbc.delete(MANUSCRIPT_HISTORY_COLLECT, {MONGO_ID: his_id})
 
-def read_manuscripts_by_author(author_name: str) -> list:
-    return dbc.read_one(MANUSCRIPTS_COLLECT, {'author': author_name})
-
-
 def delete_manuscript(manu_id):
 
     # MUST ALSO DELETE IT'S ASSOCIATED HISTORY!!
     manu_id = ObjectId(manu_id)
-    manu = dbc.read_one(MANUSCRIPTS_COLLECT, {MONGO_ID: manu_id })
+    manu = (dbc.read_one(MANUSCRIPTS_COLLECT, {MONGO_ID: manu_id })
+            or arch.restore(manu_id))
     if not manu:
         return False
     his_id = manu[MANUSCRIPT_HISTORY_FK]
@@ -172,56 +273,462 @@ def delete_manuscript(manu_id):
     his_delete = delete_manuscript_history(his_id)
 
     manu_delete = dbc.delete(MANUSCRIPTS_COLLECT, {MONGO_ID: manu_id})
+    if manu_delete:
+        simlr.remove_manuscript(manu_id)
+        upl.delete_manuscript_uploads([manu_id])
+        latest = manu[LATEST_VERSION]
+        cntrs.record_delete(latest[STATE], get_editor_emails(latest))
+        if refs.is_in_review(latest[STATE]):
+            refs.record_transition(latest[STATE], None, None,
+                                   latest.get(REFEREES, []), [])
 
     return manu_delete
 
 
 def read_one_manuscript_history(his_id) -> dict:
-    his_obj_id = create_mongo_id_object(his_obj_id)
-    return dbc.read_one(MANUSCRIPT_HISTORY_COLLECT, {MONGO_ID: his_obj_id})
-
-
-def read_manuscripts_by_author(author_name):
-    return dbc.read_one(MANUSCRIPT_HISTORY_COLLECT, {'author': author_name})
+    his_obj_id = create_mongo_id_object(his_id)
+    return (dbc.read_one(MANUSCRIPT_HISTORY_COLLECT, {MONGO_ID: his_obj_id})
+            or arch.read_archived_history(his_obj_id))
 
 
 def transition_manuscript_state(manu_id: str, action: str, ref: str = None, target_state: str = None):
     manu = read_one_manuscript(manu_id)
     if not manu:
         raise ValueError(f"No manuscript found with ID: {manu_id}")
+    if manu.get(arch.ARCHIVED_AT):
+        manu = arch.restore(manu_id)
 
     latest = manu[LATEST_VERSION]
 
     if REFEREES not in latest:
         latest[REFEREES] = []
 
+    if action == query.ASSIGN_REF and not ref:
+        ref = choose_referee(latest)
+
     kwargs = {
         "manu": latest,
         "ref": ref,
         "target_state": target_state  # for EDITOR_MOVE
     }
+    old_state = latest[STATE]
+    old_refs = list(latest[REFEREES])
     new_state = query.handle_action(
-        curr_state=latest[STATE],
+        curr_state=old_state,
         action=action,
         **kwargs
     )
 
-    update_result = dbc.update(
+    # Only apply the change if nobody moved the manuscript since we read
+    # it, so each real state change moves the counters exactly once.
+    changed_at = get_est_time()
+    update_result = dbc.update_one(
         MANUSCRIPTS_COLLECT,
-        {MONGO_ID: ObjectId(manu_id)},
-        {
-            f"{LATEST_VERSION}.{STATE}": new_state,
-            f"{LATEST_VERSION}.{EDITORS}": latest.get(EDITORS, {}),
-            f"{LATEST_VERSION}.{EDITOR_COMMENTS}": latest.get(EDITOR_COMMENTS, {}),
-            f"{LATEST_VERSION}.{REFEREES}": latest.get(REFEREES, [])
-        }
+        transition_filter(manu_id, old_state, latest.get(LAST_TRANSITION)),
+        state_change_update(manu, old_state, new_state, action, changed_at,
+                            ObjectId())
     )
 
     if not update_result.acknowledged:
         raise Exception(f"Failed to update manuscript {manu_id} to state {new_state}")
+    if update_result.matched_count == 0:
+        raise ValueError(f"Manuscript {manu_id} changed state concurrently; "
+                         "retry the action")
+    cntrs.record_transition(old_state, new_state, get_editor_emails(latest))
+    record_history([(manu, history_entry(manu, old_state, new_state,
+                                         action, changed_at))])
+    refs.record_transition(old_state, new_state, action,
+                           old_refs, latest[REFEREES])
+    for new_ref in set(latest[REFEREES]) - set(old_refs):
+        rec.add_review(new_ref, latest.get(TEXT))
 
     return new_state
 
 
+def choose_referee(latest: dict) -> str:
+    """
+    Pick a referee for a manuscript that isn't already on it: the best
+    match for its text, or failing that the least-loaded referee.
+    """
+    exclude = latest.get(REFEREES, [])
+    picks = rec.recommend(latest.get(TEXT, ''), k=1, exclude=exclude)
+    if picks:
+        return picks[0][rec.EMAIL]
+    picks = refs.suggest_referees(1, exclude=exclude)
+    if picks:
+        return picks[0][ppl.EMAIL]
+    raise ValueError('No referee available to assign')
+
+
+def state_filter(manu_id, state: str) -> dict:
+    return {MONGO_ID: create_mongo_id_object(manu_id),
+            f"{LATEST_VERSION}.{STATE}": state}
+
+
+def new_token() -> dict:
+    """
+    The $set that gives a manuscript a new LAST_TRANSITION token. Writes
+    that aren't state changes (editors, title and text) use it too, so
+    anyone fencing on the token they read, such as the archiver, sees
+    that the manuscript changed.
+    """
+    return {f"{LATEST_VERSION}.{LAST_TRANSITION}": ObjectId()}
+
+
+def transition_filter(manu_id, state: str, last_token) -> dict:
+    """
+    Matches the manuscript only if no state change has been written
+    since we read it in `state` with `last_token`. That includes a move
+    that left it in the same state (say, a second referee assigned),
+    since every change writes a new LAST_TRANSITION token.
+    """
+    filt = state_filter(manu_id, state)
+    filt[f"{LATEST_VERSION}.{LAST_TRANSITION}"] = last_token
+    return filt
+
+
+def state_change_update(manu: dict, old_state: str, new_state: str,
+                        action: str, changed_at: datetime,
+                        token: ObjectId) -> dict:
+    """
+    The update for a state change. It queues the notification event in
+    the same write, so a change can't be saved without its event, and
+    stamps the change with `token`, kept among the recent ones so the
+    writer can tell later that its change landed.
+    """
+    latest = manu[LATEST_VERSION]
+    fields = {
+        f"{LATEST_VERSION}.{STATE}": new_state,
+        f"{LATEST_VERSION}.{REFEREES}": latest.get(REFEREES, []),
+        f"{LATEST_VERSION}.{LAST_TRANSITION}": token,
+    }
+    # assigning or removing a referee stays in review; the clock keeps
+    # running from when review started
+    if new_state != old_state:
+        fields[f"{LATEST_VERSION}.{STATE_SINCE}"] = changed_at
+    return {
+        SET: fields,
+        PUSH: {OUTBOX: ntfy.make_event(manu, old_state, new_state, action,
+                                       changed_at),
+               f"{LATEST_VERSION}.{RECENT_TRANSITIONS}": {
+                   '$each': [token], '$slice': -RECENT_TRANSITIONS_KEEP}},
+    }
+
+
+def history_entry(manu: dict, old_state: str, new_state: str, action: str,
+                  changed_at: datetime) -> dict:
+    latest = manu[LATEST_VERSION]
+    return {
+        HIST_FROM: old_state,
+        HIST_TO: new_state,
+        HIST_ACTION: action,
+        HIST_AT: changed_at,
+        HIST_ENTERED: latest.get(STATE_SINCE),
+        HIST_EDITORS: get_editor_emails(latest),
+    }
+
+
+def record_history(entries):
+    """
+    Append many (manuscript, history entry) pairs to the manuscripts'
+    history docs in one bulk write.
+    """
+    return dbc.bulk_write(MANUSCRIPT_HISTORY_COLLECT, [
+        UpdateOne({MONGO_ID: create_mongo_id_object(
+                       manu[MANUSCRIPT_HISTORY_FK])},
+                  {PUSH: {HISTORY: entry}})
+        for manu, entry in entries if manu.get(MANUSCRIPT_HISTORY_FK)])
+
+
+# --- BULK TRANSITIONS --- #
+BULK_ID = 'id'
+BULK_ACTION = 'action'
+BULK_REF = 'ref'
+BULK_TARGET_STATE = 'target_state'
+BULK_OK = 'ok'
+BULK_STATE = 'state'
+BULK_ERROR = 'error'
+
+MAX_BULK_ITEMS = 500
+
+ACTIONS_NEEDING_REF = [query.ASSIGN_REF, query.DELETE_REF]
+
+
+def validate_bulk_item(item: dict):
+    """
+    Check everything about a bulk item that doesn't need the DB.
+    Returns an error message, or None if the item looks good.
+    """
+    if not isinstance(item, dict):
+        return 'Item must be an object'
+    if not ObjectId.is_valid(str(item.get(BULK_ID, ''))):
+        return f"Bad manuscript id: {item.get(BULK_ID)}"
+    action = item.get(BULK_ACTION)
+    if action not in query.ACTION_INDEX:
+        return f'Bad action: {action}'
+    if action in ACTIONS_NEEDING_REF and not item.get(BULK_REF):
+        return f'Action {action} needs a ref'
+    if action == query.EDITOR_MOVE:
+        target_state = item.get(BULK_TARGET_STATE)
+        if target_state not in query.STATE_INDEX:
+            return f'Bad target state: {target_state}'
+    return None
+
+
+def transition_manuscripts(items: list) -> list:
+    """
+    Apply many {id, action, ref, target_state} items at once.
+    All targets are fetched with one $in read and all changes are sent
+    in one bulk write. Returns one {id, ok, state | error} per item, in
+    the order given.
+    """
+    if len(items) > MAX_BULK_ITEMS:
+        raise ValueError(f'At most {MAX_BULK_ITEMS} items per request')
+    results = []
+    seen = set()
+    for item in items:
+        item_id = str(item.get(BULK_ID, '')) if isinstance(item, dict) else ''
+        result = {BULK_ID: item_id, BULK_OK: False}
+        error = validate_bulk_item(item)
+        if not error and item_id in seen:
+            error = 'Manuscript appears more than once in this request'
+        if error:
+            result[BULK_ERROR] = error
+        seen.add(item_id)
+        results.append(result)
+
+    todo = [(item, result) for item, result in zip(items, results)
+            if BULK_ERROR not in result]
+    manus = {}
+    if todo:
+        for manu in dbc.read_many(
+                MANUSCRIPTS_COLLECT,
+                {MONGO_ID: {'$in': [ObjectId(result[BULK_ID])
+                                    for _, result in todo]}},
+                projection={f"{LATEST_VERSION}.{TEXT}": 0}):
+            manus[manu[MONGO_ID]] = manu
+        for manu in restore_archived([result[BULK_ID] for _, result in todo
+                                      if result[BULK_ID] not in manus]):
+            manus[manu[MONGO_ID]] = manu
+
+    ops = []
+    moves = {}
+    ref_moves = {}
+    entries = {}
+    changed_at = get_est_time()
+    token = ObjectId()  # each manuscript is in the request at most once
+    for item, result in todo:
+        manu = manus.get(result[BULK_ID])
+        if not manu:
+            result[BULK_ERROR] = f"No manuscript found: {result[BULK_ID]}"
+            continue
+        latest = manu[LATEST_VERSION]
+        latest.setdefault(REFEREES, [])
+        old_state = latest[STATE]
+        old_refs = list(latest[REFEREES])
+        try:
+            new_state = query.handle_action(
+                curr_state=old_state,
+                action=item[BULK_ACTION],
+                manu=latest,
+                ref=item.get(BULK_REF),
+                target_state=item.get(BULK_TARGET_STATE),
+            )
+        except (ValueError, KeyError) as err:
+            result[BULK_ERROR] = str(err).strip("'")
+            continue
+        ops.append(UpdateOne(transition_filter(result[BULK_ID], old_state,
+                                               latest.get(LAST_TRANSITION)),
+                             state_change_update(manu, old_state, new_state,
+                                                 item[BULK_ACTION],
+                                                 changed_at, token)))
+        entries[result[BULK_ID]] = (manu, history_entry(
+            manu, old_state, new_state, item[BULK_ACTION], changed_at))
+        moves[result[BULK_ID]] = (old_state, new_state,
+                                  get_editor_emails(latest))
+        ref_moves[result[BULK_ID]] = (old_state, new_state,
+                                      item[BULK_ACTION], old_refs,
+                                      latest[REFEREES])
+        result[BULK_STATE] = new_state
+
+    bulk_result = dbc.bulk_write(MANUSCRIPTS_COLLECT, ops)
+    if bulk_result and bulk_result.matched_count < len(ops):
+        # Someone else moved some of these since our read: the ones that
+        # took our change have our token, even if they have moved again.
+        ours = {manu[MONGO_ID] for manu in dbc.read_many(
+            MANUSCRIPTS_COLLECT,
+            {MONGO_ID: {'$in': [ObjectId(manu_id) for manu_id in moves]},
+             f"{LATEST_VERSION}.{RECENT_TRANSITIONS}": token},
+            projection={MONGO_ID: 1})}
+        moves = {manu_id: move for manu_id, move in moves.items()
+                 if manu_id in ours}
+    for result in results:
+        if result[BULK_ID] in moves:
+            result[BULK_OK] = True
+        elif BULK_STATE in result:
+            del result[BULK_STATE]
+            result[BULK_ERROR] = 'Manuscript changed state concurrently'
+    cntrs.record_transitions(moves.values())
+    record_history(entries[manu_id] for manu_id in moves)
+    refs.record_transitions(ref_moves[manu_id] for manu_id in moves)
+    rec.add_reviews((ref, manu_id) for manu_id in moves
+                    for ref in set(ref_moves[manu_id][4])
+                    - set(ref_moves[manu_id][3]))
+    return results
+
+
+def restore_archived(manu_ids: list) -> list:
+    """
+    Bring back whichever of these manuscripts are archived, as
+    transition_manuscript_state() does for one.
+    """
+    if not manu_ids:
+        return []
+    archived = dbc.read_many(
+        arch.ARCHIVE_COLLECT,
+        {MONGO_ID: {'$in': [ObjectId(manu_id) for manu_id in manu_ids]}},
+        projection={MONGO_ID: 1})
+    restored = [arch.restore(manu[MONGO_ID]) for manu in archived]
+    return [manu for manu in restored if manu]
+
+
+def get_editor_emails(latest: dict) -> list:
+    editors = latest.get(EDITORS) or []
+    if isinstance(editors, dict):  # not migrated yet
+        return list(editors)
+    return [editor[EDITOR_EMAIL] for editor in editors]
+
+
+# --- EDITOR ASSIGNMENTS --- #
+
+def clamp_page(page: int, page_size: int) -> tuple:
+    page = max(1, int(page))
+    page_size = min(MAX_PAGE_SIZE, max(1, int(page_size)))
+    return page, page_size
+
+
+def to_summary(doc: dict) -> dict:
+    """
+    The fields a list view needs: everything but the text.
+    """
+    latest = doc.get(LATEST_VERSION, {})
+    created = doc.get(MANUSCRIPT_CREATED)
+    return {
+        MONGO_ID: str(doc[MONGO_ID]),
+        AUTHOR_NAME: doc.get(AUTHOR_NAME),
+        MANUSCRIPT_CREATED: created.isoformat() if created else None,
+        TITLE: latest.get(TITLE),
+        STATE: latest.get(STATE),
+        EDITORS: get_editor_emails(latest),
+        REFEREES: latest.get(REFEREES, []),
+    }
+
+
+def read_summary_page(filt: dict, page: int, page_size: int,
+                      sort: list) -> dict:
+    page, page_size = clamp_page(page, page_size)
+    docs = dbc.read_many(MANUSCRIPTS_COLLECT, filt,
+                         projection={TEXT_FLD: 0},
+                         sort=sort,
+                         skip=(page - 1) * page_size,
+                         limit=page_size)
+    return {
+        TOTAL: dbc.count(MANUSCRIPTS_COLLECT, filt),
+        PAGE: page,
+        PAGE_SIZE: page_size,
+        RESULTS: [to_summary(doc) for doc in docs],
+    }
+
+
+@needs_indexes
+def assign_editor(manu_id, email: str, role: str = rls.ED_CODE) -> bool:
+    """
+    Add an editor to a manuscript. Returns False if there is no such
+    manuscript or the editor is already on it.
+    """
+    if not ppl.is_valid_email(email):
+        raise ValueError(f'Invalid email: {email}')
+    if not rls.is_valid(role):
+        raise ValueError(f'Invalid role: {role}')
+    manu_states = read_states([manu_id])
+    if not manu_states:
+        return False
+    curr_state = manu_states[str(manu_id)]
+    filt = state_filter(manu_id, curr_state)
+    filt[EDITOR_EMAIL_FLD] = {'$ne': email}
+    update_result = dbc.update_one(
+        MANUSCRIPTS_COLLECT, filt,
+        {PUSH: {f'{LATEST_VERSION}.{EDITORS}': {EDITOR_EMAIL: email,
+                                                EDITOR_ROLE: role}},
+         SET: new_token()})
+    if not update_result.modified_count:
+        return False
+    cntrs.record_editor_change(curr_state, email, 1)
+    return True
+
+
+def remove_editor(manu_id, email: str) -> bool:
+    """
+    Take an editor off a manuscript. Returns False if they weren't on it.
+    """
+    manu_states = read_states([manu_id])
+    if not manu_states:
+        return False
+    curr_state = manu_states[str(manu_id)]
+    filt = state_filter(manu_id, curr_state)
+    filt[EDITOR_EMAIL_FLD] = email
+    update_result = dbc.update_one(
+        MANUSCRIPTS_COLLECT, filt,
+        {'$pull': {f'{LATEST_VERSION}.{EDITORS}': {EDITOR_EMAIL: email}},
+         SET: new_token()})
+    if not update_result.modified_count:
+        return False
+    cntrs.record_editor_change(curr_state, email, -1)
+    return True
+
+
+@needs_indexes
+def read_editor_queue(email: str, states: list = None, page: int = 1,
+                      page_size: int = DEFAULT_PAGE_SIZE) -> dict:
+    """
+    One page of the manuscripts assigned to an editor, newest first,
+    optionally only those in the given states.
+    Served by the (editor email, state, created) index.
+    """
+    filt = {EDITOR_EMAIL_FLD: email}
+    if states:
+        filt[STATE_FLD] = {'$in': states}
+    return read_summary_page(filt, page, page_size,
+                             [(MANUSCRIPT_CREATED, -1)])
+
+
+@needs_indexes
+def read_manuscripts_by_author(author_name: str, page: int = 1,
+                               page_size: int = DEFAULT_PAGE_SIZE,
+                               ascending: bool = False) -> dict:
+    """
+    One page of an author's manuscripts, newest first unless
+    `ascending`. Served by the (author, created) index.
+    """
+    return read_summary_page({AUTHOR_NAME: author_name}, page, page_size,
+                             [(MANUSCRIPT_CREATED, 1 if ascending else -1),
+                              (MONGO_ID, 1 if ascending else -1)])
+
+
 def get_valid_actions(curr_state: str) -> list:
     return query.get_valid_actions_by_state(curr_state)
+
+
+def read_states(manu_ids: list) -> dict:
+    """
+    Return {id: state} for the given ids with one projected $in query.
+    Ids that aren't valid or don't exist are left out.
+    """
+    obj_ids = [ObjectId(manu_id) for manu_id in manu_ids
+               if ObjectId.is_valid(str(manu_id))]
+    if not obj_ids:
+        return {}
+    docs = dbc.read_many(MANUSCRIPTS_COLLECT,
+                         {MONGO_ID: {'$in': obj_ids}},
+                         projection={f"{LATEST_VERSION}.{STATE}": 1})
+    return {doc[MONGO_ID]: doc[LATEST_VERSION][STATE] for doc in docs}
@@ -0,0 +1,47 @@
+"""
+Migrations for manuscript data. See data/migrations.py.
+"""
+import data.manuscripts.archive as arch
+import data.manuscripts.manuscripts as ms
+import data.manuscripts.query as qry
+import data.migrations as mig
+
+# Manuscripts used to be created with the long state names from
+# states.py. Rewriting them to codes lets a state query be one exact
+# index match instead of an $in over every spelling.
+STATE_NAME_FILTER = {ms.STATE_FLD: {'$in': list(qry.STATE_NAME_TO_CODE)}}
+
+
+@mig.migration(1, ms.MANUSCRIPTS_COLLECT, STATE_NAME_FILTER,
+               projection={ms.STATE_FLD: 1})
+def state_names_to_codes(doc: dict) -> dict:
+    state = doc[ms.LATEST_VERSION][ms.STATE]
+    return {'$set': {ms.STATE_FLD: qry.STATE_NAME_TO_CODE[state]}}
+
+
+@mig.migration(2, arch.ARCHIVE_COLLECT, STATE_NAME_FILTER,
+               projection={ms.STATE_FLD: 1})
+def archived_state_names_to_codes(doc: dict) -> dict:
+    return state_names_to_codes(doc)
+
+
+# Editors used to be stored as {email: role}. As [{email, role}] the
+# emails can be indexed and an editor's queue read with one match.
+EDITORS_FLD = f'{ms.LATEST_VERSION}.{ms.EDITORS}'
+EDITOR_DICT_FILTER = {EDITORS_FLD: {'$exists': True,
+                                    '$not': {'$type': 'array'}}}
+
+
+@mig.migration(3, ms.MANUSCRIPTS_COLLECT, EDITOR_DICT_FILTER,
+               projection={EDITORS_FLD: 1})
+def editors_to_array(doc: dict) -> dict:
+    editors = doc[ms.LATEST_VERSION][ms.EDITORS] or {}
+    return {'$set': {EDITORS_FLD: [
+        {ms.EDITOR_EMAIL: email, ms.EDITOR_ROLE: role}
+        for email, role in editors.items()]}}
+
+
+@mig.migration(4, arch.ARCHIVE_COLLECT, EDITOR_DICT_FILTER,
+               projection={EDITORS_FLD: 1})
+def archived_editors_to_array(doc: dict) -> dict:
+    return editors_to_array(doc)
@@ -0,0 +1,311 @@
+"""
+Notify authors, editors and referees when a manuscript changes state.
+A state change pushes an event onto the manuscript's own outbox array
+in the same update that sets the new state, so there is no way to get
+one without the other. A worker (`python -m
+data.manuscripts.notifications`) then drains outboxes in batches into
+one notification per recipient and mails each recipient a digest of
+everything pending for them. Sending mail never happens in a request.
+
+The transport is chosen by the MAIL_METHOD environment variable:
+'file' (the default) appends to an mbox at MAIL_FILE, and 'smtp' sends
+through SMTP_HOST:SMTP_PORT, e.g. a local `aiosmtpd` debugging server.
+"""
+import argparse
+import mailbox
+import os
+import smtplib
+import time
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from functools import wraps
+
+from bson.objectid import ObjectId
+from pymongo import UpdateMany, UpdateOne
+
+import data.db_connect as dbc
+import data.manuscripts.manuscripts as ms
+import data.people as ppl
+
+NOTIFICATIONS_COLLECT = 'notifications'
+
+# event fields
+EVENT_ID = 'event_id'
+ACTION = 'action'
+OLD_STATE = 'old_state'
+NEW_STATE = 'new_state'
+AT = 'at'
+EDITORS = 'editors'
+REFEREES = 'referees'
+
+# notification fields
+RECIPIENT = 'recipient'
+MANU_ID = 'manu_id'
+EVENT = 'event'
+STATUS = 'status'
+ATTEMPTS = 'attempts'
+SENT_AT = 'sent_at'
+ERROR = 'error'
+
+# digest fields
+NOTES = 'notes'
+OLDEST = 'oldest'
+
+PENDING = 'pending'
+SENT = 'sent'
+FAILED = 'failed'
+
+BATCH_SIZE = 200
+DIGEST_WAIT_SECS = 60  # let a burst of changes pile up into one digest
+MAX_DIGEST_NOTES = 100  # any more wait for the next digest
+MAX_ATTEMPTS = 5
+POLL_SECS = 10
+
+MAIL_FROM = os.environ.get('MAIL_FROM', 'journal@localhost')
+MAIL_FILE = os.environ.get('MAIL_FILE', 'outbox.mbox')
+SMTP_HOST = os.environ.get('SMTP_HOST', 'localhost')
+SMTP_PORT = int(os.environ.get('SMTP_PORT', 1025))
+FILE_METHOD = 'file'
+SMTP_METHOD = 'smtp'
+
+indexed = False
+
+
+def get_outbox_event_fld() -> str:
+    return f'{ms.OUTBOX}.{EVENT_ID}'
+
+
+def needs_indexes(fn):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        global indexed
+        if not indexed:
+            # sparse, so only manuscripts with pending events are in it
+            dbc.create_index(ms.MANUSCRIPTS_COLLECT,
+                             [(get_outbox_event_fld(), 1)], sparse=True)
+            dbc.create_index(NOTIFICATIONS_COLLECT,
+                             [(STATUS, 1), (RECIPIENT, 1), (AT, 1)])
+            indexed = True
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+def make_event(manu: dict, old_state: str, new_state: str,
+               action: str, at: datetime = None) -> dict:
+    """
+    The outbox entry for one state change. It carries everything the
+    digest needs, so the worker never has to re-read the manuscript.
+    """
+    latest = manu[ms.LATEST_VERSION]
+    return {
+        EVENT_ID: ObjectId(),
+        AT: at or ms.get_est_time(),
+        ACTION: action,
+        OLD_STATE: old_state,
+        NEW_STATE: new_state,
+        ms.TITLE: latest.get(ms.TITLE),
+        ms.AUTHOR_NAME: manu.get(ms.AUTHOR_NAME),
+        EDITORS: ms.get_editor_emails(latest),
+        REFEREES: list(latest.get(ms.REFEREES, [])),
+    }
+
+
+def get_author_emails(names) -> dict:
+    """
+    {author name: email} for the authors we have a person record for.
+    """
+    names = list(set(names))
+    if not names:
+        return {}
+    return {person[ppl.NAME]: person[ppl.EMAIL]
+            for person in dbc.read_many(
+                ppl.PEOPLE_COLLECT, {ppl.NAME: {'$in': names}},
+                projection={ppl.NAME: 1, ppl.EMAIL: 1})}
+
+
+def get_recipients(event: dict, author_emails: dict) -> list:
+    recipients = [*event.get(EDITORS, []), *event.get(REFEREES, [])]
+    author_email = author_emails.get(event.get(ms.AUTHOR_NAME))
+    if author_email:
+        recipients.append(author_email)
+    return sorted({rcpt for rcpt in recipients if ppl.is_valid_email(rcpt)})
+
+
+def get_insert_op(event: dict, rcpt: str, manu_id) -> UpdateOne:
+    """
+    Create the notification of `event` for `rcpt` if it doesn't exist.
+    """
+    return UpdateOne(
+        {ms.MONGO_ID: f'{event[EVENT_ID]}:{rcpt}'},
+        {'$setOnInsert': {RECIPIENT: rcpt, MANU_ID: manu_id, AT: event[AT],
+                          EVENT: event, STATUS: PENDING, ATTEMPTS: 0}},
+        upsert=True)
+
+
+@needs_indexes
+def drain_outboxes(batch_size: int = BATCH_SIZE) -> int:
+    """
+    Move outbox events into per-recipient notifications.
+    Notification ids are derived from the event id and recipient, and
+    are only ever inserted, so if we die between the two writes (or two
+    drains overlap) the retry leaves notifications already there, sent
+    or not, as they are. Returns the number of events moved.
+    """
+    manus = dbc.read_many(ms.MANUSCRIPTS_COLLECT,
+                          {get_outbox_event_fld(): {'$exists': True}},
+                          projection={ms.OUTBOX: 1}, limit=batch_size)
+    events = [(manu[ms.MONGO_ID], event)
+              for manu in manus for event in manu[ms.OUTBOX]]
+    if not events:
+        return 0
+    author_emails = get_author_emails(
+        event.get(ms.AUTHOR_NAME) for _, event in events)
+    ops = []
+    for manu_id, event in events:
+        for rcpt in get_recipients(event, author_emails):
+            ops.append(get_insert_op(event, rcpt, manu_id))
+    dbc.bulk_write(NOTIFICATIONS_COLLECT, ops)
+    dbc.bulk_write(ms.MANUSCRIPTS_COLLECT, [
+        UpdateOne({ms.MONGO_ID: ObjectId(manu[ms.MONGO_ID])},
+                  {'$pull': {ms.OUTBOX: {EVENT_ID: {'$in': [
+                      event[EVENT_ID] for event in manu[ms.OUTBOX]]}}}})
+        for manu in manus])
+    return len(events)
+
+
+def format_digest(recipient: str, notes: list) -> EmailMessage:
+    msg = EmailMessage()
+    msg['From'] = MAIL_FROM
+    msg['To'] = recipient
+    if len(notes) == 1:
+        msg['Subject'] = f'Manuscript update: {notes[0][EVENT][ms.TITLE]}'
+    else:
+        msg['Subject'] = f'{len(notes)} manuscript updates'
+    lines = []
+    for note in notes:
+        event = note[EVENT]
+        lines.append(f'- "{event[ms.TITLE]}" by {event[ms.AUTHOR_NAME]}: '
+                     f'{event[OLD_STATE]} -> {event[NEW_STATE]} '
+                     f'({event[ACTION]}, {event[AT]:%Y-%m-%d %H:%M})')
+    msg.set_content('\n'.join(lines) + '\n')
+    return msg
+
+
+def send_file(msg: EmailMessage):
+    box = mailbox.mbox(MAIL_FILE)
+    box.lock()
+    try:
+        box.add(msg)
+        box.flush()
+    finally:
+        box.unlock()
+
+
+def send_smtp(msg: EmailMessage):
+    with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30) as smtp:
+        smtp.send_message(msg)
+
+
+TRANSPORTS = {
+    FILE_METHOD: send_file,
+    SMTP_METHOD: send_smtp,
+}
+
+
+def get_transport():
+    method = os.environ.get('MAIL_METHOD', FILE_METHOD)
+    if method not in TRANSPORTS:
+        raise ValueError(f'Unknown MAIL_METHOD {method!r}; use one of '
+                         f'{", ".join(TRANSPORTS)}')
+    return TRANSPORTS[method]
+
+
+def read_digests(after: str, cutoff: datetime,
+                 batch_size: int = BATCH_SIZE) -> list:
+    """
+    The next `batch_size` recipients, in email order after `after`,
+    whose oldest pending note is from before `cutoff`, as
+    [{_id: recipient, notes}] with up to MAX_DIGEST_NOTES notes each,
+    oldest first. Grouping by recipient means a busy recipient can't
+    crowd the rest out of a batch, nor be cut off part way.
+    """
+    filt = {STATUS: PENDING}
+    if after is not None:
+        filt[RECIPIENT] = {'$gt': after}
+    return dbc.aggregate(NOTIFICATIONS_COLLECT, [
+        {'$match': filt},
+        {'$sort': {RECIPIENT: 1, AT: 1}},
+        {'$group': {ms.MONGO_ID: f'${RECIPIENT}',
+                    OLDEST: {'$first': f'${AT}'},
+                    NOTES: {'$push': {ms.MONGO_ID: f'${ms.MONGO_ID}',
+                                      EVENT: f'${EVENT}',
+                                      ATTEMPTS: f'${ATTEMPTS}'}}}},
+        {'$match': {OLDEST: {'$lte': cutoff}}},
+        {'$sort': {ms.MONGO_ID: 1}},
+        {'$limit': batch_size},
+        {'$project': {NOTES: {'$slice': [f'${NOTES}', MAX_DIGEST_NOTES]}}},
+    ])
+
+
+@needs_indexes
+def send_digests(batch_size: int = BATCH_SIZE, transport=None,
+                 wait_secs: float = DIGEST_WAIT_SECS) -> int:
+    """
+    Mail each recipient one digest of their pending notifications,
+    `batch_size` recipients at a time.
+    Recipients whose oldest pending note is younger than `wait_secs`
+    are left for the next round, so quick successive changes go out
+    together. Returns the number of digests sent.
+    """
+    transport = transport or get_transport()
+    now = ms.get_est_time()
+    cutoff = now - timedelta(seconds=wait_secs)
+    sent = 0
+    after = None
+    while True:
+        digests = read_digests(after, cutoff, batch_size)
+        if not digests:
+            return sent
+        after = digests[-1][ms.MONGO_ID]
+        ops = []
+        for digest in digests:
+            rcpt, rcpt_notes = digest[ms.MONGO_ID], digest[NOTES]
+            ids = [note[ms.MONGO_ID] for note in rcpt_notes]
+            try:
+                transport(format_digest(rcpt, rcpt_notes))
+            except Exception as err:
+                attempts = rcpt_notes[0][ATTEMPTS] + 1
+                ops.append(UpdateMany(
+                    {ms.MONGO_ID: {'$in': ids}},
+                    {'$set': {ERROR: str(err),
+                              STATUS: (FAILED if attempts >= MAX_ATTEMPTS
+                                       else PENDING)},
+                     '$inc': {ATTEMPTS: 1}}))
+                continue
+            ops.append(UpdateMany({ms.MONGO_ID: {'$in': ids}},
+                                  {'$set': {STATUS: SENT, SENT_AT: now}}))
+            sent += 1
+        dbc.bulk_write(NOTIFICATIONS_COLLECT, ops)
+
+
+def work(poll_secs: float = POLL_SECS, once: bool = False):
+    while True:
+        moved = drain_outboxes()
+        sent = send_digests()
+        if moved or sent:
+            print(f'Moved {moved} events, sent {sent} digests.')
+        if once:
+            return
+        time.sleep(poll_secs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Send notifications.')
+    parser.add_argument('--once', action='store_true')
+    parser.add_argument('--poll', type=float, default=POLL_SECS)
+    args = parser.parse_args()
+    work(args.poll, once=args.once)
+
+
+if __name__ == '__main__':
+    main()
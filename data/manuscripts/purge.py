@@ -0,0 +1,187 @@
+"""
+Bulk purge of manuscripts and their history, e.g. test or spam
+submissions, live and archived. Matching manuscripts are walked in _id
+order a chunk at a time; each chunk is removed with one bulk write of
+deletes on the manuscripts and one delete_many on their history, their
+uploads go too, and the counters, referee workloads and duplicate
+signatures are adjusted with one bulk write each. A pause between
+chunks keeps a big purge from starving production traffic.
+  python -m data.manuscripts.purge --state WIT --older-than 90 --pause 0.5
+"""
+import argparse
+import time
+from datetime import timedelta
+
+from bson.objectid import ObjectId
+
+from pymongo import DeleteOne
+
+import data.db_connect as dbc
+import data.manuscripts.archive as arch
+import data.manuscripts.counters as cntrs
+import data.manuscripts.manuscripts as ms
+import data.manuscripts.query as qry
+import data.manuscripts.referees as refs
+import data.manuscripts.similarity as simlr
+import data.manuscripts.uploads as upl
+
+CHUNK_SIZE = 1000
+PAUSE_SECS = 0.0
+
+
+def purge_filter(states: list = None, before=None, author: str = None) -> dict:
+    """
+    Refuses an empty filter: purging everything is never what you meant.
+    """
+    filt = {}
+    if states:
+        bad = [state for state in states if not qry.is_valid_state(state)]
+        if bad:
+            raise ValueError(f'Invalid states: {bad}')
+        filt[ms.STATE_FLD] = {'$in': [alias for state in states
+                                      for alias in qry.STATE_ALIASES[state]]}
+    if before:
+        filt[ms.MANUSCRIPT_CREATED] = {'$lt': before}
+    if author:
+        filt[ms.AUTHOR_NAME] = author
+    if not filt:
+        raise ValueError('Give a state, age or author to purge by')
+    return filt
+
+
+def get_collections() -> list:
+    """
+    (manuscripts, their history) for the hot collections and the archive.
+    """
+    return [(ms.MANUSCRIPTS_COLLECT, ms.MANUSCRIPT_HISTORY_COLLECT),
+            (arch.ARCHIVE_COLLECT, arch.HISTORY_ARCHIVE_COLLECT)]
+
+
+def read_chunk(filt: dict, after: ObjectId, size: int,
+               collection: str = ms.MANUSCRIPTS_COLLECT) -> list:
+    if after:
+        filt = {**filt, ms.MONGO_ID: {'$gt': after}}
+    return dbc.read_many(collection, filt,
+                         projection={ms.STATE_FLD: 1,
+                                     f'{ms.LATEST_VERSION}.{ms.EDITORS}': 1,
+                                     ms.REFEREES_FLD: 1,
+                                     f'{ms.LATEST_VERSION}.'
+                                     f'{ms.LAST_TRANSITION}': 1,
+                                     ms.MANUSCRIPT_HISTORY_FK: 1},
+                         sort=[(ms.MONGO_ID, 1)], limit=size)
+
+
+def unchanged(filt: dict, doc: dict) -> dict:
+    """
+    Matches a manuscript only if it still matches the purge filter and
+    nothing has been written to it since `doc` was read: every change
+    stamps a new token.
+    """
+    latest = doc[ms.LATEST_VERSION]
+    return {**filt,
+            ms.MONGO_ID: ObjectId(doc[ms.MONGO_ID]),
+            ms.STATE_FLD: latest[ms.STATE],
+            f'{ms.LATEST_VERSION}.{ms.LAST_TRANSITION}':
+                latest.get(ms.LAST_TRANSITION)}
+
+
+def purge_chunk(filt: dict, chunk: list,
+                collection: str = ms.MANUSCRIPTS_COLLECT,
+                history_collection: str = ms.MANUSCRIPT_HISTORY_COLLECT
+                ) -> int:
+    """
+    Delete one chunk and undo its effect on the derived collections.
+    Each manuscript is deleted only if it is just as it was read, so
+    the counters come off the state it was actually deleted in, and one
+    that changed or stopped matching in between is kept.
+    Returns the number deleted.
+    """
+    manu_ids = [ObjectId(doc[ms.MONGO_ID]) for doc in chunk]
+    result = dbc.bulk_write(collection, [DeleteOne(unchanged(filt, doc))
+                                         for doc in chunk])
+    deleted = result.deleted_count if result else 0
+    if deleted < len(chunk):
+        kept = {doc[ms.MONGO_ID] for doc in dbc.read_many(
+            collection, {ms.MONGO_ID: {'$in': manu_ids}},
+            projection={ms.MONGO_ID: 1})}
+        chunk = [doc for doc in chunk if doc[ms.MONGO_ID] not in kept]
+        manu_ids = [ObjectId(doc[ms.MONGO_ID]) for doc in chunk]
+    dbc.delete_many(history_collection, {ms.MONGO_ID: {'$in': [
+        ms.create_mongo_id_object(doc[ms.MANUSCRIPT_HISTORY_FK])
+        for doc in chunk if doc.get(ms.MANUSCRIPT_HISTORY_FK)]}})
+    latests = [doc[ms.LATEST_VERSION] for doc in chunk]
+    cntrs.record_deletes((latest[ms.STATE], ms.get_editor_emails(latest))
+                         for latest in latests)
+    # referees only count against a manuscript while it is in review;
+    # leaving review already released the rest
+    refs.record_transitions((latest[ms.STATE], None, None,
+                             latest.get(ms.REFEREES, []), [])
+                            for latest in latests
+                            if refs.is_in_review(latest[ms.STATE]))
+    simlr.remove_manuscripts(manu_ids)
+    upl.delete_manuscript_uploads(manu_ids)
+    return deleted
+
+
+def purge(states: list = None, before=None, author: str = None,
+          chunk_size: int = CHUNK_SIZE, pause_secs: float = PAUSE_SECS,
+          progress=None) -> int:
+    """
+    Delete every manuscript matching the filter, live or archived, with
+    its history. `progress(done, total)` is called after each chunk.
+    Returns the number deleted.
+    """
+    filt = purge_filter(states, before, author)
+    total = count_matching(filt)
+    done = 0
+    for collection, history_collection in get_collections():
+        last_id = None
+        while True:
+            chunk = read_chunk(filt, last_id, chunk_size, collection)
+            if not chunk:
+                break
+            last_id = ObjectId(chunk[-1][ms.MONGO_ID])
+            done += purge_chunk(filt, chunk, collection, history_collection)
+            if progress:
+                progress(done, total)
+            if pause_secs:
+                time.sleep(pause_secs)
+    return done
+
+
+def count_matching(filt: dict) -> int:
+    return sum(dbc.count(collection, filt)
+               for collection, _ in get_collections())
+
+
+def print_progress(done: int, total: int):
+    print(f'Purged {done}/{total} manuscripts.')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Delete manuscripts and their history in bulk.')
+    parser.add_argument('--state', action='append',
+                        help='State code to purge; repeat for more')
+    parser.add_argument('--older-than', type=float, metavar='DAYS',
+                        help='Only manuscripts submitted this long ago')
+    parser.add_argument('--author')
+    parser.add_argument('--chunk', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--pause', type=float, default=PAUSE_SECS,
+                        help='Seconds to sleep between chunks')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Just count what would be purged')
+    args = parser.parse_args()
+    before = None
+    if args.older_than is not None:
+        before = ms.get_est_time() - timedelta(days=args.older_than)
+    if args.dry_run:
+        filt = purge_filter(args.state, before, args.author)
+        print(f'Would purge {count_matching(filt)} manuscripts.')
+        return
+    purge(args.state, before, args.author, chunk_size=args.chunk,
+          pause_secs=args.pause, progress=print_progress)
+
+
+if __name__ == '__main__':
+    main()
@@ -75,6 +75,7 @@ VALID_ACTIONS = [
     DONE,
     REJECT,
     WITHDRAW,
+    EDITOR_MOVE,
 ]
 
 
@@ -91,7 +92,7 @@ def assign_ref(manu: dict, ref: str, **kwargs) -> str:
     return IN_REF_REV
 
 
-def delete_ref(manu: dict, ref: str) -> str:
+def delete_ref(manu: dict, ref: str, **kwargs) -> str:
     if len(manu[flds.REFEREES]) > 0:
         manu[flds.REFEREES].remove(ref)
     if len(manu[flds.REFEREES]) > 0:
@@ -101,87 +102,211 @@ def delete_ref(manu: dict, ref: str) -> str:
 
 
 def handle_editor_move(**kwargs):
-    return kwargs.get("target_state", SUBMITTED)
+    target_state = kwargs.get("target_state") or SUBMITTED
+    if target_state not in STATE_INDEX:
+        raise ValueError(f'Bad target state: {target_state}')
+    return STATES[STATE_INDEX[target_state]]
 
 
+# An action either always lands in one TARGET state, or runs FUNC,
+# which must return one of its declared TARGETS.
 FUNC = 'f'
+TARGET = 'target'
+TARGETS = 'targets'
+
+# Editors can move a manuscript anywhere, so these are left out when
+# checking that the normal workflow hangs together.
+OVERRIDE_ACTIONS = [EDITOR_MOVE]
+TERMINAL_STATES = [PUBLISHED, REJECTED, WITHDRAWN]
 
 COMMON_ACTIONS = {
-    WITHDRAW: {
-        FUNC: lambda **kwargs: WITHDRAWN,
-    },
+    WITHDRAW: {TARGET: WITHDRAWN},
+}
+
+EDITOR_ACTIONS = {
+    EDITOR_MOVE: {FUNC: handle_editor_move, TARGETS: VALID_STATES},
 }
 
 STATE_TABLE = {
     SUBMITTED: {
-        ASSIGN_REF: {FUNC: assign_ref},
-        REJECT: {FUNC: lambda **kwargs: REJECTED},
-        EDITOR_MOVE: {FUNC: handle_editor_move},
+        ASSIGN_REF: {FUNC: assign_ref, TARGETS: [IN_REF_REV]},
+        REJECT: {TARGET: REJECTED},
+        **EDITOR_ACTIONS,
         **COMMON_ACTIONS,
     },
     IN_REF_REV: {
-        ASSIGN_REF: {FUNC: assign_ref},
-        DELETE_REF: {FUNC: delete_ref},
-        ACCEPT: {FUNC: lambda **kwargs: COPY_EDIT},
-        ACCWITHREV: {FUNC: lambda **kwargs: AUTHOR_REVISIONS},
-        REJECT: {FUNC: lambda **kwargs: REJECTED},
-        EDITOR_MOVE: {FUNC: handle_editor_move},
+        ASSIGN_REF: {FUNC: assign_ref, TARGETS: [IN_REF_REV]},
+        DELETE_REF: {FUNC: delete_ref, TARGETS: [IN_REF_REV, SUBMITTED]},
+        ACCEPT: {TARGET: COPY_EDIT},
+        ACCWITHREV: {TARGET: AUTHOR_REVISIONS},
+        REJECT: {TARGET: REJECTED},
+        **EDITOR_ACTIONS,
         **COMMON_ACTIONS,
     },
     AUTHOR_REVISIONS: {
-        DONE: {FUNC: lambda **kwargs: EDITOR_REVIEW},
-        EDITOR_MOVE: {FUNC: handle_editor_move},
+        DONE: {TARGET: EDITOR_REVIEW},
+        **EDITOR_ACTIONS,
         **COMMON_ACTIONS,
     },
     EDITOR_REVIEW: {
-        ACCEPT: {FUNC: lambda **kwargs: COPY_EDIT},
-        EDITOR_MOVE: {FUNC: handle_editor_move},
+        ACCEPT: {TARGET: COPY_EDIT},
+        **EDITOR_ACTIONS,
         **COMMON_ACTIONS,
     },
     COPY_EDIT: {
-        DONE: {FUNC: lambda **kwargs: AUTHOR_REV},
-        EDITOR_MOVE: {FUNC: handle_editor_move},
+        DONE: {TARGET: AUTHOR_REV},
+        **EDITOR_ACTIONS,
         **COMMON_ACTIONS,
     },
     AUTHOR_REV: {
-        DONE: {FUNC: lambda **kwargs: FORMATTING},
-        EDITOR_MOVE: {FUNC: handle_editor_move},
+        DONE: {TARGET: FORMATTING},
+        **EDITOR_ACTIONS,
         **COMMON_ACTIONS,
     },
     FORMATTING: {
-        DONE: {FUNC: lambda **kwargs: PUBLISHED},
-        EDITOR_MOVE: {FUNC: handle_editor_move},
+        DONE: {TARGET: PUBLISHED},
+        **EDITOR_ACTIONS,
         **COMMON_ACTIONS,
     },
     REJECTED: {
-        EDITOR_MOVE: {FUNC: handle_editor_move},
+        **EDITOR_ACTIONS,
         **COMMON_ACTIONS,
     },
     WITHDRAWN: {
-        EDITOR_MOVE: {FUNC: handle_editor_move},
+        **EDITOR_ACTIONS,
         **COMMON_ACTIONS,
     },
     PUBLISHED: {
-        EDITOR_MOVE: {FUNC: handle_editor_move},
+        **EDITOR_ACTIONS,
     },
 }
 
 
-def get_valid_actions_by_state(state: str):
-    valid_actions = STATE_TABLE[state].keys()
-    print(f'{valid_actions=}')
-    return valid_actions
+def get_targets(entry: dict) -> list:
+    if TARGET in entry:
+        return [entry[TARGET]]
+    return list(entry[TARGETS])
+
+
+def get_next_states(table: dict) -> dict:
+    """
+    Where each state can go in the normal workflow (no overrides).
+    """
+    return {
+        state: sorted({target
+                       for action, entry in actions.items()
+                       if action not in OVERRIDE_ACTIONS
+                       for target in get_targets(entry)})
+        for state, actions in table.items()
+    }
+
+
+def get_reachable(next_states: dict, start: str) -> set:
+    reachable = {start}
+    todo = [start]
+    while todo:
+        for target in next_states[todo.pop()]:
+            if target not in reachable:
+                reachable.add(target)
+                todo.append(target)
+    return reachable
+
+
+def check_table(table: dict, start: str = SUBMITTED,
+                terminals: list = TERMINAL_STATES):
+    """
+    Raise ValueError if the workflow definition is broken: unknown or
+    missing states, bad entries, states the start can't reach, or
+    non-terminal states with no way out.
+    """
+    if set(table) != set(VALID_STATES):
+        raise ValueError('STATE_TABLE states do not match VALID_STATES: '
+                         f'{sorted(set(table) ^ set(VALID_STATES))}')
+    for state, actions in table.items():
+        for action, entry in actions.items():
+            if action not in VALID_ACTIONS:
+                raise ValueError(f'Unknown action {action} in {state}')
+            if (TARGET in entry) == (FUNC in entry):
+                raise ValueError(f'{state}/{action} needs either '
+                                 f'{TARGET} or {FUNC} with {TARGETS}')
+            if FUNC in entry and not entry.get(TARGETS):
+                raise ValueError(f'{state}/{action} has no {TARGETS}')
+            for target in get_targets(entry):
+                if target not in table:
+                    raise ValueError(f'{state}/{action} goes to unknown '
+                                     f'state {target}')
+    next_states = get_next_states(table)
+    unreachable = set(table) - get_reachable(next_states, start)
+    if unreachable:
+        raise ValueError(f'States unreachable from {start}: '
+                         f'{sorted(unreachable)}')
+    for state in table:
+        if state in terminals:
+            continue
+        if not set(terminals) & get_reachable(next_states, state):
+            raise ValueError(f'Dead state {state}: it can never finish')
+
+
+def compile_table(table: dict) -> tuple:
+    """
+    Turn the table into integer codes and a dense state x action grid.
+    Each cell is None (not allowed), an int (the target state's index)
+    or the function to call.
+    """
+    check_table(table)
+    states = tuple(table)
+    actions = tuple(VALID_ACTIONS)
+    state_index = {state: i for i, state in enumerate(states)}
+    # Stored manuscripts may still carry the long-form state names.
+    for name, code in STATE_NAME_TO_CODE.items():
+        state_index[name] = state_index[code]
+    action_index = {action: i for i, action in enumerate(actions)}
+    transitions = []
+    for state in states:
+        row = [None] * len(actions)
+        for action, entry in table[state].items():
+            if TARGET in entry:
+                row[action_index[action]] = state_index[entry[TARGET]]
+            else:
+                row[action_index[action]] = entry[FUNC]
+        transitions.append(tuple(row))
+    return states, actions, state_index, action_index, tuple(transitions)
+
+
+STATES, ACTIONS, STATE_INDEX, ACTION_INDEX, TRANSITIONS = \
+    compile_table(STATE_TABLE)
+
+VALID_ACTIONS_BY_STATE = {
+    state: tuple(action for action in STATE_TABLE[STATES[i]])
+    for state, i in STATE_INDEX.items()
+}
 
+NEXT_STATES = get_next_states(STATE_TABLE)
 
-def handle_action(curr_state, action, **kwargs) -> str:
-    # Convert to FSM-recognized code if it's a long-form string
-    curr_state = STATE_NAME_TO_CODE.get(curr_state, curr_state)
+# Every spelling of each state that stored manuscripts may use.
+STATE_ALIASES = {
+    state: [state] + [name for name, code in STATE_NAME_TO_CODE.items()
+                      if code == state]
+    for state in STATES
+}
+
+
+def get_valid_actions_by_state(state: str) -> tuple:
+    return VALID_ACTIONS_BY_STATE[state]
 
-    if curr_state not in STATE_TABLE:
+
+def handle_action(curr_state, action, **kwargs) -> str:
+    state_i = STATE_INDEX.get(curr_state)
+    if state_i is None:
         raise ValueError(f'Bad state: {curr_state}')
-    if action not in STATE_TABLE[curr_state]:
-        raise ValueError(f'Invalid action {action} for state {curr_state}')
-    return STATE_TABLE[curr_state][action][FUNC](**kwargs)
+    action_i = ACTION_INDEX.get(action)
+    nxt = None if action_i is None else TRANSITIONS[state_i][action_i]
+    if nxt is None:
+        raise ValueError(f'Invalid action {action} '
+                         f'for state {STATES[state_i]}')
+    if type(nxt) is int:
+        return STATES[nxt]
+    return nxt(**kwargs)
 
 
 def main():
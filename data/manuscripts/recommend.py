@@ -0,0 +1,399 @@
+"""
+Recommend referees for a manuscript from its text.
+Every referee has a TF-IDF profile: the summed term frequencies of the
+manuscripts they have refereed. Words are hashed into N_FEATURES
+columns, so the profiles are one dense NumPy matrix and ranking all
+referees is a single matrix-vector product.
+
+Building the model reads the text of every manuscript, so it is never
+done in a request: the jobs worker (or `python -m
+data.manuscripts.recommend`) builds it and saves it to MODEL_COLLECT.
+Each server process serves the model it has in memory, stale or not,
+and kept current as manuscripts are created and referees assigned.
+Every RELOAD_SECS a background thread loads a newer saved model if
+there is one, and queues a rebuild once the saved one is more than
+REBUILD_SECS old. Until the first load, recommend() returns nothing.
+A load swaps the new model in under `lock`, which every reader and
+writer of the model also takes, so recommend() never sees half a model.
+"""
+import re
+import threading
+import time
+import zlib
+from datetime import datetime
+from functools import wraps
+
+import numpy as np
+from bson.objectid import ObjectId
+
+import data.db_connect as dbc
+import data.jobs as jobs
+import data.manuscripts.archive as arch
+import data.manuscripts.manuscripts as ms
+import data.people as ppl
+import data.roles as rls
+
+N_FEATURES = 2 ** 12
+REBUILD_SECS = 60 * 60  # queue a rebuild once the saved model is this old
+RELOAD_SECS = 5 * 60  # how often to look for a newer saved model
+DEFAULT_K = 5
+MIN_ROWS = 64  # profile rows to allocate up front
+
+EMAIL = 'email'
+SCORE = 'score'
+
+REBUILD_MODEL = 'rebuild_referee_model'  # job kind
+
+# One MODEL_ID doc describes the current build; each referee's profile
+# is a doc of its own, tagged with the build it belongs to.
+MODEL_COLLECT = 'referee_model'
+MODEL_ID = 'model'
+BUILD = 'build'
+BUILT_AT = 'built_at'
+NUM_DOCS = 'num_docs'
+DOC_FREQ = 'doc_freq'
+REFEREES = 'referees'
+NUM_PROFILES = 'num_profiles'
+PROFILE = 'profile'
+
+WORD_RE = re.compile(r'[a-z]{3,}')
+
+lock = threading.Lock()
+emails = []  # row number -> referee email
+rows = {}  # referee email -> row number
+referees = set()  # who had the referee role at the last build
+profiles = np.zeros((0, N_FEATURES), dtype=np.float32)
+norms = np.zeros(0, dtype=np.float32)
+doc_freq = np.zeros(N_FEATURES, dtype=np.float32)
+num_docs = 0
+built_at = None  # when the model in memory was built
+checked_at = None  # when we last looked for a newer one
+refreshing = False
+
+model_indexed = False
+
+
+def needs_model(fn):
+    """
+    Look for a newer model in the background every RELOAD_SECS; the
+    call itself goes ahead with the model we have.
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if checked_at is None or time.time() - checked_at > RELOAD_SECS:
+            refresh_in_background()
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+def needs_model_index(fn):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        global model_indexed
+        if not model_indexed:
+            dbc.create_index(MODEL_COLLECT, [(BUILD, 1)])
+            model_indexed = True
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+def get_term_freqs(text: str) -> np.ndarray:
+    """
+    Sublinear (1 + log) term frequencies of `text`, hashed.
+    """
+    words = WORD_RE.findall((text or '').lower())
+    cols = np.fromiter((zlib.crc32(word.encode()) % N_FEATURES
+                        for word in words), dtype=np.int64, count=len(words))
+    counts = np.bincount(cols, minlength=N_FEATURES).astype(np.float32)
+    nonzero = counts > 0
+    counts[nonzero] = 1 + np.log(counts[nonzero])
+    return counts
+
+
+def get_idf() -> np.ndarray:
+    return (np.log((1 + num_docs) / (1 + doc_freq)) + 1).astype(np.float32)
+
+
+def refresh_norms(row_nums=None):
+    """
+    Recompute the TF-IDF norms of some (default: all) profiles.
+    Call with the lock held.
+    """
+    global norms
+    idf = get_idf()
+    if row_nums is None:
+        norms = np.zeros(len(profiles), dtype=np.float32)
+        norms[:len(emails)] = np.linalg.norm(profiles[:len(emails)] * idf,
+                                             axis=1)
+    else:
+        norms[row_nums] = np.linalg.norm(profiles[row_nums] * idf, axis=1)
+
+
+def get_row(email: str) -> int:
+    """
+    The profile row for a referee, adding one if they're new.
+    Rows grow by doubling so adding referees is amortised O(1).
+    Call with the lock held.
+    """
+    global profiles, norms
+    if email not in rows:
+        if len(emails) == len(profiles):
+            size = max(MIN_ROWS, 2 * len(profiles))
+            grown = np.zeros((size, N_FEATURES), dtype=np.float32)
+            grown[:len(profiles)] = profiles
+            profiles = grown
+            norms = np.resize(norms, size)
+        rows[email] = len(emails)
+        emails.append(email)
+        norms[rows[email]] = 0
+    return rows[email]
+
+
+def get_referee_emails() -> set:
+    return {person[ppl.EMAIL] for person in dbc.read_many(
+        ppl.PEOPLE_COLLECT, {ppl.ROLES: rls.RE_CODE},
+        projection={ppl.EMAIL: 1})}
+
+
+def read_manuscripts():
+    """
+    Yield the text and referees of every manuscript, live and archived
+    (finished manuscripts are most of what a referee has read), one at
+    a time off the cursors.
+    """
+    projection = {ms.TEXT_FLD: 1, ms.REFEREES_FLD: 1}
+    for collection in (ms.MANUSCRIPTS_COLLECT, arch.ARCHIVE_COLLECT):
+        yield from dbc.read_iter(collection, {}, projection=projection,
+                                 raw=True)
+
+
+def install(new_emails: list, new_profiles: np.ndarray,
+            new_doc_freq: np.ndarray, new_num_docs: int,
+            new_referees: set, new_built_at: float):
+    """
+    Swap a whole model in for the one in memory.
+    """
+    global emails, rows, referees, profiles, doc_freq, num_docs, built_at
+    padded = np.zeros((max(MIN_ROWS, len(new_emails)), N_FEATURES),
+                      dtype=np.float32)
+    padded[:len(new_emails)] = new_profiles
+    with lock:
+        emails = list(new_emails)
+        rows = {email: row for row, email in enumerate(emails)}
+        referees = set(new_referees)
+        profiles = padded
+        doc_freq = new_doc_freq
+        num_docs = new_num_docs
+        refresh_norms()
+        built_at = new_built_at
+
+
+@needs_model_index
+def save(new_emails: list, new_profiles: np.ndarray,
+         new_doc_freq: np.ndarray, new_num_docs: int, new_referees: set):
+    """
+    Store a model as the current build. Its profiles go in first and
+    the model doc is pointed at them last, so loaders never see a
+    build without its profiles; the old build's are then dropped.
+    """
+    build_id = ObjectId()
+    if new_emails:
+        dbc.create_many(MODEL_COLLECT, [
+            {BUILD: build_id, EMAIL: email, PROFILE: profile.tobytes()}
+            for email, profile in zip(new_emails, new_profiles)])
+    dbc.update_one(MODEL_COLLECT, {dbc.MONGO_ID: MODEL_ID},
+                   {'$set': {BUILD: build_id,
+                             BUILT_AT: datetime.now(),
+                             NUM_DOCS: new_num_docs,
+                             DOC_FREQ: new_doc_freq.tobytes(),
+                             REFEREES: sorted(new_referees),
+                             NUM_PROFILES: len(new_emails)}},
+                   upsert=True)
+    dbc.delete_many(MODEL_COLLECT, {BUILD: {'$ne': build_id}})
+
+
+def build() -> dict:
+    """
+    Build the whole model in one pass over the manuscripts, and save
+    it. This is slow: run it in the jobs worker or from the CLI.
+    """
+    new_referees = get_referee_emails()
+    freqs_by_ref = {}  # referee email -> summed term frequencies
+    new_doc_freq = np.zeros(N_FEATURES, dtype=np.float32)
+    new_num_docs = 0
+    for manu in read_manuscripts():
+        latest = manu.get(ms.LATEST_VERSION, {})
+        freqs = get_term_freqs(latest.get(ms.TEXT))
+        new_doc_freq += freqs > 0
+        new_num_docs += 1
+        for ref in latest.get(ms.REFEREES, []):
+            if ref in new_referees:
+                if ref in freqs_by_ref:
+                    freqs_by_ref[ref] += freqs
+                else:
+                    freqs_by_ref[ref] = freqs.copy()
+    new_emails = list(freqs_by_ref)
+    new_profiles = np.zeros((len(new_emails), N_FEATURES), dtype=np.float32)
+    for row, email in enumerate(new_emails):
+        new_profiles[row] = freqs_by_ref[email]
+    save(new_emails, new_profiles, new_doc_freq, new_num_docs, new_referees)
+    return {REFEREES: len(new_emails), NUM_DOCS: new_num_docs}
+
+
+def load() -> dict:
+    """
+    Install the saved model if it is newer than ours. Returns the saved
+    model's doc, or None if nothing has been saved yet.
+    """
+    model = dbc.read_one(MODEL_COLLECT, {dbc.MONGO_ID: MODEL_ID})
+    if not model:
+        return None
+    saved_at = model[BUILT_AT].timestamp()
+    if built_at is not None and saved_at <= built_at:
+        return model
+    new_emails = []
+    new_profiles = np.zeros((model[NUM_PROFILES], N_FEATURES),
+                            dtype=np.float32)
+    for doc in dbc.read_iter(MODEL_COLLECT, {BUILD: model[BUILD],
+                                             EMAIL: {'$exists': True}}):
+        if len(new_emails) == len(new_profiles):
+            break
+        new_profiles[len(new_emails)] = np.frombuffer(doc[PROFILE],
+                                                      dtype=np.float32)
+        new_emails.append(doc[EMAIL])
+    if len(new_emails) != model[NUM_PROFILES]:
+        return model  # replaced by a newer build as we read; next time
+    install(new_emails, new_profiles,
+            np.frombuffer(model[DOC_FREQ], dtype=np.float32).copy(),
+            model[NUM_DOCS], set(model[REFEREES]), saved_at)
+    return model
+
+
+def queue_rebuild():
+    """
+    Queue a rebuild job, unless one is already waiting or running.
+    """
+    if not dbc.count(jobs.JOBS_COLLECT, {
+            jobs.KIND: REBUILD_MODEL,
+            jobs.STATUS: {'$in': [jobs.QUEUED, jobs.RUNNING]}}):
+        jobs.enqueue(REBUILD_MODEL)
+
+
+def refresh():
+    """
+    Load a newer saved model, and queue a rebuild if the saved one is
+    missing or too old.
+    """
+    global checked_at, refreshing
+    try:
+        model = load()
+        if (not model
+                or time.time() - model[BUILT_AT].timestamp() > REBUILD_SECS):
+            queue_rebuild()
+    finally:
+        with lock:
+            checked_at = time.time()
+            refreshing = False
+
+
+def refresh_in_background():
+    """
+    Start refresh() on a thread of its own, unless one is running or
+    another caller got there first.
+    """
+    global refreshing
+    with lock:
+        if refreshing or (checked_at is not None
+                          and time.time() - checked_at <= RELOAD_SECS):
+            return
+        refreshing = True
+    threading.Thread(target=refresh, daemon=True).start()
+
+
+def add_manuscript(text: str):
+    """
+    A manuscript was created: count its words toward the IDF.
+    Profile norms catch up with the IDF at the next rebuild.
+    """
+    global doc_freq, num_docs
+    if built_at is None:
+        return
+    freqs = get_term_freqs(text)
+    with lock:
+        doc_freq += freqs > 0
+        num_docs += 1
+
+
+def add_review(email: str, text: str):
+    """
+    A referee was assigned a manuscript: fold it into their profile.
+    """
+    if built_at is None or email not in referees:
+        return
+    freqs = get_term_freqs(text)
+    with lock:
+        row = get_row(email)
+        profiles[row] += freqs
+        refresh_norms([row])
+
+
+def add_reviews(assignments):
+    """
+    Fold many (email, manuscript id) assignments in, fetching all their
+    texts with one $in read.
+    """
+    assignments = list(assignments)
+    if built_at is None or not assignments:
+        return
+    texts = {manu[ms.MONGO_ID]: manu[ms.LATEST_VERSION].get(ms.TEXT)
+             for manu in dbc.read_many(
+                 ms.MANUSCRIPTS_COLLECT,
+                 {ms.MONGO_ID: {'$in': [ms.create_mongo_id_object(manu_id)
+                                        for _, manu_id in assignments]}},
+                 projection={ms.TEXT_FLD: 1})}
+    for email, manu_id in assignments:
+        if str(manu_id) in texts:
+            add_review(email, texts[str(manu_id)])
+
+
+def mark_stale():
+    """
+    Look for a newer saved model on next use, e.g. after a rebuild.
+    """
+    global checked_at
+    checked_at = None
+
+
+@needs_model
+def recommend(text: str, k: int = DEFAULT_K, exclude=()) -> list:
+    """
+    The k referees whose past manuscripts read most like `text`, as
+    [{email, score}] with cosine scores, best first.
+    """
+    freqs = get_term_freqs(text)
+    with lock:
+        idf = get_idf()
+        query = freqs * idf
+        query_norm = np.linalg.norm(query)
+        num = len(emails)
+        if not num or not query_norm:
+            return []
+        scores = profiles[:num] @ (query * idf)
+        scores /= np.maximum(norms[:num], 1e-9) * query_norm
+        for email in exclude:
+            if email in rows:
+                scores[rows[email]] = -1
+        k = min(k, num)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [{EMAIL: emails[row], SCORE: float(scores[row])}
+                for row in top if scores[row] > 0]
+
+
+def main():
+    built = build()
+    print(f'{built[REFEREES]} referees, {built[NUM_DOCS]} manuscripts.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""
+Referee workload: how many reviews each referee has on their plate.
+Active and completed review counts live in the referee_workload
+collection and are bumped with $inc whenever a transition adds or
+removes referees, so suggesting a referee never scans manuscripts.
+"""
+from datetime import timedelta
+from functools import wraps
+
+from pymongo import UpdateOne
+
+import data.db_connect as dbc
+import data.manuscripts.manuscripts as ms
+import data.manuscripts.query as qry
+import data.people as ppl
+import data.roles as rls
+
+WORKLOAD_COLLECT = 'referee_workload'
+
+ACTIVE = 'active'
+COMPLETED = 'completed'
+RECENT = 'recent'  # times of the latest completions, newest last
+RECENT_COMPLETIONS = 'recent_completions'
+WORKLOAD = 'workload'
+
+RECENT_KEEP = 20
+RECENT_DAYS = 90
+DEFAULT_SUGGESTIONS = 5
+MAX_SUGGESTIONS = 50
+
+# Leaving review with one of these means the referees did their job.
+REVIEW_DONE_ACTIONS = [qry.ACCEPT, qry.ACCWITHREV, qry.REJECT]
+
+indexed = False
+
+
+def needs_indexes(fn):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        global indexed
+        if not indexed:
+            ms.ensure_indexes()
+            dbc.create_index(ppl.PEOPLE_COLLECT, [(ppl.ROLES, 1)])
+            indexed = True
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+def is_in_review(state: str) -> bool:
+    return qry.STATE_NAME_TO_CODE.get(state, state) == qry.IN_REF_REV
+
+
+def workload_ops(old_state: str, new_state: str, action: str,
+                 old_refs: list, new_refs: list) -> list:
+    """
+    The counter updates one transition implies.
+    """
+    ops = []
+    for ref in set(new_refs) - set(old_refs):
+        ops.append(UpdateOne({ms.MONGO_ID: ref},
+                             {'$inc': {ACTIVE: 1}},
+                             upsert=True))
+    for ref in set(old_refs) - set(new_refs):
+        ops.append(UpdateOne({ms.MONGO_ID: ref}, {'$inc': {ACTIVE: -1}}))
+    # an editor can move a manuscript back into review with its
+    # referees still on it; they are busy again
+    if not is_in_review(old_state) and is_in_review(new_state):
+        for ref in set(old_refs) & set(new_refs):
+            ops.append(UpdateOne({ms.MONGO_ID: ref},
+                                 {'$inc': {ACTIVE: 1}},
+                                 upsert=True))
+    leaving_review = is_in_review(old_state) and not is_in_review(new_state)
+    if leaving_review:
+        finished = action in REVIEW_DONE_ACTIONS
+        for ref in set(old_refs) & set(new_refs):
+            update = {'$inc': {ACTIVE: -1}}
+            if finished:
+                update['$inc'][COMPLETED] = 1
+                update['$push'] = {RECENT: {'$each': [ms.get_est_time()],
+                                            '$slice': -RECENT_KEEP}}
+            ops.append(UpdateOne({ms.MONGO_ID: ref}, update))
+    return ops
+
+
+def record_transitions(moves):
+    """
+    Apply many (old_state, new_state, action, old_refs, new_refs)
+    moves in one bulk write.
+    """
+    ops = []
+    for move in moves:
+        ops.extend(workload_ops(*move))
+    return dbc.bulk_write(WORKLOAD_COLLECT, ops)
+
+
+def record_transition(old_state: str, new_state: str, action: str,
+                      old_refs: list, new_refs: list):
+    return record_transitions(
+        [(old_state, new_state, action, old_refs, new_refs)])
+
+
+def workload_stages(days: int = RECENT_DAYS) -> list:
+    """
+    Pipeline stages that join each person to their workload.
+    """
+    since = ms.get_est_time() - timedelta(days=days)
+    return [
+        {'$lookup': {'from': WORKLOAD_COLLECT,
+                     'localField': ppl.EMAIL,
+                     'foreignField': ms.MONGO_ID,
+                     'as': WORKLOAD}},
+        {'$set': {WORKLOAD: {'$ifNull': [{'$first': f'${WORKLOAD}'}, {}]}}},
+        {'$project': {
+            ms.MONGO_ID: 0,
+            ppl.NAME: 1,
+            ppl.EMAIL: 1,
+            ppl.AFFILIATION: 1,
+            ACTIVE: {'$ifNull': [f'${WORKLOAD}.{ACTIVE}', 0]},
+            COMPLETED: {'$ifNull': [f'${WORKLOAD}.{COMPLETED}', 0]},
+            RECENT_COMPLETIONS: {'$size': {'$filter': {
+                'input': {'$ifNull': [f'${WORKLOAD}.{RECENT}', []]},
+                'cond': {'$gte': ['$$this', since]},
+            }}},
+        }},
+    ]
+
+
+@needs_indexes
+def suggest_referees(count: int = DEFAULT_SUGGESTIONS,
+                     exclude: list = None) -> list:
+    """
+    The least-loaded people with the referee role, in one aggregation.
+    Ties go to whoever has finished fewer reviews lately.
+    """
+    count = min(MAX_SUGGESTIONS, max(1, int(count)))
+    match = {ppl.ROLES: rls.RE_CODE}
+    if exclude:
+        match[ppl.EMAIL] = {'$nin': list(exclude)}
+    pipeline = [{'$match': match}, *workload_stages(),
+                {'$sort': {ACTIVE: 1, RECENT_COMPLETIONS: 1, ppl.EMAIL: 1}},
+                {'$limit': count}]
+    return dbc.aggregate(ppl.PEOPLE_COLLECT, pipeline)
+
+
+def get_workload(email: str) -> dict:
+    rows = dbc.aggregate(ppl.PEOPLE_COLLECT,
+                         [{'$match': {ppl.EMAIL: email}}, *workload_stages()])
+    if rows:
+        return rows[0]
+    return None
+
+
+@needs_indexes
+def reconcile() -> int:
+    """
+    Recount active reviews from the manuscripts themselves.
+    Completions can't be recovered this way and are left alone.
+    """
+    rows = dbc.aggregate(ms.MANUSCRIPTS_COLLECT, [
+        {'$match': {ms.STATE_FLD: {'$in': qry.STATE_ALIASES[qry.IN_REF_REV]}}},
+        {'$unwind': f'${ms.REFEREES_FLD}'},
+        {'$group': {ms.MONGO_ID: f'${ms.REFEREES_FLD}', ACTIVE: {'$sum': 1}}},
+    ])
+    active = {row[ms.MONGO_ID]: row[ACTIVE] for row in rows}
+    ops = [UpdateOne({ms.MONGO_ID: ref}, {'$set': {ACTIVE: cnt}},
+                     upsert=True)
+           for ref, cnt in active.items()]
+    ops += [UpdateOne({ms.MONGO_ID: doc[ms.MONGO_ID]}, {'$set': {ACTIVE: 0}})
+            for doc in dbc.read_many(WORKLOAD_COLLECT, {ACTIVE: {'$ne': 0}},
+                                     projection={ms.MONGO_ID: 1})
+            if doc[ms.MONGO_ID] not in active]
+    dbc.bulk_write(WORKLOAD_COLLECT, ops)
+    return len(active)
+
+
+def main():
+    print(f'Reconciled {reconcile()} referees.')
+    print(suggest_referees())
+
+
+if __name__ == '__main__':
+    main()
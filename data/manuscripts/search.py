@@ -0,0 +1,145 @@
+"""
+Ranked full-text search over manuscripts.
+Backed by a Mongo text index on author, title and body text, so
+create_manuscript() and update_manuscript() keep it current for free.
+"""
+import inspect
+import re
+from functools import wraps
+
+import data.db_connect as dbc
+import data.manuscripts.manuscripts as ms
+
+SEARCH_INDEX = 'manuscript_search'
+SCORE = 'score'
+SNIPPET = 'snippet'
+TOTAL = ms.TOTAL
+PAGE = ms.PAGE
+PAGE_SIZE = ms.PAGE_SIZE
+RESULTS = ms.RESULTS
+
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = ms.MAX_PAGE_SIZE
+SNIPPET_LEN = 160
+
+TITLE_FLD = f'{ms.LATEST_VERSION}.{ms.TITLE}'
+TEXT_FLD = ms.TEXT_FLD
+STATE_FLD = ms.STATE_FLD
+
+# A title hit should outrank an author hit, which outranks a body hit.
+INDEX_WEIGHTS = {
+    TITLE_FLD: 10,
+    ms.AUTHOR_NAME: 5,
+    TEXT_FLD: 1,
+}
+
+WORD_RE = re.compile(r'\w+')
+
+indexed_dbs = set()
+
+
+def ensure_index(db=dbc.SE_DB):
+    """
+    Mongo allows only one text index per collection, so this is it.
+    """
+    dbc.create_index(
+        ms.MANUSCRIPTS_COLLECT,
+        [(fld, 'text') for fld in INDEX_WEIGHTS],
+        db=db,
+        name=SEARCH_INDEX,
+        weights=INDEX_WEIGHTS,
+    )
+    indexed_dbs.add(db)
+
+
+def needs_index(fn):
+    """
+    Build the text index in the `db` that fn is called with, however
+    it is passed, the first time that db is used.
+    """
+    sig = inspect.signature(fn)
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        bound = sig.bind(*args, **kwargs)
+        db = bound.arguments.get('db', dbc.SE_DB)
+        if db not in indexed_dbs:
+            ensure_index(db)
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+def get_terms(query: str) -> list:
+    return WORD_RE.findall(query.lower())
+
+
+def make_snippet(text: str, terms: list, length: int = SNIPPET_LEN) -> str:
+    """
+    Return a window of `text` around the earliest hit of any term.
+    """
+    if not text:
+        return ''
+    lowered = text.lower()
+    hits = [pos for pos in (lowered.find(term) for term in terms)
+            if pos >= 0]
+    start = 0
+    if hits:
+        start = max(0, min(hits) - length // 4)
+    end = min(len(text), start + length)
+    snippet = text[start:end].strip()
+    if start > 0:
+        snippet = '...' + snippet
+    if end < len(text):
+        snippet = snippet + '...'
+    return snippet
+
+
+@needs_index
+def search(query: str, page: int = 1, page_size: int = DEFAULT_PAGE_SIZE,
+           db=dbc.SE_DB) -> dict:
+    """
+    Search manuscripts, best match first.
+    Only one page of documents is ever pulled from the DB.
+    """
+    terms = get_terms(query)
+    page, page_size = ms.clamp_page(page, page_size)
+    ret = {TOTAL: 0, PAGE: page, PAGE_SIZE: page_size, RESULTS: []}
+    if not terms:
+        return ret
+    filt = {'$text': {'$search': query}}
+    score = {'$meta': 'textScore'}
+    docs = dbc.read_many(
+        ms.MANUSCRIPTS_COLLECT,
+        filt,
+        db=db,
+        projection={
+            SCORE: score,
+            ms.AUTHOR_NAME: 1,
+            TITLE_FLD: 1,
+            TEXT_FLD: 1,
+            STATE_FLD: 1,
+        },
+        sort=[(SCORE, score)],
+        skip=(page - 1) * page_size,
+        limit=page_size,
+    )
+    ret[TOTAL] = dbc.count(ms.MANUSCRIPTS_COLLECT, filt, db=db)
+    for doc in docs:
+        latest = doc.get(ms.LATEST_VERSION, {})
+        ret[RESULTS].append({
+            ms.MONGO_ID: doc[ms.MONGO_ID],
+            ms.AUTHOR_NAME: doc.get(ms.AUTHOR_NAME),
+            ms.TITLE: latest.get(ms.TITLE),
+            ms.STATE: latest.get(ms.STATE),
+            SCORE: doc[SCORE],
+            SNIPPET: make_snippet(latest.get(ms.TEXT, ''), terms),
+        })
+    return ret
+
+
+def main():
+    print(search('manuscript'))
+
+
+if __name__ == '__main__':
+    main()
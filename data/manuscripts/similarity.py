@@ -0,0 +1,196 @@
+"""
+Near-duplicate manuscript detection with MinHash and LSH.
+Each manuscript's text is cut into overlapping word shingles and
+summarised as a MinHash signature: for each of NUM_PERM hash functions,
+the smallest hash of any shingle. Two signatures agree in a position
+with probability equal to the Jaccard similarity of the shingle sets.
+Signatures are split into BANDS bands of ROWS values, and each band is
+hashed to a key. Manuscripts that share any band key are candidates, so
+a lookup is one indexed $in query, not a pass over every stored text;
+the candidates sharing the most bands are compared first.
+"""
+import hashlib
+import re
+import zlib
+from functools import wraps
+
+import numpy as np
+from pymongo import ReplaceOne
+
+import data.db_connect as dbc
+import data.manuscripts.manuscripts as ms
+
+SIGNATURES_COLLECT = 'manuscript_signatures'
+
+BANDS_FLD = 'bands'
+BAND_HITS = 'band_hits'
+SIGNATURE = 'signature'
+SIMILARITY = 'similarity'
+MANU_ID = 'manu_id'
+
+SHINGLE_WORDS = 5
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS  # (1 / BANDS) ** (1 / ROWS) ~ 0.71 is the knee
+DUP_THRESHOLD = 0.8
+MAX_CANDIDATES = 200
+SHINGLE_CHUNK = 4096  # shingles hashed at a time: 4MB of uint64s
+SEED = 1
+
+# h(x) = (a * x + b) % PRIME. With a, b, x all below 2**32 the
+# product never overflows a uint64.
+PRIME = np.uint64((1 << 32) - 5)
+_rng = np.random.default_rng(SEED)
+PERM_A = _rng.integers(1, PRIME, size=NUM_PERM, dtype=np.uint64)
+PERM_B = _rng.integers(0, PRIME, size=NUM_PERM, dtype=np.uint64)
+
+WORD_RE = re.compile(r'\w+')
+
+indexed = False
+
+
+def needs_index(fn):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        global indexed
+        if not indexed:
+            dbc.create_index(SIGNATURES_COLLECT, [(BANDS_FLD, 1)])
+            indexed = True
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+def get_shingles(text: str, k: int = SHINGLE_WORDS) -> np.ndarray:
+    """
+    32-bit hashes of every run of k words, lowercased.
+    Texts shorter than k words are one shingle.
+    """
+    words = WORD_RE.findall((text or '').lower())
+    if not words:
+        return np.zeros(0, dtype=np.uint64)
+    runs = range(max(1, len(words) - k + 1))
+    hashes = {zlib.crc32(' '.join(words[i:i + k]).encode()) for i in runs}
+    return np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+
+
+def get_signature(text: str) -> np.ndarray:
+    """
+    The MinHash signature of a text, or None if it has no words.
+    """
+    shingles = get_shingles(text)
+    if not len(shingles):
+        return None
+    signature = np.full(NUM_PERM, PRIME, dtype=np.uint64)
+    # hashing every shingle at once would take NUM_PERM * 8 bytes per
+    # shingle; a chunk at a time keeps it to a few MB for any text
+    for start in range(0, len(shingles), SHINGLE_CHUNK):
+        chunk = shingles[start:start + SHINGLE_CHUNK]
+        hashed = (PERM_A[:, None] * chunk[None, :] + PERM_B[:, None]) % PRIME
+        np.minimum(signature, hashed.min(axis=1), out=signature)
+    return signature
+
+
+def get_band_keys(signature: np.ndarray) -> list:
+    return [f'{band}:' + hashlib.blake2b(
+                signature[band * ROWS:(band + 1) * ROWS].tobytes(),
+                digest_size=8).hexdigest()
+            for band in range(BANDS)]
+
+
+def estimate_similarity(sig_a, sig_b) -> float:
+    return float(np.mean(np.asarray(sig_a) == np.asarray(sig_b)))
+
+
+@needs_index
+def find_similar(signature: np.ndarray, exclude_id=None,
+                 threshold: float = DUP_THRESHOLD) -> list:
+    """
+    Stored manuscripts whose estimated similarity to `signature` is at
+    least `threshold`, most similar first, as [{manu_id, similarity}].
+    Only the MAX_CANDIDATES sharing the most bands are compared.
+    """
+    keys = get_band_keys(signature)
+    filt = {BANDS_FLD: {'$in': keys}}
+    if exclude_id is not None:
+        filt[dbc.MONGO_ID] = {'$ne': exclude_id}
+    ret = []
+    for doc in dbc.aggregate(SIGNATURES_COLLECT, [
+        {'$match': filt},
+        {'$project': {SIGNATURE: 1, BAND_HITS: {
+            '$size': {'$setIntersection': [f'${BANDS_FLD}', keys]}}}},
+        {'$sort': {BAND_HITS: -1, dbc.MONGO_ID: 1}},
+        {'$limit': MAX_CANDIDATES},
+    ]):
+        similarity = estimate_similarity(signature, doc[SIGNATURE])
+        if similarity >= threshold:
+            ret.append({MANU_ID: doc[dbc.MONGO_ID], SIMILARITY: similarity})
+    return sorted(ret, key=lambda dup: -dup[SIMILARITY])
+
+
+def find_duplicates(text: str, threshold: float = DUP_THRESHOLD) -> list:
+    signature = get_signature(text)
+    if signature is None:
+        return []
+    return find_similar(signature, threshold=threshold)
+
+
+@needs_index
+def index_manuscript(manu_id, text: str) -> list:
+    """
+    Store (or replace) a manuscript's signature and return the
+    near-duplicates it already has.
+    """
+    signature = get_signature(text)
+    if signature is None:
+        remove_manuscript(manu_id)
+        return []
+    duplicates = find_similar(signature, exclude_id=manu_id)
+    dbc.bulk_write(SIGNATURES_COLLECT, [signature_op(manu_id, signature)])
+    return duplicates
+
+
+def signature_op(manu_id, signature: np.ndarray) -> ReplaceOne:
+    return ReplaceOne({dbc.MONGO_ID: manu_id},
+                      {BANDS_FLD: get_band_keys(signature),
+                       SIGNATURE: signature.astype(np.int64).tolist()},
+                      upsert=True)
+
+
+@needs_index
+def index_manuscripts(manus) -> int:
+    """
+    Store the signatures of many (manu_id, text) pairs with one bulk
+    write, without looking for duplicates. For bulk loads.
+    Returns the number stored.
+    """
+    ops = []
+    for manu_id, text in manus:
+        signature = get_signature(text)
+        if signature is not None:
+            ops.append(signature_op(manu_id, signature))
+    if ops:
+        dbc.bulk_write(SIGNATURES_COLLECT, ops)
+    return len(ops)
+
+
+def remove_manuscript(manu_id):
+    return dbc.delete(SIGNATURES_COLLECT, {dbc.MONGO_ID: manu_id})
+
+
+def remove_manuscripts(manu_ids: list) -> int:
+    return dbc.delete_many(SIGNATURES_COLLECT,
+                           {dbc.MONGO_ID: {'$in': list(manu_ids)}})
+
+
+def main():
+    indexed_count = 0
+    for manu in dbc.read_many(ms.MANUSCRIPTS_COLLECT, {},
+                              projection={ms.TEXT_FLD: 1}):
+        text = manu.get(ms.LATEST_VERSION, {}).get(ms.TEXT)
+        index_manuscript(ms.create_mongo_id_object(manu[ms.MONGO_ID]), text)
+        indexed_count += 1
+    print(f'Indexed {indexed_count} manuscripts.')
+
+
+if __name__ == '__main__':
+    main()
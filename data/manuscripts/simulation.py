@@ -0,0 +1,286 @@
+"""
+Simulate the manuscript workflow to forecast queue depths.
+Every synthetic manuscript is one slot in a few NumPy arrays: its state
+code (an index into query.STATES), the day it leaves that state, and
+the days it was submitted and decided. Each simulated day moves every
+manuscript whose dwell time is up in one vectorised step.
+Transition odds and mean dwell times are estimated from the last
+year of manuscript history; a state with too few exits on record
+keeps the defaults below.
+"""
+from datetime import timedelta
+
+import numpy as np
+
+import data.db_connect as dbc
+import data.manuscripts.counters as cntrs
+import data.manuscripts.manuscripts as ms
+import data.manuscripts.query as qry
+
+DEFAULT_DAYS = 91  # one quarter
+DEFAULT_ARRIVALS_PER_DAY = 20.0
+DEFAULT_DWELL_SHAPE = 2.0  # gamma shape: 1 is memoryless, higher is tighter
+
+# Mean days a manuscript sits in each non-terminal state.
+DEFAULT_DWELL_DAYS = {
+    qry.SUBMITTED: 7,
+    qry.IN_REF_REV: 35,
+    qry.AUTHOR_REVISIONS: 28,
+    qry.EDITOR_REVIEW: 7,
+    qry.COPY_EDIT: 14,
+    qry.AUTHOR_REV: 7,
+    qry.FORMATTING: 10,
+}
+
+# Where manuscripts go when they leave each state.
+DEFAULT_TRANSITION_PROBS = {
+    qry.SUBMITTED: {qry.IN_REF_REV: .80, qry.REJECTED: .15,
+                    qry.WITHDRAWN: .05},
+    qry.IN_REF_REV: {qry.COPY_EDIT: .20, qry.AUTHOR_REVISIONS: .40,
+                     qry.REJECTED: .35, qry.WITHDRAWN: .05},
+    qry.AUTHOR_REVISIONS: {qry.EDITOR_REVIEW: .90, qry.WITHDRAWN: .10},
+    qry.EDITOR_REVIEW: {qry.COPY_EDIT: .95, qry.WITHDRAWN: .05},
+    qry.COPY_EDIT: {qry.AUTHOR_REV: 1.0},
+    qry.AUTHOR_REV: {qry.FORMATTING: 1.0},
+    qry.FORMATTING: {qry.PUBLISHED: 1.0},
+}
+
+HISTORY_DAYS = 365  # how far back estimates look
+MIN_EXITS = 30  # exits a state needs before its estimates are trusted
+SECS_PER_DAY = 24 * 60 * 60
+
+# exit keys
+FROM = 'from'
+TO = 'to'
+COUNT = 'count'
+TOTAL_SECS = 'total_secs'
+
+# Reaching any of these ends the editorial decision.
+DECISION_STATES = [qry.COPY_EDIT, qry.REJECTED, qry.WITHDRAWN]
+
+NUM_STATES = len(qry.STATES)
+SUBMITTED_CODE = qry.STATE_INDEX[qry.SUBMITTED]
+NOT_DECIDED = -1
+
+# result keys
+STATES = 'states'
+OCCUPANCY = 'occupancy'
+TIME_TO_DECISION = 'time_to_decision'
+UNDECIDED = 'undecided'
+
+
+def build_transition_matrix(probs: dict) -> np.ndarray:
+    """
+    Turn {state: {next_state: p}} into cumulative rows indexed by state
+    code. Only moves the FSM allows are accepted.
+    """
+    cum = np.ones((NUM_STATES, NUM_STATES))
+    for state, row in probs.items():
+        if state not in qry.NEXT_STATES:
+            raise ValueError(f'Bad state: {state}')
+        for target in row:
+            if target not in qry.NEXT_STATES[state]:
+                raise ValueError(f'The workflow has no move from {state} '
+                                 f'to {target}')
+        if not np.isclose(sum(row.values()), 1.0):
+            raise ValueError(f'Probabilities out of {state} must sum to 1')
+        dense = np.zeros(NUM_STATES)
+        for target, prob in row.items():
+            dense[qry.STATE_INDEX[target]] = prob
+        cum[qry.STATE_INDEX[state]] = np.cumsum(dense)
+    return cum
+
+
+def build_dwell_means(dwell_days: dict, probs: dict) -> np.ndarray:
+    """
+    Mean dwell per state code. States with no way out dwell forever.
+    """
+    means = np.full(NUM_STATES, np.inf)
+    for state in probs:
+        if state not in dwell_days:
+            raise ValueError(f'No dwell time for {state}')
+        means[qry.STATE_INDEX[state]] = dwell_days[state]
+    return means
+
+
+def sample_next(rng, cum: np.ndarray, codes: np.ndarray) -> np.ndarray:
+    draws = rng.random(len(codes))
+    return (draws[:, None] >= cum[codes]).sum(axis=1).astype(codes.dtype)
+
+
+def sample_leave_day(rng, means: np.ndarray, codes: np.ndarray,
+                     day: float, shape: float) -> np.ndarray:
+    mean = means[codes]
+    finite = np.isfinite(mean)
+    leave = np.full(len(codes), np.inf)
+    leave[finite] = day + rng.gamma(shape, mean[finite] / shape)
+    return leave
+
+
+def get_initial_codes(initial: dict) -> np.ndarray:
+    """
+    Expand {state: count} into an array of state codes.
+    Long-form state names are fine.
+    """
+    parts = [np.full(count, qry.STATE_INDEX[state], dtype=np.int8)
+             for state, count in initial.items() if count]
+    if not parts:
+        return np.zeros(0, dtype=np.int8)
+    return np.concatenate(parts)
+
+
+def read_exits(days: int = HISTORY_DAYS) -> list:
+    """
+    How often manuscripts moved between each pair of states in the last
+    `days` days, and how long they had sat in the first one:
+    [{_id: {from, to}, count, total_secs}].
+    """
+    since = ms.get_est_time() - timedelta(days=days)
+    return dbc.aggregate(ms.MANUSCRIPT_HISTORY_COLLECT, [
+        {'$match': {ms.HISTORY_AT_FLD: {'$gte': since}}},
+        {'$unwind': f'${ms.HISTORY}'},
+        {'$match': {
+            ms.HISTORY_AT_FLD: {'$gte': since},
+            f'{ms.HISTORY}.{ms.HIST_ENTERED}': {'$ne': None},
+            '$expr': {'$ne': [f'${ms.HISTORY}.{ms.HIST_FROM}',
+                              f'${ms.HISTORY}.{ms.HIST_TO}']},
+        }},
+        {'$group': {
+            ms.MONGO_ID: {FROM: f'${ms.HISTORY}.{ms.HIST_FROM}',
+                          TO: f'${ms.HISTORY}.{ms.HIST_TO}'},
+            COUNT: {'$sum': 1},
+            TOTAL_SECS: {'$sum': {'$divide': [
+                {'$subtract': [f'${ms.HISTORY}.{ms.HIST_AT}',
+                               f'${ms.HISTORY}.{ms.HIST_ENTERED}']},
+                1000]}},
+        }},
+    ])
+
+
+def estimate_params(exits: list, min_exits: int = MIN_EXITS) -> tuple:
+    """
+    (probs, dwell_days) from read_exits() rows. Moves the workflow
+    doesn't allow (editor overrides) are left out. States with fewer
+    than `min_exits` exits keep the defaults.
+    """
+    counts = {}
+    secs = {}
+    for row in exits:
+        old = qry.STATE_NAME_TO_CODE.get(row[ms.MONGO_ID][FROM],
+                                         row[ms.MONGO_ID][FROM])
+        new = qry.STATE_NAME_TO_CODE.get(row[ms.MONGO_ID][TO],
+                                         row[ms.MONGO_ID][TO])
+        if (old not in DEFAULT_TRANSITION_PROBS
+                or new not in qry.NEXT_STATES[old]):
+            continue
+        targets = counts.setdefault(old, {})
+        targets[new] = targets.get(new, 0) + row[COUNT]
+        secs[old] = secs.get(old, 0) + max(0, row[TOTAL_SECS])
+    probs = dict(DEFAULT_TRANSITION_PROBS)
+    dwell_days = dict(DEFAULT_DWELL_DAYS)
+    for state, targets in counts.items():
+        total = sum(targets.values())
+        if total < min_exits:
+            continue
+        probs[state] = {target: cnt / total
+                        for target, cnt in targets.items()}
+        dwell_days[state] = secs[state] / total / SECS_PER_DAY
+    return probs, dwell_days
+
+
+def estimate_from_history(days: int = HISTORY_DAYS) -> tuple:
+    return estimate_params(read_exits(days))
+
+
+def simulate(days: int = DEFAULT_DAYS,
+             arrivals_per_day: float = DEFAULT_ARRIVALS_PER_DAY,
+             initial: dict = None,
+             probs: dict = None,
+             dwell_days: dict = None,
+             dwell_shape: float = DEFAULT_DWELL_SHAPE,
+             seed: int = None) -> dict:
+    """
+    Run the workflow forward `days` days.
+    `initial` is the current {state: count}, e.g. from
+    counters.get_counts(). New submissions arrive as a Poisson process.
+    Returns the per-day occupancy of every state and the days from
+    submission to decision for manuscripts submitted in the run.
+    """
+    rng = np.random.default_rng(seed)
+    probs = probs or DEFAULT_TRANSITION_PROBS
+    cum = build_transition_matrix(probs)
+    means = build_dwell_means(dwell_days or DEFAULT_DWELL_DAYS, probs)
+    decision = np.zeros(NUM_STATES, dtype=bool)
+    decision[[qry.STATE_INDEX[state] for state in DECISION_STATES]] = True
+
+    arrivals = rng.poisson(arrivals_per_day, size=days)
+    codes = get_initial_codes(initial or {})
+    num = len(codes) + int(arrivals.sum())
+    state = np.empty(num, dtype=np.int8)
+    leave_day = np.empty(num)
+    submitted_day = np.full(num, NOT_DECIDED, dtype=np.int32)
+    decided_day = np.full(num, NOT_DECIDED, dtype=np.int32)
+
+    active = len(codes)
+    state[:active] = codes
+    leave_day[:active] = sample_leave_day(rng, means, codes, 0, dwell_shape)
+    occupancy = np.zeros((days + 1, NUM_STATES), dtype=np.int64)
+    occupancy[0] = np.bincount(state[:active], minlength=NUM_STATES)
+
+    for day in range(1, days + 1):
+        new = arrivals[day - 1]
+        if new:
+            state[active:active + new] = SUBMITTED_CODE
+            submitted_day[active:active + new] = day
+            leave_day[active:active + new] = sample_leave_day(
+                rng, means, state[active:active + new], day, dwell_shape)
+            active += new
+        moving = np.flatnonzero(leave_day[:active] <= day)
+        if len(moving):
+            next_codes = sample_next(rng, cum, state[moving])
+            state[moving] = next_codes
+            leave_day[moving] = sample_leave_day(rng, means, next_codes,
+                                                 day, dwell_shape)
+            decided = moving[decision[next_codes]
+                             & (decided_day[moving] == NOT_DECIDED)]
+            decided_day[decided] = day
+        occupancy[day] = np.bincount(state[:active], minlength=NUM_STATES)
+
+    tracked = submitted_day[:active] != NOT_DECIDED
+    done = tracked & (decided_day[:active] != NOT_DECIDED)
+    return {
+        STATES: list(qry.STATES),
+        OCCUPANCY: occupancy,
+        TIME_TO_DECISION: (decided_day[:active][done]
+                           - submitted_day[:active][done]),
+        UNDECIDED: int((tracked & ~done).sum()),
+    }
+
+
+def get_occupancy_series(result: dict) -> dict:
+    """
+    {state: [count on day 0, day 1, ...]} for JSON or plotting.
+    """
+    return {state: result[OCCUPANCY][:, i].tolist()
+            for i, state in enumerate(result[STATES])}
+
+
+def get_decision_percentiles(result: dict, pcts=(50, 90, 95)) -> dict:
+    times = result[TIME_TO_DECISION]
+    if not len(times):
+        return {pct: None for pct in pcts}
+    return {pct: float(np.percentile(times, pct)) for pct in pcts}
+
+
+def main():
+    probs, dwell_days = estimate_from_history()
+    result = simulate(initial=cntrs.get_counts(), probs=probs,
+                      dwell_days=dwell_days)
+    final = result[OCCUPANCY][-1]
+    for i, state in enumerate(result[STATES]):
+        print(f'{state}: {final[i]}')
+    print(f'Days to decision: {get_decision_percentiles(result)}')
+
+
+if __name__ == '__main__':
+    main()
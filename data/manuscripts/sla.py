@@ -0,0 +1,358 @@
+"""
+Time-in-state SLA analytics: median and p90 time manuscripts spend in
+a state, by editor and month.
+Every transition appends an entry to the manuscript's history doc
+saying when the manuscript entered the state it is leaving. refresh()
+reduces the entries written since the last run with $group and folds
+them into the sla_time_in_state collection, one doc per (state, editor,
+month) holding a count, a total and a histogram of durations on
+log-spaced buckets. Percentiles are read off the histograms, so
+answering a query touches a handful of small docs.
+The high-water mark lives in analytics_meta. rebuild() starts over.
+"""
+import argparse
+import math
+import re
+from datetime import datetime, timedelta
+from functools import wraps
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+import data.db_connect as dbc
+import data.manuscripts.archive as arch
+import data.manuscripts.manuscripts as ms
+import data.manuscripts.query as qry
+
+SLA_COLLECT = 'sla_time_in_state'
+META_COLLECT = 'analytics_meta'
+SLA_META_ID = 'sla'
+HWM = 'hwm'
+PENDING = 'pending'
+SINCE = 'since'
+UNTIL = 'until'
+APPLIED = 'applied'
+APPLIED_KEEP = 20  # windows each summary doc remembers
+
+STATE = 'state'
+EDITOR = 'editor'
+MONTH = 'month'
+COUNT = 'count'
+TOTAL_SECS = 'total_secs'
+BUCKETS = 'buckets'
+BUCKET = 'bucket'
+SECS = 'secs'
+MEDIAN_DAYS = 'median_days'
+P90_DAYS = 'p90_days'
+MEAN_DAYS = 'mean_days'
+MONTHS = 'months'
+ALL_EDITORS = ''
+MONTH_RE = re.compile(r'\d{4}-\d{2}')
+
+TRACKED_STATES = [qry.IN_REF_REV, qry.AUTHOR_REVISIONS, qry.COPY_EDIT]
+
+# Bucket 0 is anything under an hour; after that each bucket is 2^(1/4)
+# (about 19%) wider than the last, so a percentile is off by at most ~9%.
+BUCKET_BASE_SECS = 3600
+BUCKETS_PER_DOUBLING = 4
+N_BUCKETS = 64  # the last one holds everything over ~7 years
+SECS_PER_DAY = 24 * 60 * 60
+
+# History entries are written just after their timestamp is taken, so
+# only fold in entries old enough that none can still be in flight.
+SETTLE_SECS = 60
+EPOCH = datetime(1970, 1, 1)
+
+indexed = False
+
+
+def needs_indexes(fn):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        global indexed
+        if not indexed:
+            dbc.create_index(ms.MANUSCRIPT_HISTORY_COLLECT,
+                             [(ms.HISTORY_AT_FLD, 1)])
+            dbc.create_index(SLA_COLLECT,
+                             [(EDITOR, 1), (STATE, 1), (MONTH, 1)],
+                             unique=True)
+            indexed = True
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+def get_bucket(secs: float) -> int:
+    if secs < BUCKET_BASE_SECS:
+        return 0
+    bucket = 1 + int(math.log2(secs / BUCKET_BASE_SECS)
+                     * BUCKETS_PER_DOUBLING)
+    return min(bucket, N_BUCKETS - 1)
+
+
+def bucket_mid_secs(bucket: int) -> float:
+    """
+    The geometric middle of a bucket, which is what we report for it.
+    """
+    if bucket == 0:
+        return BUCKET_BASE_SECS / 2
+    low = BUCKET_BASE_SECS * 2 ** ((bucket - 1) / BUCKETS_PER_DOUBLING)
+    return low * 2 ** (0.5 / BUCKETS_PER_DOUBLING)
+
+
+def percentile_secs(buckets: dict, count: int, pct: float) -> float:
+    """
+    Walk a {bucket: count} histogram up to the pct'th entry.
+    """
+    if count <= 0:
+        return None
+    rank = max(1, math.ceil(count * pct / 100))
+    seen = 0
+    for bucket in sorted(buckets, key=int):
+        seen += buckets[bucket]
+        if seen >= rank:
+            return bucket_mid_secs(int(bucket))
+    return bucket_mid_secs(N_BUCKETS - 1)
+
+
+def to_days(secs: float) -> float:
+    if secs is None:
+        return None
+    return round(secs / SECS_PER_DAY, 2)
+
+
+def get_stats(count: int, total_secs: float, buckets: dict) -> dict:
+    return {
+        COUNT: count,
+        MEDIAN_DAYS: to_days(percentile_secs(buckets, count, 50)),
+        P90_DAYS: to_days(percentile_secs(buckets, count, 90)),
+        MEAN_DAYS: to_days(total_secs / count if count else None),
+    }
+
+
+def bucket_expr(secs) -> dict:
+    """
+    get_bucket() as an aggregation expression.
+    """
+    return {'$cond': [
+        {'$lt': [secs, BUCKET_BASE_SECS]},
+        0,
+        {'$min': [N_BUCKETS - 1, {'$add': [1, {'$floor': {'$multiply': [
+            {'$log': [{'$divide': [secs, BUCKET_BASE_SECS]}, 2]},
+            BUCKETS_PER_DOUBLING]}}]}]},
+    ]}
+
+
+def entry_stages(since: datetime, until: datetime) -> list:
+    """
+    Stages that turn history docs into the entries with since < at <=
+    until that end a stay. The first $match uses the multikey index to
+    skip history docs with nothing new in them. Moves that stay in the
+    same state (e.g. another referee) don't end the stay.
+    """
+    window = {'$gt': since, '$lte': until}
+    return [
+        {'$match': {ms.HISTORY_AT_FLD: window}},
+        {'$unwind': f'${ms.HISTORY}'},
+        {'$match': {
+            ms.HISTORY_AT_FLD: window,
+            f'{ms.HISTORY}.{ms.HIST_ENTERED}': {'$ne': None},
+            '$expr': {'$ne': [f'${ms.HISTORY}.{ms.HIST_FROM}',
+                              f'${ms.HISTORY}.{ms.HIST_TO}']},
+        }},
+        {'$replaceRoot': {'newRoot': f'${ms.HISTORY}'}},
+    ]
+
+
+def group_stages() -> list:
+    """
+    Stages that reduce entries to one row per (state, editor, month,
+    bucket), with a count and total seconds. An entry counts against
+    the month the manuscript left the state, and against every editor
+    on it as well as ALL_EDITORS.
+    """
+    return [
+        {'$project': {
+            STATE: f'${ms.HIST_FROM}',
+            MONTH: {'$dateToString': {'format': '%Y-%m',
+                                      'date': f'${ms.HIST_AT}'}},
+            EDITOR: {'$concatArrays': [
+                [ALL_EDITORS], {'$ifNull': [f'${ms.HIST_EDITORS}', []]}]},
+            SECS: {'$max': [0, {'$divide': [
+                {'$subtract': [f'${ms.HIST_AT}', f'${ms.HIST_ENTERED}']},
+                1000]}]},
+        }},
+        {'$set': {BUCKET: bucket_expr(f'${SECS}')}},
+        {'$unwind': f'${EDITOR}'},
+        {'$group': {
+            ms.MONGO_ID: {STATE: f'${STATE}', EDITOR: f'${EDITOR}',
+                          MONTH: f'${MONTH}', BUCKET: f'${BUCKET}'},
+            COUNT: {'$sum': 1},
+            TOTAL_SECS: {'$sum': f'${SECS}'},
+        }},
+    ]
+
+
+def read_rows(since: datetime, until: datetime) -> list:
+    """
+    Grouped rows for the window, from live and archived history alike.
+    """
+    return dbc.aggregate(ms.MANUSCRIPT_HISTORY_COLLECT, [
+        *entry_stages(since, until),
+        {'$unionWith': {'coll': arch.HISTORY_ARCHIVE_COLLECT,
+                        'pipeline': entry_stages(since, until)}},
+        *group_stages(),
+    ])
+
+
+def summarize(rows) -> dict:
+    """
+    Fold grouped rows into {(state, editor, month): delta}, where a
+    delta is the count, total seconds and bucket counts to $inc by.
+    Old entries may name their state rather than use its code.
+    """
+    deltas = {}
+    for row in rows:
+        key = row[ms.MONGO_ID]
+        state = qry.STATE_NAME_TO_CODE.get(key[STATE], key[STATE])
+        bucket = str(int(key[BUCKET]))
+        delta = deltas.setdefault((state, key[EDITOR], key[MONTH]),
+                                  {COUNT: 0, TOTAL_SECS: 0, BUCKETS: {}})
+        delta[COUNT] += row[COUNT]
+        delta[TOTAL_SECS] += row[TOTAL_SECS]
+        delta[BUCKETS][bucket] = delta[BUCKETS].get(bucket, 0) + row[COUNT]
+    return deltas
+
+
+def summary_ops(deltas: dict, window_id: str) -> list:
+    """
+    The $incs for one window. Each doc remembers the windows it has
+    taken, so applying the same window again changes nothing.
+    """
+    ops = []
+    for (state, editor, month), delta in deltas.items():
+        inc = {COUNT: delta[COUNT], TOTAL_SECS: delta[TOTAL_SECS]}
+        for bucket, cnt in delta[BUCKETS].items():
+            inc[f'{BUCKETS}.{bucket}'] = cnt
+        ops.append(UpdateOne(
+            {STATE: state, EDITOR: editor, MONTH: month,
+             APPLIED: {'$ne': window_id}},
+            {'$inc': inc,
+             '$push': {APPLIED: {'$each': [window_id],
+                                 '$slice': -APPLIED_KEEP}}},
+            upsert=True))
+    return ops
+
+
+def apply_summary(deltas: dict, window_id: str):
+    try:
+        dbc.bulk_write(SLA_COLLECT, summary_ops(deltas, window_id))
+    except BulkWriteError as err:
+        # an upsert whose doc already took this window
+        if not dbc.only_duplicates(err):
+            raise
+
+
+def read_meta() -> dict:
+    dbc.update_one(META_COLLECT, {ms.MONGO_ID: SLA_META_ID},
+                   {'$setOnInsert': {HWM: EPOCH, PENDING: None}},
+                   upsert=True)
+    return dbc.read_one(META_COLLECT, {ms.MONGO_ID: SLA_META_ID})
+
+
+@needs_indexes
+def refresh(now: datetime = None) -> int:
+    """
+    Fold in the history entries written since the last refresh.
+    The window to fold in is first claimed as pending with a
+    compare-and-set. It is only cleared, and the high-water mark moved,
+    once its summary is written; a refresh that finds a window pending
+    (another one running, or one that died) applies it again, which
+    the summary ops make harmless. Returns the number of entries
+    folded in.
+    """
+    until = (now or ms.get_est_time()) - timedelta(seconds=SETTLE_SECS)
+    meta = read_meta()
+    if not meta.get(PENDING):
+        if meta[HWM] >= until:
+            return 0
+        dbc.update_one(META_COLLECT,
+                       {ms.MONGO_ID: SLA_META_ID, HWM: meta[HWM],
+                        PENDING: None},
+                       {'$set': {PENDING: {SINCE: meta[HWM],
+                                           UNTIL: until}}})
+        meta = dbc.read_one(META_COLLECT, {ms.MONGO_ID: SLA_META_ID})
+        if not meta.get(PENDING):
+            return 0
+    window = meta[PENDING]
+    deltas = summarize(read_rows(window[SINCE], window[UNTIL]))
+    apply_summary(deltas, window[UNTIL].isoformat())
+    dbc.update_one(META_COLLECT, {ms.MONGO_ID: SLA_META_ID, PENDING: window},
+                   {'$set': {HWM: window[UNTIL], PENDING: None}})
+    return sum(delta[COUNT] for (_, editor, _), delta in deltas.items()
+               if editor == ALL_EDITORS)
+
+
+def rebuild(now: datetime = None) -> int:
+    """
+    Throw the summary away and fold in all of history again.
+    """
+    dbc.delete_many(SLA_COLLECT, {})
+    dbc.delete(META_COLLECT, {ms.MONGO_ID: SLA_META_ID})
+    return refresh(now)
+
+
+def merge_buckets(docs) -> dict:
+    merged = {}
+    for doc in docs:
+        for bucket, cnt in doc.get(BUCKETS, {}).items():
+            merged[bucket] = merged.get(bucket, 0) + cnt
+    return merged
+
+
+@needs_indexes
+def get_sla(states: list = None, editor: str = ALL_EDITORS,
+            month: str = None) -> dict:
+    """
+    Return {state: stats} for each state, where stats has the count,
+    median, p90 and mean days over the selected months, plus the same
+    stats per month under MONTHS.
+    """
+    states = [qry.STATE_NAME_TO_CODE.get(state, state)
+              for state in (states or TRACKED_STATES)]
+    bad = [state for state in states if not qry.is_valid_state(state)]
+    if bad:
+        raise ValueError(f'Invalid states: {bad}')
+    if month and not MONTH_RE.fullmatch(month):
+        raise ValueError(f'month must look like YYYY-MM, not {month!r}')
+    filt = {EDITOR: editor, STATE: {'$in': states}}
+    if month:
+        filt[MONTH] = month
+    docs = dbc.read_many(SLA_COLLECT, filt, sort=[(MONTH, 1)])
+    ret = {}
+    for state in states:
+        state_docs = [doc for doc in docs if doc[STATE] == state]
+        count = sum(doc[COUNT] for doc in state_docs)
+        ret[state] = get_stats(count,
+                               sum(doc[TOTAL_SECS] for doc in state_docs),
+                               merge_buckets(state_docs))
+        ret[state][MONTHS] = {
+            doc[MONTH]: get_stats(doc[COUNT], doc[TOTAL_SECS],
+                                  doc.get(BUCKETS, {}))
+            for doc in state_docs}
+    return ret
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Refresh the time-in-state summary.')
+    parser.add_argument('--rebuild', action='store_true')
+    args = parser.parse_args()
+    if args.rebuild:
+        print(f'Rebuilt from {rebuild()} history entries.')
+    else:
+        print(f'Folded in {refresh()} history entries.')
+    print(get_sla())
+
+
+if __name__ == '__main__':
+    main()
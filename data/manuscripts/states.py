@@ -1,7 +1,11 @@
+import data.manuscripts.query as qry
+
 # -- ALLOWED STATES -- # 
 
 SUBMITTED = "Submitted"
-DEFAULT_STATE = SUBMITTED 
+# New manuscripts are stored with state codes; see migration 1 in
+# migrations.py for the ones created with the names below.
+DEFAULT_STATE = qry.SUBMITTED
 DEFAULT_VERSION = 1
 REFEREE_REVIEW = "Referee Review"
 EDITOR_REVIEW = "Editor Review"
@@ -26,16 +30,14 @@ possible_states = [
 ]
 
 # --- Allowed state transitions ---
+# Derived from the FSM in query.py so the two can't drift apart.
 
-allowed_transitions = {
-    SUBMITTED: [REFEREE_REVIEW, WITHDRAWN],
-    REFEREE_REVIEW: [AUTHOR_REVISIONS, COPY_EDIT, REJECTED], 
-    AUTHOR_REVISIONS: [EDITOR_REVIEW, WITHDRAWN], 
-    EDITOR_REVIEW:  [COPY_EDIT, WITHDRAWN], 
-    COPY_EDIT: [AUTHOR_REVIEW, WITHDRAWN], 
-    FORMATTING: [PUBLISHED, WITHDRAWN], 
-    REJECTED: [WITHDRAWN],  # im not sure how this works, what if it got rejected, but the author wants it checked again with NEW authors?  should he create a new manuscript? 
-    WITHDRAWN: []
-} 
-
+STATE_NAME_BY_CODE = {
+    code: name for name, code in qry.STATE_NAME_TO_CODE.items()
+}
 
+allowed_transitions = {
+    STATE_NAME_BY_CODE[state]: [STATE_NAME_BY_CODE[target]
+                                for target in targets]
+    for state, targets in qry.NEXT_STATES.items()
+}
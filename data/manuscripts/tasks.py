@@ -0,0 +1,48 @@
+"""
+Background jobs for manuscripts. See data/jobs.py.
+"""
+import data.db_connect as dbc
+import data.jobs as jobs
+import data.manuscripts.manuscripts as ms
+import data.manuscripts.recommend as rec
+import data.manuscripts.similarity as simlr
+
+PROCESS_MANUSCRIPT = 'process_manuscript'
+
+WORD_COUNT_FLD = f'{ms.LATEST_VERSION}.{ms.WORD_COUNT}'
+
+
+def get_word_count(text: str) -> int:
+    return len(simlr.WORD_RE.findall(text or ''))
+
+
+@jobs.handler(PROCESS_MANUSCRIPT)
+def process_manuscript(manu_id: str) -> dict:
+    """
+    The slow part of taking in a manuscript: count its words and check
+    it for near-duplicates.
+    """
+    manu = dbc.read_one(ms.MANUSCRIPTS_COLLECT,
+                        {ms.MONGO_ID: ms.create_mongo_id_object(manu_id)})
+    if not manu:
+        raise ValueError(f'No manuscript found: {manu_id}')
+    text = manu[ms.LATEST_VERSION].get(ms.TEXT, '')
+    word_count = get_word_count(text)
+    dbc.update(ms.MANUSCRIPTS_COLLECT,
+               {ms.MONGO_ID: ms.create_mongo_id_object(manu_id)},
+               {WORD_COUNT_FLD: word_count})
+    duplicates = ms.flag_duplicates(manu_id, text)
+    return {ms.WORD_COUNT: word_count,
+            ms.POSSIBLE_DUPLICATES: duplicates}
+
+
+@jobs.handler(rec.REBUILD_MODEL)
+def rebuild_referee_model() -> dict:
+    """
+    Rebuild the referee recommender's model from every manuscript.
+    """
+    return rec.build()
+
+
+def enqueue_processing(manu_id) -> str:
+    return jobs.enqueue(PROCESS_MANUSCRIPT, {'manu_id': str(manu_id)})
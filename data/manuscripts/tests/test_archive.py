@@ -0,0 +1,125 @@
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+from bson.objectid import ObjectId
+
+import data.db_connect as dbc
+import data.manuscripts.archive as arch
+import data.manuscripts.manuscripts as ms
+import data.manuscripts.query as qry
+
+CUTOFF = datetime(2024, 1, 1)
+
+
+@pytest.fixture
+def rejected_manuscript():
+    manu = ms.create_manuscript('Archive Author', 'Archived', 'Old news')
+    manu_id = str(manu[ms.MONGO_ID])
+    ms.transition_manuscript_state(manu_id, qry.REJECT)
+    # pretend it went out with no notifications pending
+    dbc.update_one(ms.MANUSCRIPTS_COLLECT,
+                   {ms.MONGO_ID: ms.create_mongo_id_object(manu_id)},
+                   {'$unset': {ms.OUTBOX: 1}})
+    yield manu_id
+    ms.delete_manuscript(manu_id)
+
+
+def test_terminal_states_include_long_names():
+    states = arch.get_terminal_states()
+    assert qry.PUBLISHED in states
+    assert 'Rejected' in states
+    assert qry.SUBMITTED not in states
+
+
+def test_archive_filter():
+    filt = arch.archive_filter(CUTOFF)
+    assert filt[ms.STATE_FLD] == {'$in': arch.get_terminal_states()}
+    assert {ms.STATE_SINCE_FLD: {'$lt': CUTOFF}} in filt['$or']
+
+
+def test_copy_ops_upsert_by_id():
+    doc = {ms.MONGO_ID: '65f0c0ffee0000000000beef', ms.TITLE: 'x'}
+    op = arch.copy_ops([doc], {arch.ARCHIVED_AT: CUTOFF})[0]
+    assert op._filter == {ms.MONGO_ID: ms.create_mongo_id_object(
+        doc[ms.MONGO_ID])}
+    assert op._doc[arch.ARCHIVED_AT] == CUTOFF
+    assert op._upsert
+
+
+def test_unchanged_manuscript_fences_on_token():
+    token = ObjectId()
+    manu = {ms.MONGO_ID: '65f0c0ffee0000000000beef',
+            ms.LATEST_VERSION: {ms.LAST_TRANSITION: token}}
+    filt = arch.unchanged_manuscript(manu)
+    assert filt[f'{ms.LATEST_VERSION}.{ms.LAST_TRANSITION}'] == token
+    assert filt[f'{ms.OUTBOX}.0'] == {'$exists': False}
+
+
+def test_insert_ops_never_replace():
+    doc = {ms.MONGO_ID: '65f0c0ffee0000000000beef', ms.TITLE: 'x'}
+    op = arch.insert_ops([doc])[0]
+    assert op._doc == {'$setOnInsert': {ms.TITLE: 'x'}}
+    assert op._upsert
+
+
+def test_archive_and_read_through(rejected_manuscript):
+    tomorrow = ms.get_est_time() + timedelta(days=1)
+    assert arch.archive_batch(tomorrow) >= 1
+    obj_id = ms.create_mongo_id_object(rejected_manuscript)
+    assert dbc.read_one(ms.MANUSCRIPTS_COLLECT, {ms.MONGO_ID: obj_id}) is None
+    manu = ms.read_one_manuscript(rejected_manuscript)
+    assert manu[arch.ARCHIVED_AT]
+    history = ms.read_one_manuscript_history(manu[ms.MANUSCRIPT_HISTORY_FK])
+    assert history[ms.HISTORY][0][ms.HIST_TO] == qry.REJECTED
+
+
+def test_transition_restores(rejected_manuscript):
+    arch.archive_batch(ms.get_est_time() + timedelta(days=1))
+    ms.transition_manuscript_state(rejected_manuscript, qry.EDITOR_MOVE,
+                                   target_state=qry.SUBMITTED)
+    manu = ms.read_one_manuscript(rejected_manuscript)
+    assert arch.ARCHIVED_AT not in manu
+    assert manu[ms.LATEST_VERSION][ms.STATE] == qry.SUBMITTED
+    assert arch.read_archived(rejected_manuscript) is None
+
+
+def test_bulk_transition_restores(rejected_manuscript):
+    arch.archive_batch(ms.get_est_time() + timedelta(days=1))
+    results = ms.transition_manuscripts([{
+        ms.BULK_ID: rejected_manuscript,
+        ms.BULK_ACTION: qry.EDITOR_MOVE,
+        ms.BULK_TARGET_STATE: qry.SUBMITTED,
+    }])
+    assert results[0][ms.BULK_OK]
+    assert arch.read_archived(rejected_manuscript) is None
+
+
+def test_archive_skips_changed_manuscript(rejected_manuscript):
+    real_bulk_write = dbc.bulk_write
+    changed = []
+
+    def bulk_write(collection, ops, **kwargs):
+        # a new editor lands between the copy and the delete
+        if collection == ms.MANUSCRIPTS_COLLECT and not changed:
+            ms.assign_editor(rejected_manuscript, 'late_ed@nyu.edu')
+            changed.append(True)
+        return real_bulk_write(collection, ops, **kwargs)
+    with patch.object(arch.dbc, 'bulk_write', side_effect=bulk_write):
+        assert arch.archive_batch(ms.get_est_time() + timedelta(days=1)) >= 1
+    manu = arch.read_archived(rejected_manuscript)
+    assert 'late_ed@nyu.edu' in [ed[ms.EDITOR_EMAIL] for ed
+                                 in manu[ms.LATEST_VERSION][ms.EDITORS]]
+
+
+def test_restore_keeps_hot_copy(rejected_manuscript):
+    arch.archive_batch(ms.get_est_time() + timedelta(days=1))
+    manu = arch.read_archived(rejected_manuscript)
+    # someone else restored and moved it before we got to it
+    dbc.create(ms.MANUSCRIPTS_COLLECT, {
+        **manu, ms.MONGO_ID: ms.create_mongo_id_object(rejected_manuscript),
+        ms.LATEST_VERSION: {**manu[ms.LATEST_VERSION],
+                            ms.STATE: qry.SUBMITTED}})
+    restored = arch.restore(rejected_manuscript)
+    assert restored[ms.LATEST_VERSION][ms.STATE] == qry.SUBMITTED
+    assert arch.read_archived(rejected_manuscript) is None
@@ -0,0 +1,65 @@
+from bson.objectid import ObjectId
+
+import data.db_connect as dbc
+import data.manuscripts.archive as arch
+import data.manuscripts.consistency as cons
+import data.manuscripts.manuscripts as ms
+
+
+def test_note_caps_examples():
+    report = cons.new_report()
+    cons.note(report, cons.BAD_STATE, list(range(cons.MAX_EXAMPLES + 5)))
+    assert report[cons.BAD_STATE] == cons.MAX_EXAMPLES + 5
+    assert len(report[cons.EXAMPLES][cons.BAD_STATE]) == cons.MAX_EXAMPLES
+
+
+def test_merge_reports():
+    first, second = cons.new_report(), cons.new_report()
+    cons.note(first, cons.ORPHAN_HISTORY, ['a'])
+    cons.note(second, cons.ORPHAN_HISTORY, ['b'])
+    second[cons.SCANNED] = 3
+    total = cons.merge_reports([first, second])
+    assert total[cons.ORPHAN_HISTORY] == 2
+    assert total[cons.EXAMPLES][cons.ORPHAN_HISTORY] == ['a', 'b']
+    assert total[cons.SCANNED] == 3
+
+
+def test_range_filter():
+    low, high = ObjectId(), ObjectId()
+    assert cons.range_filter(None, high) == {ms.MONGO_ID: {'$lt': high}}
+    assert cons.range_filter(low, high) == {
+        ms.MONGO_ID: {'$gte': low, '$lt': high}}
+
+
+def test_check_and_repair():
+    manu = ms.create_manuscript('Checker Author', 'Broken', 'Half written')
+    manu_id = str(manu[ms.MONGO_ID])
+    his_id = ms.create_mongo_id_object(manu[ms.MANUSCRIPT_HISTORY_FK])
+    dbc.delete(ms.MANUSCRIPT_HISTORY_COLLECT, {ms.MONGO_ID: his_id})
+    orphan = dbc.create(ms.MANUSCRIPT_HISTORY_COLLECT,
+                        {ms.MANUSCRIPT_FK: ObjectId(), ms.HISTORY: []})
+    report = cons.check(threads=2, repair=True, grace_secs=-60)
+    assert report[cons.MISSING_HISTORY] >= 1
+    assert report[cons.ORPHAN_HISTORY] >= 1
+    assert dbc.read_one(ms.MANUSCRIPT_HISTORY_COLLECT,
+                        {ms.MONGO_ID: orphan.inserted_id}) is None
+    repaired = ms.read_one_manuscript(manu_id)
+    assert repaired[ms.MANUSCRIPT_HISTORY_FK] != his_id
+    assert cons.check(threads=2, grace_secs=-60)[cons.MISSING_HISTORY] == 0
+    ms.delete_manuscript(manu_id)
+
+
+def test_repair_keeps_history_of_archived():
+    # mid-restore: the history is back, the manuscript is still archived
+    manu = ms.create_manuscript('Checker Author', 'Restoring', 'Old news')
+    manu_id = ms.create_mongo_id_object(manu[ms.MONGO_ID])
+    his_id = ms.create_mongo_id_object(manu[ms.MANUSCRIPT_HISTORY_FK])
+    dbc.create(arch.ARCHIVE_COLLECT,
+               {**manu, ms.MONGO_ID: manu_id,
+                ms.MANUSCRIPT_HISTORY_FK: his_id})
+    dbc.delete(ms.MANUSCRIPTS_COLLECT, {ms.MONGO_ID: manu_id})
+    cons.check(threads=2, repair=True, grace_secs=-60)
+    assert dbc.read_one(ms.MANUSCRIPT_HISTORY_COLLECT,
+                        {ms.MONGO_ID: his_id}) is not None
+    dbc.delete(arch.ARCHIVE_COLLECT, {ms.MONGO_ID: manu_id})
+    dbc.delete(ms.MANUSCRIPT_HISTORY_COLLECT, {ms.MONGO_ID: his_id})
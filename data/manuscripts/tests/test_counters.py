@@ -0,0 +1,62 @@
+import pytest
+
+import data.manuscripts.counters as cntrs
+import data.manuscripts.manuscripts as ms
+import data.manuscripts.query as qry
+
+TEST_EDITOR = 'counter_editor@nyu.edu'
+
+
+@pytest.fixture
+def counted_manuscript():
+    test_manu = ms.create_manuscript(
+        author_name='Counter Author',
+        title='Counter Manuscript',
+        text='Counting on it.'
+    )
+    yield test_manu
+    ms.delete_manuscript(test_manu[ms.MONGO_ID])
+
+
+def test_to_code():
+    assert cntrs.to_code('Submitted') == qry.SUBMITTED
+    assert cntrs.to_code(qry.SUBMITTED) == qry.SUBMITTED
+
+
+def test_inc_ops():
+    ops = cntrs.inc_ops('Submitted', [TEST_EDITOR], 1)
+    assert len(ops) == 2
+    filters = [op._filter for op in ops]
+    assert {cntrs.STATE: qry.SUBMITTED,
+            cntrs.EDITOR: cntrs.ALL_EDITORS} in filters
+    assert {cntrs.STATE: qry.SUBMITTED, cntrs.EDITOR: TEST_EDITOR} in filters
+
+
+def test_record_transition_same_state():
+    assert cntrs.record_transition('Submitted', qry.SUBMITTED) is None
+
+
+def test_get_counts_has_every_state():
+    counts = cntrs.get_counts()
+    for state in qry.get_states():
+        assert state in counts
+
+
+def test_counts_follow_lifecycle():
+    before = cntrs.get_counts()
+    test_manu = ms.create_manuscript('Counter Author', 'Counted', 'Text')
+    manu_id = str(test_manu[ms.MONGO_ID])
+    assert cntrs.get_counts()[qry.SUBMITTED] == before[qry.SUBMITTED] + 1
+    ms.transition_manuscript_state(manu_id, qry.ASSIGN_REF, ref='ref1')
+    after_move = cntrs.get_counts()
+    assert after_move[qry.SUBMITTED] == before[qry.SUBMITTED]
+    assert after_move[qry.IN_REF_REV] == before[qry.IN_REF_REV] + 1
+    ms.delete_manuscript(manu_id)
+    assert cntrs.get_counts() == before
+
+
+def test_reconcile(counted_manuscript):
+    cntrs.reconcile()
+    counts = cntrs.get_counts()
+    assert counts[qry.SUBMITTED] >= 1
+    assert sum(counts.values()) == len(ms.read_all_manuscripts())
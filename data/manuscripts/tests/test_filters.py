@@ -0,0 +1,131 @@
+from datetime import datetime
+from unittest.mock import patch
+
+import pytest
+
+import data.manuscripts.filters as fltr
+import data.manuscripts.manuscripts as ms
+import data.manuscripts.query as qry
+
+IXSCAN_PLAN = {
+    'stage': 'FETCH',
+    'inputStage': {
+        'stage': 'IXSCAN',
+        'indexName': 'latest_version.state_1_manuscript_created_-1',
+    },
+}
+
+
+def test_compile_filters_empty():
+    filt, sort = fltr.compile_filters({})
+    assert filt == {}
+    assert sort == [(ms.MANUSCRIPT_CREATED, -1)]
+
+
+def test_compile_filters_state_aliases():
+    filt, _ = fltr.compile_filters({fltr.STATE: ['Submitted']})
+    assert set(filt[ms.STATE_FLD]['$in']) == {qry.SUBMITTED, 'Submitted'}
+
+
+def test_compile_filters_all():
+    filt, sort = fltr.compile_filters({
+        fltr.AUTHOR: 'Some Author',
+        fltr.EDITOR: 'ed@nyu.edu',
+        fltr.REFEREE: 'ref@nyu.edu',
+        fltr.CREATED_AFTER: '2024-01-01',
+        fltr.CREATED_BEFORE: '2025-01-01',
+        fltr.ORDER: fltr.ASC,
+    })
+    assert filt[ms.AUTHOR_NAME] == 'Some Author'
+    assert filt[ms.EDITOR_EMAIL_FLD] == 'ed@nyu.edu'
+    assert filt[ms.REFEREES_FLD] == 'ref@nyu.edu'
+    assert filt[ms.MANUSCRIPT_CREATED] == {'$gte': datetime(2024, 1, 1),
+                                           '$lt': datetime(2025, 1, 1)}
+    assert sort == [(ms.MANUSCRIPT_CREATED, 1)]
+
+
+@pytest.mark.parametrize('params', [
+    {'title': 'x'},
+    {fltr.STATE: ['NOPE']},
+    {fltr.CREATED_AFTER: 'yesterday'},
+    {fltr.ORDER: 'sideways'},
+    {fltr.AUTHOR: ['a', 'b']},
+])
+def test_compile_filters_bad(params):
+    with pytest.raises(ValueError):
+        fltr.compile_filters(params)
+
+
+def test_get_index_name():
+    assert (fltr.get_index_name([(ms.STATE_FLD, 1),
+                                 (ms.MANUSCRIPT_CREATED, -1)])
+            == IXSCAN_PLAN['inputStage']['indexName'])
+
+
+STATE_FILT = {ms.STATE_FLD: {'$in': [qry.SUBMITTED]}}
+DATE_INDEX_PLAN = {
+    'stage': 'FETCH',
+    'inputStage': {
+        'stage': 'IXSCAN',
+        'indexName': fltr.get_index_name([(ms.MANUSCRIPT_CREATED, -1)]),
+    },
+}
+
+
+def test_check_plan_ok():
+    assert fltr.check_plan(IXSCAN_PLAN, STATE_FILT) is None
+
+
+def test_check_plan_collscan():
+    assert fltr.check_plan({'stage': 'COLLSCAN'}, STATE_FILT)
+
+
+def test_check_plan_undeclared_index():
+    plan = {'stage': 'FETCH',
+            'inputStage': {'stage': 'IXSCAN', 'indexName': 'title_1'}}
+    assert 'title_1' in fltr.check_plan(plan, STATE_FILT)
+
+
+def test_check_plan_sort_index_alone():
+    # walking the date index to find an unindexed field reads everything
+    assert fltr.check_plan(DATE_INDEX_PLAN, {ms.TITLE: 'x'})
+    assert fltr.check_plan(DATE_INDEX_PLAN, {}) is None
+    assert fltr.check_plan(DATE_INDEX_PLAN, {
+        ms.MANUSCRIPT_CREATED: {'$gte': datetime(2024, 1, 1)}}) is None
+
+
+def test_check_query_caches_shape():
+    fltr.checked_shapes.clear()
+    sort = [(ms.MANUSCRIPT_CREATED, -1)]
+    with patch.object(fltr.dbc, 'explain',
+                      return_value=IXSCAN_PLAN) as explain:
+        fltr.check_query(STATE_FILT, sort)
+        fltr.check_query({ms.STATE_FLD: {'$in': [qry.WITHDRAWN]}}, sort)
+        assert explain.call_count == 1
+        fltr.check_query(STATE_FILT, [(ms.MANUSCRIPT_CREATED, 1)])
+        assert explain.call_count == 2
+    fltr.checked_shapes.clear()
+
+
+def test_check_query_refused_shape():
+    fltr.checked_shapes.clear()
+    sort = [(ms.MANUSCRIPT_CREATED, -1)]
+    with patch.object(fltr.dbc, 'explain',
+                      return_value={'stage': 'COLLSCAN'}) as explain:
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                fltr.check_query({ms.TITLE: 'x'}, sort)
+        assert explain.call_count == 1
+    fltr.checked_shapes.clear()
+
+
+def test_filter_manuscripts():
+    manu = ms.create_manuscript('Filter Author', 'Filtered', 'Text')
+    try:
+        ret = fltr.filter_manuscripts({fltr.AUTHOR: 'Filter Author',
+                                       fltr.STATE: [qry.SUBMITTED]})
+        assert ret[ms.TOTAL] >= 1
+        assert str(manu[ms.MONGO_ID]) in [res[ms.MONGO_ID]
+                                          for res in ret[ms.RESULTS]]
+    finally:
+        ms.delete_manuscript(manu[ms.MONGO_ID])
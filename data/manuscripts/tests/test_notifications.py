@@ -0,0 +1,116 @@
+import mailbox
+from datetime import datetime
+from unittest.mock import patch
+
+import pytest
+
+import data.manuscripts.manuscripts as ms
+import data.manuscripts.notifications as ntfy
+import data.manuscripts.query as qry
+
+TEST_EDITOR = 'notify_editor@nyu.edu'
+TEST_REF = 'notify_ref@nyu.edu'
+
+
+def make_manu() -> dict:
+    return {
+        ms.AUTHOR_NAME: 'Notify Author',
+        ms.LATEST_VERSION: {
+            ms.TITLE: 'Notified',
+            ms.EDITORS: [{ms.EDITOR_EMAIL: TEST_EDITOR,
+                          ms.EDITOR_ROLE: 'ED'}],
+            ms.REFEREES: [TEST_REF, 'not an email'],
+        },
+    }
+
+
+def make_note(**event_flds) -> dict:
+    event = ntfy.make_event(make_manu(), qry.SUBMITTED, qry.IN_REF_REV,
+                            qry.ASSIGN_REF)
+    event.update(event_flds)
+    return {ntfy.EVENT: event}
+
+
+def test_make_event():
+    event = ntfy.make_event(make_manu(), qry.SUBMITTED, qry.IN_REF_REV,
+                            qry.ASSIGN_REF)
+    assert event[ntfy.NEW_STATE] == qry.IN_REF_REV
+    assert event[ntfy.EDITORS] == [TEST_EDITOR]
+    assert isinstance(event[ntfy.AT], datetime)
+
+
+def test_get_recipients():
+    event = ntfy.make_event(make_manu(), qry.SUBMITTED, qry.IN_REF_REV,
+                            qry.ASSIGN_REF)
+    recipients = ntfy.get_recipients(
+        event, {'Notify Author': 'author@nyu.edu'})
+    assert recipients == ['author@nyu.edu', TEST_EDITOR, TEST_REF]
+
+
+def test_format_digest():
+    msg = ntfy.format_digest(TEST_EDITOR, [make_note(), make_note()])
+    assert msg['To'] == TEST_EDITOR
+    assert msg['Subject'] == '2 manuscript updates'
+    assert msg.get_content().count('Notified') == 2
+
+
+def make_digest(rcpt: str, count: int) -> dict:
+    return {ms.MONGO_ID: rcpt,
+            ntfy.NOTES: [{**make_note(), ms.MONGO_ID: f'{rcpt}:{num}',
+                          ntfy.ATTEMPTS: 0} for num in range(count)]}
+
+
+@patch('data.db_connect.bulk_write', autospec=True)
+@patch('data.manuscripts.notifications.read_digests', autospec=True,
+       side_effect=[[make_digest('a@nyu.edu', 3), make_digest('b@nyu.edu', 1)],
+                    [make_digest('c@nyu.edu', 2)], []])
+def test_send_digests_pages_by_recipient(mock_read, mock_write,
+                                         monkeypatch):
+    monkeypatch.setattr(ntfy, 'indexed', True)
+    sent = []
+    assert ntfy.send_digests(batch_size=2, transport=sent.append) == 3
+    assert [msg['To'] for msg in sent] == ['a@nyu.edu', 'b@nyu.edu',
+                                           'c@nyu.edu']
+    assert sent[0]['Subject'] == '3 manuscript updates'
+    assert [call.args[0] for call in mock_read.call_args_list] == [
+        None, 'b@nyu.edu', 'c@nyu.edu']
+
+
+def test_get_transport(monkeypatch):
+    monkeypatch.setenv('MAIL_METHOD', ntfy.SMTP_METHOD)
+    assert ntfy.get_transport() is ntfy.send_smtp
+    monkeypatch.setenv('MAIL_METHOD', 'pigeon')
+    with pytest.raises(ValueError):
+        ntfy.get_transport()
+
+
+def test_send_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(ntfy, 'MAIL_FILE', str(tmp_path / 'out.mbox'))
+    ntfy.send_file(ntfy.format_digest(TEST_EDITOR, [make_note()]))
+    box = mailbox.mbox(ntfy.MAIL_FILE)
+    assert [msg['To'] for msg in box] == [TEST_EDITOR]
+
+
+def test_insert_op_never_resets():
+    note = make_note()
+    op = ntfy.get_insert_op(note[ntfy.EVENT], TEST_EDITOR, 'manu')
+    assert op._upsert
+    assert set(op._doc) == {'$setOnInsert'}
+    assert op._doc['$setOnInsert'][ntfy.STATUS] == ntfy.PENDING
+
+
+def test_transition_notifies_editor():
+    manu = ms.create_manuscript('Notify Author', 'Notified', 'Text')
+    manu_id = str(manu[ms.MONGO_ID])
+    sent = []
+    try:
+        ms.assign_editor(manu_id, TEST_EDITOR)
+        ms.transition_manuscript_state(manu_id, qry.ASSIGN_REF, ref=TEST_REF)
+        outbox = ms.read_one_manuscript(manu_id)[ms.OUTBOX]
+        assert outbox[0][ntfy.NEW_STATE] == qry.IN_REF_REV
+        assert ntfy.drain_outboxes() >= 1
+        assert not ms.read_one_manuscript(manu_id)[ms.OUTBOX]
+        ntfy.send_digests(transport=sent.append, wait_secs=0)
+        assert TEST_EDITOR in [msg['To'] for msg in sent]
+    finally:
+        ms.delete_manuscript(manu_id)
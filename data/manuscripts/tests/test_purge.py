@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+
+import pytest
+from bson.objectid import ObjectId
+
+import data.db_connect as dbc
+import data.manuscripts.archive as arch
+import data.manuscripts.counters as cntrs
+import data.manuscripts.manuscripts as ms
+import data.manuscripts.purge as prg
+import data.manuscripts.query as qry
+import data.manuscripts.referees as refs
+
+PURGE_AUTHOR = 'Purge Spammer'
+PURGE_REF = 'purge_ref@nyu.edu'
+
+
+def test_purge_filter_needs_something():
+    with pytest.raises(ValueError):
+        prg.purge_filter()
+
+
+def test_purge_filter_bad_state():
+    with pytest.raises(ValueError):
+        prg.purge_filter(states=['NOPE'])
+
+
+def test_purge_filter():
+    before = datetime(2024, 1, 1)
+    filt = prg.purge_filter([qry.WITHDRAWN], before, PURGE_AUTHOR)
+    assert filt[ms.STATE_FLD] == {'$in': qry.STATE_ALIASES[qry.WITHDRAWN]}
+    assert filt[ms.MANUSCRIPT_CREATED] == {'$lt': before}
+    assert filt[ms.AUTHOR_NAME] == PURGE_AUTHOR
+
+
+def test_unchanged_fences_on_state_and_token():
+    token = ObjectId()
+    doc = {ms.MONGO_ID: str(ObjectId()),
+           ms.LATEST_VERSION: {ms.STATE: qry.WITHDRAWN,
+                               ms.LAST_TRANSITION: token}}
+    filt = prg.unchanged(prg.purge_filter(author=PURGE_AUTHOR), doc)
+    assert filt[ms.STATE_FLD] == qry.WITHDRAWN
+    assert filt[f'{ms.LATEST_VERSION}.{ms.LAST_TRANSITION}'] == token
+    assert filt[ms.AUTHOR_NAME] == PURGE_AUTHOR
+
+
+def test_purge():
+    before = cntrs.get_counts()
+    manu_ids = [str(ms.create_manuscript(PURGE_AUTHOR, f'Spam {i}', 'Buy')
+                    [ms.MONGO_ID])
+                for i in range(5)]
+    calls = []
+    purged = prg.purge(author=PURGE_AUTHOR, chunk_size=2,
+                       progress=lambda done, total: calls.append(done))
+    assert purged == 5
+    assert calls == [2, 4, 5]
+    for manu_id in manu_ids:
+        assert ms.read_one_manuscript(manu_id) is None
+    assert cntrs.get_counts() == before
+
+
+def test_purge_finished_keeps_workload():
+    manu_id = str(ms.create_manuscript(PURGE_AUTHOR, 'Rejected', 'Text')
+                  [ms.MONGO_ID])
+    ms.transition_manuscript_state(manu_id, qry.ASSIGN_REF, ref=PURGE_REF)
+    ms.transition_manuscript_state(manu_id, qry.REJECT)
+    assert prg.purge(author=PURGE_AUTHOR) == 1
+    workload = dbc.read_one(refs.WORKLOAD_COLLECT, {ms.MONGO_ID: PURGE_REF})
+    assert workload[refs.ACTIVE] == 0
+    dbc.delete(refs.WORKLOAD_COLLECT, {ms.MONGO_ID: PURGE_REF})
+
+
+def test_purge_changed_manuscript_is_kept():
+    manu_id = str(ms.create_manuscript(PURGE_AUTHOR, 'Moving', 'Text')
+                  [ms.MONGO_ID])
+    filt = prg.purge_filter(author=PURGE_AUTHOR)
+    chunk = prg.read_chunk(filt, None, 10)
+    # it changes state after the purge read it
+    ms.transition_manuscript_state(manu_id, qry.WITHDRAW)
+    try:
+        assert prg.purge_chunk(filt, chunk) == 0
+        assert ms.read_one_manuscript(manu_id)
+    finally:
+        ms.delete_manuscript(manu_id)
+
+
+def test_purge_archived():
+    manu_id = str(ms.create_manuscript(PURGE_AUTHOR, 'Archived', 'Text')
+                  [ms.MONGO_ID])
+    ms.transition_manuscript_state(manu_id, qry.WITHDRAW)
+    dbc.update_one(ms.MANUSCRIPTS_COLLECT, {ms.MONGO_ID: ObjectId(manu_id)},
+                   {'$unset': {ms.OUTBOX: 1}})
+    arch.archive_batch(ms.get_est_time() + timedelta(days=1))
+    assert arch.read_archived(manu_id)
+    before = cntrs.get_counts()
+    assert prg.purge(author=PURGE_AUTHOR) == 1
+    assert arch.read_archived(manu_id) is None
+    assert sum(before.values()) - sum(cntrs.get_counts().values()) == 1
@@ -61,3 +61,77 @@ def test_handle_action_valid_return():
                                            ref='Some ref')
             print(f'{new_state=}')
             assert mqry.is_valid_state(new_state)
+
+
+def test_get_valid_actions_by_state_long_name():
+    assert (mqry.get_valid_actions_by_state('Submitted')
+            == mqry.get_valid_actions_by_state(mqry.SUBMITTED))
+
+
+def test_handle_action_long_name():
+    assert mqry.handle_action('Submitted', mqry.REJECT) == mqry.REJECTED
+
+
+def test_compiled_table_matches_definition():
+    for state, actions in mqry.STATE_TABLE.items():
+        row = mqry.TRANSITIONS[mqry.STATE_INDEX[state]]
+        for action in mqry.get_actions():
+            cell = row[mqry.ACTION_INDEX[action]]
+            if action not in actions:
+                assert cell is None
+            elif mqry.TARGET in actions[action]:
+                assert mqry.STATES[cell] == actions[action][mqry.TARGET]
+            else:
+                assert cell is actions[action][mqry.FUNC]
+
+
+def test_editor_move():
+    assert mqry.handle_action(mqry.SUBMITTED, mqry.EDITOR_MOVE,
+                              target_state=mqry.PUBLISHED) == mqry.PUBLISHED
+    assert mqry.handle_action(mqry.PUBLISHED, mqry.EDITOR_MOVE,
+                              target_state=None) == mqry.SUBMITTED
+    with pytest.raises(ValueError):
+        mqry.handle_action(mqry.SUBMITTED, mqry.EDITOR_MOVE,
+                           target_state='Nowhere')
+
+
+def make_table(**changes) -> dict:
+    table = {state: dict(actions)
+             for state, actions in mqry.STATE_TABLE.items()}
+    table.update(changes)
+    return table
+
+
+def test_check_table_unknown_target():
+    table = make_table(**{mqry.SUBMITTED: {
+        mqry.REJECT: {mqry.TARGET: 'Limbo'},
+        mqry.ASSIGN_REF: {mqry.TARGET: mqry.IN_REF_REV},
+    }})
+    with pytest.raises(ValueError, match='unknown state'):
+        mqry.check_table(table)
+
+
+def test_check_table_unreachable():
+    table = make_table(**{mqry.IN_REF_REV: {
+        mqry.REJECT: {mqry.TARGET: mqry.REJECTED},
+    }})
+    with pytest.raises(ValueError, match='unreachable'):
+        mqry.check_table(table)
+
+
+def test_check_table_dead_state():
+    table = make_table(**{mqry.EDITOR_REVIEW: {
+        mqry.ACCEPT: {mqry.TARGET: mqry.EDITOR_REVIEW},
+        mqry.EDITOR_MOVE: mqry.EDITOR_ACTIONS[mqry.EDITOR_MOVE],
+    }})
+    with pytest.raises(ValueError, match='Dead state'):
+        mqry.check_table(table)
+
+
+def test_check_table_func_without_targets():
+    table = make_table(**{mqry.SUBMITTED: {
+        mqry.ASSIGN_REF: {mqry.FUNC: mqry.assign_ref},
+        mqry.REJECT: {mqry.TARGET: mqry.REJECTED},
+    }})
+    with pytest.raises(ValueError):
+        mqry.check_table(table)
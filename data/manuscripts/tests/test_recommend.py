@@ -0,0 +1,114 @@
+import time
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+import data.manuscripts.recommend as rec
+
+BIO = 'protein folding enzyme kinetics cellular membrane protein enzyme'
+PHYSICS = 'quantum entanglement photon lattice boson quantum photon'
+
+
+@pytest.fixture
+def model():
+    rec.emails.clear()
+    rec.rows.clear()
+    rec.referees = {'bio@nyu.edu', 'phys@nyu.edu'}
+    rec.profiles = np.zeros((0, rec.N_FEATURES), dtype=np.float32)
+    rec.norms = np.zeros(0, dtype=np.float32)
+    rec.doc_freq = np.zeros(rec.N_FEATURES, dtype=np.float32)
+    rec.num_docs = 0
+    rec.built_at = time.time()
+    rec.checked_at = time.time()
+    for text in (BIO, PHYSICS, 'an unrelated third manuscript'):
+        rec.add_manuscript(text)
+    rec.add_review('bio@nyu.edu', BIO)
+    rec.add_review('phys@nyu.edu', PHYSICS)
+    rec.add_review('not_a_referee@nyu.edu', BIO)
+    yield
+    rec.mark_stale()
+
+
+def test_get_term_freqs():
+    freqs = rec.get_term_freqs('Enzyme enzyme kinetics of')
+    assert freqs.shape == (rec.N_FEATURES,)
+    assert np.count_nonzero(freqs) == 2  # 'of' is too short to count
+    assert freqs.max() == pytest.approx(1 + np.log(2))
+
+
+def test_recommend(model):
+    picks = rec.recommend('membrane enzyme binding', k=2)
+    assert picks[0][rec.EMAIL] == 'bio@nyu.edu'
+    assert [pick[rec.EMAIL] for pick in picks] == ['bio@nyu.edu']
+
+
+def test_recommend_exclude(model):
+    assert rec.recommend(BIO, exclude=['bio@nyu.edu']) == []
+
+
+def test_only_referees_get_profiles(model):
+    assert 'not_a_referee@nyu.edu' not in rec.rows
+
+
+def test_profiles_grow(model):
+    for i in range(rec.MIN_ROWS + 1):
+        rec.referees.add(f'ref{i}@nyu.edu')
+        rec.add_review(f'ref{i}@nyu.edu', PHYSICS)
+    assert rec.recommend(BIO, k=1)[0][rec.EMAIL] == 'bio@nyu.edu'
+
+
+def make_manu(text: str, referees: list) -> dict:
+    return {rec.ms.LATEST_VERSION: {rec.ms.TEXT: text,
+                                    rec.ms.REFEREES: referees}}
+
+
+def read_iter_manus(collection, filt, **kwargs):
+    if collection == rec.ms.MANUSCRIPTS_COLLECT:
+        return iter([make_manu(BIO, ['bio@nyu.edu'])])
+    assert collection == rec.arch.ARCHIVE_COLLECT
+    return iter([make_manu(PHYSICS, ['phys@nyu.edu'])])
+
+
+@patch('data.manuscripts.recommend.save', autospec=True)
+@patch('data.manuscripts.recommend.get_referee_emails', autospec=True,
+       return_value={'bio@nyu.edu', 'phys@nyu.edu', 'new@nyu.edu'})
+@patch('data.db_connect.read_iter', autospec=True,
+       side_effect=read_iter_manus)
+def test_build_reads_archive(mock_read_iter, mock_referees, mock_save):
+    assert rec.build() == {rec.REFEREES: 2, rec.NUM_DOCS: 2}
+    rec.install(*mock_save.call_args.args, time.time())
+    rec.checked_at = time.time()
+    try:
+        assert rec.num_docs == 2
+        assert rec.recommend(BIO, k=1)[0][rec.EMAIL] == 'bio@nyu.edu'
+        # a referee new since the build gets a row of their own
+        rec.add_review('new@nyu.edu', BIO)
+        assert rec.recommend(BIO, k=3)[0][rec.EMAIL] in ('bio@nyu.edu',
+                                                         'new@nyu.edu')
+        assert len(rec.norms) == len(rec.profiles)
+    finally:
+        rec.mark_stale()
+
+
+@patch('data.manuscripts.recommend.build', autospec=True)
+@patch('data.manuscripts.recommend.refresh_in_background', autospec=True)
+def test_recommend_never_builds(mock_refresh, mock_build):
+    rec.built_at = None
+    rec.checked_at = None
+    rec.emails.clear()
+    assert rec.recommend(BIO) == []
+    mock_refresh.assert_called_once()
+    mock_build.assert_not_called()
+
+
+@patch('threading.Thread', autospec=True)
+def test_refresh_is_single_flight(mock_thread):
+    rec.checked_at = None
+    rec.refreshing = False
+    try:
+        rec.refresh_in_background()
+        rec.refresh_in_background()
+        mock_thread.assert_called_once()
+    finally:
+        rec.refreshing = False
@@ -0,0 +1,89 @@
+import pytest
+
+import data.db_connect as dbc
+import data.manuscripts.manuscripts as ms
+import data.manuscripts.query as qry
+import data.manuscripts.referees as refs
+import data.people as ppl
+import data.roles as rls
+
+TEST_REF = 'workload_ref@nyu.edu'
+
+
+@pytest.fixture
+def referee():
+    ppl.create('Workload Ref', 'NYU', TEST_REF, rls.RE_CODE)
+    yield TEST_REF
+    ppl.delete(TEST_REF)
+    dbc.delete(refs.WORKLOAD_COLLECT, {ms.MONGO_ID: TEST_REF})
+
+
+def get_incs(ops) -> dict:
+    return {op._filter[ms.MONGO_ID]: op._doc['$inc'] for op in ops}
+
+
+def test_workload_ops_assign():
+    ops = refs.workload_ops(qry.SUBMITTED, qry.IN_REF_REV, qry.ASSIGN_REF,
+                            [], [TEST_REF])
+    assert get_incs(ops) == {TEST_REF: {refs.ACTIVE: 1}}
+
+
+def test_workload_ops_delete():
+    ops = refs.workload_ops(qry.IN_REF_REV, qry.IN_REF_REV, qry.DELETE_REF,
+                            [TEST_REF, 'other'], ['other'])
+    assert get_incs(ops) == {TEST_REF: {refs.ACTIVE: -1}}
+
+
+def test_workload_ops_review_done():
+    ops = refs.workload_ops('Referee Review', qry.COPY_EDIT, qry.ACCEPT,
+                            [TEST_REF], [TEST_REF])
+    assert get_incs(ops) == {TEST_REF: {refs.ACTIVE: -1, refs.COMPLETED: 1}}
+    assert refs.RECENT in ops[0]._doc['$push']
+
+
+def test_workload_ops_withdrawn():
+    ops = refs.workload_ops(qry.IN_REF_REV, qry.WITHDRAWN, qry.WITHDRAW,
+                            [TEST_REF], [TEST_REF])
+    assert get_incs(ops) == {TEST_REF: {refs.ACTIVE: -1}}
+
+
+def test_workload_ops_back_into_review():
+    ops = refs.workload_ops(qry.AUTHOR_REV, qry.IN_REF_REV, qry.EDITOR_MOVE,
+                            [TEST_REF], [TEST_REF])
+    assert get_incs(ops) == {TEST_REF: {refs.ACTIVE: 1}}
+
+
+def test_workload_ops_round_trip_balances():
+    moves = [(qry.IN_REF_REV, qry.AUTHOR_REV, qry.EDITOR_MOVE),
+             (qry.AUTHOR_REV, qry.IN_REF_REV, qry.EDITOR_MOVE),
+             (qry.IN_REF_REV, qry.COPY_EDIT, qry.ACCEPT)]
+    total = 0
+    for old_state, new_state, action in moves:
+        ops = refs.workload_ops(old_state, new_state, action,
+                                [TEST_REF], [TEST_REF])
+        total += get_incs(ops).get(TEST_REF, {}).get(refs.ACTIVE, 0)
+    assert total == -1  # just the one review it started in
+
+
+def test_workload_follows_review(referee):
+    manu = ms.create_manuscript('Ref Author', 'Refereed', 'Text')
+    manu_id = str(manu[ms.MONGO_ID])
+    ms.transition_manuscript_state(manu_id, qry.ASSIGN_REF, ref=referee)
+    assert refs.get_workload(referee)[refs.ACTIVE] == 1
+    assert refs.suggest_referees(exclude=[referee]) == [
+        ref for ref in refs.suggest_referees() if ref[ppl.EMAIL] != referee]
+    ms.transition_manuscript_state(manu_id, qry.ACCEPT)
+    workload = refs.get_workload(referee)
+    assert workload[refs.ACTIVE] == 0
+    assert workload[refs.COMPLETED] == 1
+    assert workload[refs.RECENT_COMPLETIONS] == 1
+    ms.delete_manuscript(manu_id)
+
+
+def test_delete_in_review_releases_referee(referee):
+    manu = ms.create_manuscript('Ref Author', 'Deleted in review', 'Text')
+    manu_id = str(manu[ms.MONGO_ID])
+    ms.transition_manuscript_state(manu_id, qry.ASSIGN_REF, ref=referee)
+    assert refs.get_workload(referee)[refs.ACTIVE] == 1
+    ms.delete_manuscript(manu_id)
+    assert refs.get_workload(referee)[refs.ACTIVE] == 0
@@ -0,0 +1,78 @@
+from unittest.mock import patch
+
+import pytest
+
+import data.manuscripts.manuscripts as ms
+import data.manuscripts.search as srch
+
+SEARCH_WORD = 'zyxwvutsearchable'
+
+
+@pytest.fixture
+def searchable_manuscript():
+    test_manu = ms.create_manuscript(
+        author_name='Search Author',
+        title=f'A study of {SEARCH_WORD} things',
+        text=f'Some filler text before the {SEARCH_WORD} word.'
+    )
+    yield test_manu
+    ms.delete_manuscript(test_manu[ms.MONGO_ID])
+
+
+def test_get_terms():
+    assert srch.get_terms('Hello, World!') == ['hello', 'world']
+
+
+def test_make_snippet_around_hit():
+    text = 'x' * 500 + ' needle ' + 'y' * 500
+    snippet = srch.make_snippet(text, ['needle'])
+    assert 'needle' in snippet
+    assert snippet.startswith('...')
+    assert snippet.endswith('...')
+    assert len(snippet) <= srch.SNIPPET_LEN + 6
+
+
+def test_make_snippet_no_hit():
+    text = 'short text'
+    assert srch.make_snippet(text, ['missing']) == text
+
+
+def test_make_snippet_empty():
+    assert srch.make_snippet('', ['term']) == ''
+
+
+@pytest.mark.parametrize('call', [
+    lambda fn: fn('q', 1, 10, 'otherDB'),
+    lambda fn: fn('q', db='otherDB'),
+])
+@patch('data.manuscripts.search.ensure_index', autospec=True)
+def test_needs_index_finds_db(mock_ensure, call, monkeypatch):
+    monkeypatch.setattr(srch, 'indexed_dbs', set())
+
+    @srch.needs_index
+    def fake_search(query, page=1, page_size=10, db='seDB'):
+        return db
+    assert call(fake_search) == 'otherDB'
+    mock_ensure.assert_called_once_with('otherDB')
+
+
+def test_search_empty_query():
+    ret = srch.search('  ')
+    assert ret[srch.TOTAL] == 0
+    assert ret[srch.RESULTS] == []
+
+
+def test_search(searchable_manuscript):
+    ret = srch.search(SEARCH_WORD)
+    assert ret[srch.TOTAL] >= 1
+    ids = [res[ms.MONGO_ID] for res in ret[srch.RESULTS]]
+    assert searchable_manuscript[ms.MONGO_ID] in ids
+    for res in ret[srch.RESULTS]:
+        assert SEARCH_WORD in res[srch.SNIPPET]
+
+
+def test_search_sees_updates(searchable_manuscript):
+    manu_id = searchable_manuscript[ms.MONGO_ID]
+    assert ms.update_manuscript(manu_id, 'New title', 'Nothing to see.')
+    ids = [res[ms.MONGO_ID] for res in srch.search(SEARCH_WORD)[srch.RESULTS]]
+    assert manu_id not in ids
@@ -0,0 +1,106 @@
+import random
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+import data.manuscripts.manuscripts as ms
+import data.manuscripts.similarity as simlr
+
+WORDS = [f'word{i}' for i in range(2000)]
+
+
+def make_text(seed: int, length: int = 300) -> str:
+    rng = random.Random(seed)
+    return ' '.join(rng.choices(WORDS, k=length))
+
+
+def edit(text: str, changes: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    words = text.split()
+    for _ in range(changes):
+        words[rng.randrange(len(words))] = 'changed'
+    return ' '.join(words)
+
+
+def test_get_shingles_short_text():
+    assert len(simlr.get_shingles('just three words')) == 1
+    assert len(simlr.get_shingles('')) == 0
+
+
+def test_get_signature_empty():
+    assert simlr.get_signature('  ') is None
+
+
+def test_signature_shape():
+    sig = simlr.get_signature(make_text(1))
+    assert sig.shape == (simlr.NUM_PERM,)
+    assert len(simlr.get_band_keys(sig)) == simlr.BANDS
+
+
+def test_identical_texts():
+    text = make_text(1)
+    assert simlr.estimate_similarity(simlr.get_signature(text),
+                                     simlr.get_signature(text.upper())) == 1
+
+
+def test_near_duplicate_shares_a_band():
+    text = make_text(1)
+    sig = simlr.get_signature(text)
+    near = simlr.get_signature(edit(text, 3))
+    assert simlr.estimate_similarity(sig, near) >= simlr.DUP_THRESHOLD
+    assert set(simlr.get_band_keys(sig)) & set(simlr.get_band_keys(near))
+
+
+def test_unrelated_texts():
+    sig = simlr.get_signature(make_text(1))
+    other = simlr.get_signature(make_text(2))
+    assert simlr.estimate_similarity(sig, other) < 0.1
+    assert not set(simlr.get_band_keys(sig)) & set(simlr.get_band_keys(other))
+
+
+def test_signature_survives_storage():
+    sig = simlr.get_signature(make_text(1))
+    stored = sig.astype(np.int64).tolist()
+    assert simlr.estimate_similarity(sig, stored) == 1
+
+
+def test_signature_chunks_match_whole():
+    shingles = simlr.get_shingles(make_text(1))
+    whole = ((simlr.PERM_A[:, None] * shingles[None, :]
+              + simlr.PERM_B[:, None]) % simlr.PRIME).min(axis=1)
+    with patch.object(simlr, 'SHINGLE_CHUNK', 7):
+        assert (simlr.get_signature(make_text(1)) == whole).all()
+
+
+@patch('data.db_connect.aggregate', autospec=True, return_value=[])
+@patch('data.db_connect.create_index', autospec=True)
+def test_find_similar_ranks_by_band_hits(mock_index, mock_aggregate):
+    simlr.find_similar(simlr.get_signature(make_text(1)))
+    pipeline = mock_aggregate.call_args.args[1]
+    stages = [next(iter(stage)) for stage in pipeline]
+    assert stages.index('$sort') < stages.index('$limit')
+    assert next(iter(pipeline[stages.index('$sort')]['$sort'])) \
+        == simlr.BAND_HITS
+    assert pipeline[-1]['$limit'] == simlr.MAX_CANDIDATES
+
+
+@pytest.fixture
+def original():
+    manu = ms.create_manuscript('Dup Author', 'Original', make_text(7))
+    yield manu
+    ms.delete_manuscript(manu[ms.MONGO_ID])
+
+
+def test_resubmission_is_flagged(original):
+    ms.flag_duplicates(original[ms.MONGO_ID], make_text(7))
+    resub = ms.create_manuscript('Dup Author', 'A New Title',
+                                 edit(make_text(7), 2))
+    try:
+        dups = ms.flag_duplicates(resub[ms.MONGO_ID], edit(make_text(7), 2))
+        assert str(original[ms.MONGO_ID]) in [dup[simlr.MANU_ID]
+                                              for dup in dups]
+        stored = ms.read_one_manuscript(resub[ms.MONGO_ID])
+        assert stored[ms.POSSIBLE_DUPLICATES] == dups
+    finally:
+        ms.delete_manuscript(resub[ms.MONGO_ID])
@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+
+import data.manuscripts.manuscripts as ms
+import data.manuscripts.query as qry
+import data.manuscripts.simulation as sim
+
+INITIAL = {qry.SUBMITTED: 500, qry.IN_REF_REV: 1_000, qry.PUBLISHED: 50}
+
+
+def test_build_transition_matrix():
+    cum = sim.build_transition_matrix(sim.DEFAULT_TRANSITION_PROBS)
+    assert cum.shape == (sim.NUM_STATES, sim.NUM_STATES)
+    assert np.allclose(cum[:, -1], 1.0)
+
+
+def test_build_transition_matrix_illegal_move():
+    with pytest.raises(ValueError, match='no move'):
+        sim.build_transition_matrix({qry.SUBMITTED: {qry.PUBLISHED: 1.0}})
+
+
+def test_build_transition_matrix_bad_sum():
+    with pytest.raises(ValueError, match='sum to 1'):
+        sim.build_transition_matrix({qry.SUBMITTED: {qry.REJECTED: .5}})
+
+
+def test_build_dwell_means_missing():
+    with pytest.raises(ValueError):
+        sim.build_dwell_means({}, sim.DEFAULT_TRANSITION_PROBS)
+
+
+def test_get_initial_codes():
+    codes = sim.get_initial_codes({'Submitted': 2, qry.IN_REF_REV: 1})
+    expected = [qry.STATE_INDEX[qry.SUBMITTED]] * 2
+    expected.append(qry.STATE_INDEX[qry.IN_REF_REV])
+    assert sorted(codes.tolist()) == sorted(expected)
+
+
+def test_simulate_conserves_manuscripts():
+    days = 60
+    result = sim.simulate(days=days, arrivals_per_day=50, initial=INITIAL,
+                          seed=7)
+    occupancy = result[sim.OCCUPANCY]
+    assert occupancy.shape == (days + 1, sim.NUM_STATES)
+    assert occupancy[0].sum() == sum(INITIAL.values())
+    # totals only grow, by exactly the day's arrivals
+    assert (np.diff(occupancy.sum(axis=1)) >= 0).all()
+
+
+def test_simulate_terminal_states_only_grow():
+    result = sim.simulate(days=60, initial=INITIAL, seed=3)
+    for state in qry.TERMINAL_STATES:
+        series = result[sim.OCCUPANCY][:, qry.STATE_INDEX[state]]
+        assert (np.diff(series) >= 0).all()
+
+
+def test_simulate_is_repeatable():
+    first = sim.simulate(days=30, initial=INITIAL, seed=11)
+    second = sim.simulate(days=30, initial=INITIAL, seed=11)
+    assert (first[sim.OCCUPANCY] == second[sim.OCCUPANCY]).all()
+
+
+def test_decision_percentiles():
+    result = sim.simulate(days=120, arrivals_per_day=100, seed=5)
+    pcts = sim.get_decision_percentiles(result)
+    assert 0 < pcts[50] <= pcts[90] <= pcts[95]
+
+
+def test_decision_percentiles_empty():
+    result = sim.simulate(days=5, arrivals_per_day=0, seed=5)
+    assert sim.get_decision_percentiles(result)[50] is None
+
+
+def test_get_occupancy_series():
+    result = sim.simulate(days=10, initial=INITIAL, seed=1)
+    series = sim.get_occupancy_series(result)
+    assert set(series) == set(qry.STATES)
+    assert series[qry.PUBLISHED][0] == INITIAL[qry.PUBLISHED]
+
+
+def make_exit(old: str, new: str, count: int, days: float) -> dict:
+    return {ms.MONGO_ID: {sim.FROM: old, sim.TO: new},
+            sim.COUNT: count,
+            sim.TOTAL_SECS: count * days * sim.SECS_PER_DAY}
+
+
+def test_estimate_params():
+    probs, dwell_days = sim.estimate_params([
+        make_exit(qry.SUBMITTED, qry.IN_REF_REV, 60, 2),
+        make_exit('Submitted', qry.REJECTED, 40, 2),
+        # an editor override the workflow doesn't have
+        make_exit(qry.SUBMITTED, qry.PUBLISHED, 100, 0),
+        make_exit(qry.COPY_EDIT, qry.AUTHOR_REV, 5, 1),
+    ])
+    assert probs[qry.SUBMITTED] == {qry.IN_REF_REV: .6, qry.REJECTED: .4}
+    assert dwell_days[qry.SUBMITTED] == pytest.approx(2)
+    # too few exits to trust
+    assert probs[qry.COPY_EDIT] == sim.DEFAULT_TRANSITION_PROBS[qry.COPY_EDIT]
+    assert dwell_days[qry.COPY_EDIT] == sim.DEFAULT_DWELL_DAYS[qry.COPY_EDIT]
+    sim.build_transition_matrix(probs)
+
+
+def test_estimate_params_empty():
+    assert sim.estimate_params([]) == (sim.DEFAULT_TRANSITION_PROBS,
+                                       sim.DEFAULT_DWELL_DAYS)
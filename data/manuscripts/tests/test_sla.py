@@ -0,0 +1,149 @@
+from datetime import datetime, timedelta
+
+import pytest
+from unittest.mock import patch
+
+import data.db_connect as dbc
+import data.manuscripts.archive as arch
+import data.manuscripts.manuscripts as ms
+import data.manuscripts.query as qry
+import data.manuscripts.sla as sla
+
+TEST_EDITOR = 'sla_editor@nyu.edu'
+REVIEW_EDITOR = 'sla_review_editor@nyu.edu'
+ENTERED = datetime(2024, 3, 1)
+DAY = timedelta(days=1)
+
+
+def make_row(days: float, state: str = qry.IN_REF_REV,
+             editor: str = sla.ALL_EDITORS, month: str = '2024-03',
+             count: int = 1) -> dict:
+    secs = days * sla.SECS_PER_DAY
+    return {
+        ms.MONGO_ID: {sla.STATE: state, sla.EDITOR: editor,
+                      sla.MONTH: month,
+                      sla.BUCKET: float(sla.get_bucket(secs))},
+        sla.COUNT: count,
+        sla.TOTAL_SECS: secs * count,
+    }
+
+
+def test_get_bucket_is_monotonic():
+    buckets = [sla.get_bucket(secs) for secs in range(0, 10**8, 10**5)]
+    assert buckets == sorted(buckets)
+    assert sla.get_bucket(0) == 0
+    assert sla.get_bucket(10**12) == sla.N_BUCKETS - 1
+
+
+@pytest.mark.parametrize('days', [0.5, 3, 21, 200])
+def test_bucket_mid_is_close(days):
+    secs = days * sla.SECS_PER_DAY
+    mid = sla.bucket_mid_secs(sla.get_bucket(secs))
+    assert abs(mid - secs) / secs < 0.1
+
+
+def test_percentiles():
+    deltas = sla.summarize([make_row(days) for days in range(1, 11)])
+    delta = deltas[(qry.IN_REF_REV, sla.ALL_EDITORS, '2024-03')]
+    stats = sla.get_stats(delta[sla.COUNT], delta[sla.TOTAL_SECS],
+                          delta[sla.BUCKETS])
+    assert stats[sla.COUNT] == 10
+    assert stats[sla.MEDIAN_DAYS] == pytest.approx(5, rel=0.1)
+    assert stats[sla.P90_DAYS] == pytest.approx(9, rel=0.1)
+    assert stats[sla.MEAN_DAYS] == 5.5
+
+
+def test_percentile_empty():
+    assert sla.percentile_secs({}, 0, 50) is None
+
+
+def test_summarize_merges_state_names():
+    deltas = sla.summarize([make_row(2, count=3),
+                            make_row(2, state='Referee Review'),
+                            make_row(40, editor=TEST_EDITOR,
+                                     month='2024-04')])
+    assert deltas[(qry.IN_REF_REV, sla.ALL_EDITORS, '2024-03')][
+        sla.COUNT] == 4
+    assert set(deltas) == {
+        (qry.IN_REF_REV, sla.ALL_EDITORS, '2024-03'),
+        (qry.IN_REF_REV, TEST_EDITOR, '2024-04'),
+    }
+
+
+def test_entry_stages_skip_same_state():
+    match = sla.entry_stages(ENTERED, ENTERED + DAY)[2]['$match']
+    assert match['$expr'] == {'$ne': [f'${ms.HISTORY}.{ms.HIST_FROM}',
+                                      f'${ms.HISTORY}.{ms.HIST_TO}']}
+
+
+def test_second_referee_keeps_one_review():
+    manu = ms.create_manuscript('SLA Author', 'SLA Review', 'Timed text')
+    manu_id = str(manu[ms.MONGO_ID])
+    ms.assign_editor(manu_id, REVIEW_EDITOR)
+    ms.transition_manuscript_state(manu_id, qry.ASSIGN_REF, ref='ref1')
+    since = ms.read_one_manuscript(manu_id)[ms.LATEST_VERSION][ms.STATE_SINCE]
+    ms.transition_manuscript_state(manu_id, qry.ASSIGN_REF, ref='ref2')
+    latest = ms.read_one_manuscript(manu_id)[ms.LATEST_VERSION]
+    assert latest[ms.STATE_SINCE] == since
+    ms.transition_manuscript_state(manu_id, qry.ACCEPT)
+    later = ms.get_est_time() + timedelta(seconds=2 * sla.SETTLE_SECS)
+    sla.rebuild(now=later)
+    assert sla.get_sla([qry.IN_REF_REV], REVIEW_EDITOR)[qry.IN_REF_REV][
+        sla.COUNT] == 1
+    ms.delete_manuscript(manu_id)
+
+
+def test_summary_ops():
+    ops = sla.summary_ops(sla.summarize([make_row(2)]), 'window')
+    inc = ops[0]._doc['$inc']
+    assert inc[sla.COUNT] == 1
+    assert inc[f'{sla.BUCKETS}.{sla.get_bucket(2 * sla.SECS_PER_DAY)}'] == 1
+    # a window already taken doesn't match, so it isn't counted twice
+    assert ops[0]._filter[sla.APPLIED] == {'$ne': 'window'}
+
+
+def test_get_sla_bad_month():
+    with pytest.raises(ValueError):
+        sla.get_sla(month='March')
+
+
+def test_get_sla_bad_state():
+    with pytest.raises(ValueError):
+        sla.get_sla(states=['NOPE'])
+
+
+def test_refresh_is_incremental():
+    sla.rebuild()
+    manu = ms.create_manuscript('SLA Author', 'SLA Title', 'Timed text')
+    manu_id = str(manu[ms.MONGO_ID])
+    ms.transition_manuscript_state(manu_id, qry.ASSIGN_REF, ref='ref1')
+    before = sla.get_sla([qry.SUBMITTED])[qry.SUBMITTED][sla.COUNT]
+    later = ms.get_est_time() + timedelta(seconds=2 * sla.SETTLE_SECS)
+    assert sla.refresh(now=later) >= 1
+    after = sla.get_sla([qry.SUBMITTED])[qry.SUBMITTED][sla.COUNT]
+    assert after == before + 1
+    # nothing new since the high-water mark
+    assert sla.refresh(now=later) == 0
+    ms.delete_manuscript(manu_id)
+
+
+def test_apply_summary_twice_counts_once():
+    deltas = sla.summarize([make_row(3, editor=TEST_EDITOR,
+                                     month='1999-01')])
+    sla.refresh()  # makes the indexes
+    sla.apply_summary(deltas, 'test-window')
+    sla.apply_summary(deltas, 'test-window')
+    stats = sla.get_sla([qry.IN_REF_REV], TEST_EDITOR, '1999-01')
+    assert stats[qry.IN_REF_REV][sla.COUNT] == 1
+    dbc.delete_many(sla.SLA_COLLECT, {sla.MONTH: '1999-01'})
+
+
+def test_read_rows_includes_archive():
+    pipeline = []
+    with patch('data.db_connect.aggregate', autospec=True,
+               side_effect=lambda coll, stages: pipeline.extend(stages)
+               or []):
+        sla.read_rows(ENTERED, ENTERED + DAY)
+    union = [stage['$unionWith'] for stage in pipeline
+             if '$unionWith' in stage]
+    assert union[0]['coll'] == arch.HISTORY_ARCHIVE_COLLECT
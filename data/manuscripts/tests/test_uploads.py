@@ -0,0 +1,138 @@
+import io
+import zlib
+from unittest.mock import patch
+
+import pytest
+
+import data.manuscripts.manuscripts as ms
+import data.manuscripts.uploads as upl
+
+FILE_BYTES = bytes(range(256)) * 20  # 5120 bytes
+TEST_CHUNK = 2048
+
+
+@pytest.fixture
+def upload():
+    manu = ms.create_manuscript('Upload Author', 'Uploaded', 'Text')
+    upload = upl.start_upload(manu[ms.MONGO_ID], 'paper.docx',
+                              len(FILE_BYTES))
+    yield upload
+    upl.delete_upload(upload[ms.MONGO_ID])
+    ms.delete_manuscript(manu[ms.MONGO_ID])
+
+
+def test_read_chunk():
+    assert upl.read_chunk(io.BytesIO(FILE_BYTES), len(FILE_BYTES)) \
+        == FILE_BYTES
+
+
+def test_read_chunk_too_big():
+    with pytest.raises(ValueError):
+        upl.read_chunk(io.BytesIO(FILE_BYTES), len(FILE_BYTES) - 1)
+
+
+def test_to_view_missing():
+    view = upl.to_view({
+        ms.MONGO_ID: 'x', upl.MANU_ID: 'y', upl.FILENAME: 'f',
+        upl.CONTENT_TYPE: upl.DEFAULT_CONTENT_TYPE,
+        upl.CHUNK_SIZE_FLD: TEST_CHUNK, upl.STATUS: upl.UPLOADING,
+        upl.RECEIVED: [3, 0],
+    })
+    assert view[upl.RECEIVED] == [0, 3]
+    assert view[upl.MISSING] == [1, 2]
+
+
+def test_to_view_missing_trailing():
+    view = upl.to_view({
+        ms.MONGO_ID: 'x', upl.MANU_ID: 'y', upl.FILENAME: 'f',
+        upl.CONTENT_TYPE: upl.DEFAULT_CONTENT_TYPE,
+        upl.CHUNK_SIZE_FLD: TEST_CHUNK, upl.SIZE: len(FILE_BYTES),
+        upl.STATUS: upl.UPLOADING, upl.RECEIVED: [0],
+    })
+    assert view[upl.MISSING] == [1, 2]
+
+
+def test_start_upload_bad_size():
+    with pytest.raises(ValueError):
+        upl.start_upload('any', 'big.docx', upl.MAX_FILE_BYTES + 1)
+
+
+@pytest.mark.parametrize('size', [None, '10', 1.5, True])
+def test_start_upload_size_not_int(size):
+    with pytest.raises(ValueError):
+        upl.start_upload('any', 'paper.docx', size)
+
+
+def test_content_disposition():
+    header = upl.content_disposition('a"b\r\nX-Evil: 1 é.pdf')
+    assert '\r' not in header and '\n' not in header
+    assert 'filename="a_b__X-Evil: 1 _.pdf"' in header
+    assert "filename*=UTF-8''a%22b%0D%0AX-Evil%3A%201%20%C3%A9.pdf" in header
+
+
+def test_delete_manuscript_deletes_uploads():
+    manu = ms.create_manuscript('Upload Author', 'Withdrawn', 'Text')
+    upload = upl.start_upload(manu[ms.MONGO_ID], 'paper.docx',
+                              len(FILE_BYTES))
+    upl.put_chunk(upload[ms.MONGO_ID], 0, io.BytesIO(FILE_BYTES))
+    ms.delete_manuscript(manu[ms.MONGO_ID])
+    assert upl.read_upload(upload[ms.MONGO_ID]) is None
+    assert not list(upl.iter_chunks(upload[ms.MONGO_ID]))
+
+
+def test_expire_uploads(upload):
+    assert upl.expire_uploads(hours=1) == 0
+    assert upl.expire_uploads(hours=-1) >= 1
+    assert upl.read_upload(upload[ms.MONGO_ID]) is None
+
+
+def test_resumed_upload(upload):
+    upload_id = upload[ms.MONGO_ID]
+    # shrink chunks so the test file spans three of them
+    shrink_chunks(upload_id)
+    chunks = [FILE_BYTES[i:i + TEST_CHUNK]
+              for i in range(0, len(FILE_BYTES), TEST_CHUNK)]
+    upl.put_chunk(upload_id, 2, io.BytesIO(chunks[2]))
+    upl.put_chunk(upload_id, 0, io.BytesIO(chunks[0]))
+    with pytest.raises(ValueError):
+        upl.complete_upload(upload_id)
+    assert upl.to_view(upl.read_upload(upload_id))[upl.MISSING] == [1]
+    upl.put_chunk(upload_id, 1, io.BytesIO(chunks[1]))
+    done = upl.complete_upload(upload_id, crc32=zlib.crc32(FILE_BYTES))
+    assert done[upl.STATUS] == upl.COMPLETE
+    assert done[upl.LENGTH] == len(FILE_BYTES)
+    assert b''.join(upl.iter_file(upload_id)) == FILE_BYTES
+    manu = ms.read_one_manuscript(upload[upl.MANU_ID])
+    assert manu[ms.LATEST_VERSION][ms.FILE][upl.CRC32] \
+        == zlib.crc32(FILE_BYTES)
+
+
+def shrink_chunks(upload_id):
+    upl.dbc.update(upl.UPLOADS_COLLECT,
+                   {ms.MONGO_ID: upl.to_obj_id(upload_id)},
+                   {upl.CHUNK_SIZE_FLD: TEST_CHUNK})
+
+
+def test_truncated_upload_fails(upload):
+    upload_id = upload[ms.MONGO_ID]
+    shrink_chunks(upload_id)
+    upl.put_chunk(upload_id, 0, io.BytesIO(FILE_BYTES[:TEST_CHUNK]))
+    upl.put_chunk(upload_id, 1, io.BytesIO(FILE_BYTES[TEST_CHUNK:
+                                                      2 * TEST_CHUNK]))
+    with pytest.raises(ValueError, match='Chunk 2 is missing'):
+        upl.complete_upload(upload_id)
+    assert upl.read_upload(upload_id)[upl.STATUS] == upl.UPLOADING
+    with pytest.raises(ValueError):
+        upl.put_chunk(upload_id, 3, io.BytesIO(b'x'))
+
+
+def test_no_chunks_after_complete(upload):
+    upload_id = upload[ms.MONGO_ID]
+    upl.put_chunk(upload_id, 0, io.BytesIO(FILE_BYTES))
+    upl.complete_upload(upload_id)
+    # a PUT that read the status before the upload was completed
+    with patch.object(upl, 'read_upload', return_value={
+            **upl.read_upload(upload_id), upl.STATUS: upl.UPLOADING}):
+        with pytest.raises(ValueError):
+            upl.put_chunk(upload_id, 0, io.BytesIO(b'late'))
+    assert b''.join(upl.iter_file(upload_id)) == FILE_BYTES
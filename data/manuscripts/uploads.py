@@ -0,0 +1,368 @@
+"""
+Chunked, resumable manuscript file uploads.
+A client starts an upload, declaring the file's size, PUTs the file in
+CHUNK_SIZE pieces (in any order, retrying any that failed), then
+completes it. Each chunk is stored as its own document, so neither the
+server nor Mongo ever holds more than one chunk of a file at a time.
+Completing seals the chunks so no PUT can change them, checks that
+every chunk is there and that they add up to the declared size, runs a
+CRC-32 over the whole file chunk by chunk, and links the file to the
+manuscript.
+Uploads that are never completed are swept away after EXPIRE_HOURS:
+    python -m data.manuscripts.uploads --hours 24
+"""
+import argparse
+import re
+import zlib
+from datetime import timedelta
+from functools import wraps
+from urllib.parse import quote
+
+from bson.binary import Binary
+from bson.objectid import ObjectId
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError
+
+import data.db_connect as dbc
+import data.manuscripts.manuscripts as ms
+
+UPLOADS_COLLECT = 'uploads'
+CHUNKS_COLLECT = 'upload_chunks'
+
+# upload fields
+MANU_ID = 'manu_id'
+FILENAME = 'filename'
+CONTENT_TYPE = 'content_type'
+CHUNK_SIZE_FLD = 'chunk_size'
+SIZE = 'size'  # declared when the upload is started
+RECEIVED = 'received'  # chunk indexes stored so far
+STATUS = 'status'
+LENGTH = 'length'
+CRC32 = 'crc32'
+CREATED = 'created'
+MISSING = 'missing'
+
+# chunk fields
+UPLOAD_ID = 'upload_id'
+INDEX = 'n'
+DATA = 'data'
+SEALED = 'sealed'  # set while completing, and for good once complete
+
+UPLOADING = 'uploading'
+COMPLETING = 'completing'
+COMPLETE = 'complete'
+
+CHUNK_SIZE = 1024 * 1024
+READ_SIZE = 64 * 1024
+MAX_FILE_BYTES = 100 * 1024 * 1024
+MAX_CHUNKS = MAX_FILE_BYTES // CHUNK_SIZE
+DEFAULT_CONTENT_TYPE = 'application/octet-stream'
+EXPIRE_HOURS = 24
+
+indexed = False
+
+
+def needs_index(fn):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        global indexed
+        if not indexed:
+            dbc.create_index(CHUNKS_COLLECT, [(UPLOAD_ID, 1), (INDEX, 1)],
+                             unique=True)
+            indexed = True
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+def to_obj_id(upload_id):
+    if not ObjectId.is_valid(str(upload_id)):
+        return None
+    return ObjectId(str(upload_id))
+
+
+def read_upload(upload_id) -> dict:
+    obj_id = to_obj_id(upload_id)
+    if not obj_id:
+        return None
+    return dbc.read_one(UPLOADS_COLLECT, {dbc.MONGO_ID: obj_id})
+
+
+def get_num_chunks(upload: dict) -> int:
+    """
+    How many chunks the declared size takes, or None for uploads
+    started before sizes were kept.
+    """
+    if upload.get(SIZE) is None:
+        return None
+    return -(-upload[SIZE] // upload[CHUNK_SIZE_FLD])
+
+
+def to_view(upload: dict) -> dict:
+    """
+    An upload's status for the client, including which chunks it still
+    has to send.
+    """
+    received = sorted(upload.get(RECEIVED, []))
+    top = get_num_chunks(upload)
+    if top is None:
+        top = received[-1] + 1 if received else 0
+    return {
+        dbc.MONGO_ID: str(upload[dbc.MONGO_ID]),
+        MANU_ID: upload[MANU_ID],
+        FILENAME: upload[FILENAME],
+        CONTENT_TYPE: upload[CONTENT_TYPE],
+        CHUNK_SIZE_FLD: upload[CHUNK_SIZE_FLD],
+        SIZE: upload.get(SIZE),
+        STATUS: upload[STATUS],
+        RECEIVED: received,
+        MISSING: sorted(set(range(top)) - set(received)),
+        LENGTH: upload.get(LENGTH),
+        CRC32: upload.get(CRC32),
+    }
+
+
+def start_upload(manu_id: str, filename: str, size: int,
+                 content_type: str = DEFAULT_CONTENT_TYPE) -> dict:
+    """
+    Open an upload of a `size` byte file for a manuscript. Returns None
+    if there is no such manuscript.
+    """
+    if not filename:
+        raise ValueError('A filename is required')
+    if size is None:
+        raise ValueError('The file size is required')
+    if not isinstance(size, int) or isinstance(size, bool):
+        raise ValueError('size must be a whole number of bytes')
+    if not 0 < size <= MAX_FILE_BYTES:
+        raise ValueError(f'Files must be 1 to {MAX_FILE_BYTES} bytes')
+    if not ms.read_states([manu_id]):
+        return None
+    upload = {
+        MANU_ID: str(manu_id),
+        FILENAME: filename,
+        CONTENT_TYPE: content_type or DEFAULT_CONTENT_TYPE,
+        CHUNK_SIZE_FLD: CHUNK_SIZE,
+        SIZE: size,
+        STATUS: UPLOADING,
+        RECEIVED: [],
+        CREATED: ms.get_est_time(),
+    }
+    upload[dbc.MONGO_ID] = dbc.create(UPLOADS_COLLECT, upload).inserted_id
+    return to_view(upload)
+
+
+def read_chunk(stream, limit: int = CHUNK_SIZE) -> bytes:
+    """
+    Read at most `limit` bytes from a stream in READ_SIZE pieces.
+    Raises ValueError if there is more.
+    """
+    parts = []
+    length = 0
+    while True:
+        part = stream.read(min(READ_SIZE, limit + 1 - length))
+        if not part:
+            break
+        parts.append(part)
+        length += len(part)
+        if length > limit:
+            raise ValueError(f'Chunks are at most {limit} bytes')
+    return b''.join(parts)
+
+
+@needs_index
+def put_chunk(upload_id, index: int, stream) -> dict:
+    """
+    Store chunk `index` from a file-like stream. Sending the same chunk
+    again replaces it, which is what makes uploads resumable. A sealed
+    chunk can't be replaced: the write would upsert a second chunk
+    `index`, which the unique index refuses.
+    Returns None if there is no such upload.
+    """
+    upload = read_upload(upload_id)
+    if not upload:
+        return None
+    if upload[STATUS] != UPLOADING:
+        raise ValueError('This upload is no longer taking chunks')
+    num_chunks = get_num_chunks(upload) or MAX_CHUNKS
+    if not 0 <= index < num_chunks:
+        raise ValueError(f'Chunk index must be 0 to {num_chunks - 1}')
+    data = read_chunk(stream, upload[CHUNK_SIZE_FLD])
+    if not data:
+        raise ValueError('Empty chunk')
+    obj_id = to_obj_id(upload_id)
+    try:
+        dbc.bulk_write(CHUNKS_COLLECT, [ReplaceOne(
+            {UPLOAD_ID: obj_id, INDEX: index, SEALED: {'$ne': True}},
+            {UPLOAD_ID: obj_id, INDEX: index,
+             DATA: Binary(data), CRC32: zlib.crc32(data)},
+            upsert=True)])
+    except BulkWriteError as err:
+        if not dbc.only_duplicates(err):
+            raise
+        raise ValueError('This upload is no longer taking chunks')
+    dbc.update(UPLOADS_COLLECT, {dbc.MONGO_ID: obj_id, STATUS: UPLOADING},
+               {RECEIVED: index}, action='$addToSet')
+    return {INDEX: index, LENGTH: len(data), CRC32: zlib.crc32(data)}
+
+
+def iter_chunks(upload_id):
+    """
+    Yield a file's chunk docs in order, one at a time.
+    """
+    return dbc.read_iter(CHUNKS_COLLECT, {UPLOAD_ID: to_obj_id(upload_id)},
+                         sort=[(INDEX, 1)])
+
+
+def check_chunks(upload: dict, crc32: int = None) -> tuple:
+    """
+    Checksum a sealed upload's chunks in order. Returns (length, crc32),
+    or raises ValueError if the file isn't whole and as declared.
+    """
+    running_crc = 0
+    length = 0
+    expected = 0
+    chunk_size = upload[CHUNK_SIZE_FLD]
+    num_chunks = get_num_chunks(upload)
+    if num_chunks is None:
+        raise ValueError('This upload has no declared size; start again')
+    for chunk in iter_chunks(upload[dbc.MONGO_ID]):
+        if chunk[INDEX] != expected:
+            raise ValueError(f'Chunk {expected} is missing')
+        if not chunk.get(SEALED):
+            raise ValueError(f'Chunk {expected} changed while completing; '
+                             'complete again')
+        if chunk[CRC32] != zlib.crc32(chunk[DATA]):
+            raise ValueError(f'Chunk {expected} is corrupt; send it again')
+        if len(chunk[DATA]) < chunk_size and expected + 1 < num_chunks:
+            raise ValueError(f'Chunk {expected} is short; send it again')
+        running_crc = zlib.crc32(chunk[DATA], running_crc)
+        length += len(chunk[DATA])
+        expected += 1
+    if not expected:
+        raise ValueError('Nothing has been uploaded')
+    if expected < num_chunks:
+        raise ValueError(f'Chunk {expected} is missing')
+    if length != upload[SIZE]:
+        raise ValueError(f'Received {length} bytes of a {upload[SIZE]} '
+                         'byte file')
+    if crc32 is not None and crc32 != running_crc:
+        raise ValueError('Checksum mismatch: the file differs from what '
+                         'was sent')
+    return length, running_crc
+
+
+@needs_index
+def complete_upload(upload_id, crc32: int = None) -> dict:
+    """
+    Check the upload is whole, checksum it and attach it to its
+    manuscript. If the client sends the CRC-32 it computed, it must
+    match. The chunks are sealed first and stay sealed, so a late PUT
+    can't change a file once it has been checked. If the check fails
+    they are unsealed again for the client to fix. Returns None if
+    there is no such upload.
+    """
+    obj_id = to_obj_id(upload_id)
+    if not obj_id:
+        return None
+    upload = dbc.find_one_and_update(
+        UPLOADS_COLLECT, {dbc.MONGO_ID: obj_id, STATUS: UPLOADING},
+        {'$set': {STATUS: COMPLETING}})
+    if not upload:
+        upload = read_upload(obj_id)
+        if not upload:
+            return None
+        if upload[STATUS] == COMPLETE:
+            return to_view(upload)
+        raise ValueError('This upload is already being completed')
+    dbc.update_many(CHUNKS_COLLECT, {UPLOAD_ID: obj_id},
+                    {'$set': {SEALED: True}})
+    try:
+        length, running_crc = check_chunks(upload, crc32)
+    except ValueError:
+        dbc.update_many(CHUNKS_COLLECT, {UPLOAD_ID: obj_id},
+                        {'$set': {SEALED: False}})
+        dbc.update(UPLOADS_COLLECT, {dbc.MONGO_ID: obj_id},
+                   {STATUS: UPLOADING})
+        raise
+    dbc.update(UPLOADS_COLLECT, {dbc.MONGO_ID: obj_id},
+               {STATUS: COMPLETE, LENGTH: length, CRC32: running_crc})
+    # ms imports this module, so its names can't be used at import time
+    file_fld = f'{ms.LATEST_VERSION}.{ms.FILE}'
+    dbc.update(ms.MANUSCRIPTS_COLLECT,
+               {dbc.MONGO_ID: ObjectId(upload[MANU_ID])},
+               {file_fld: {UPLOAD_ID: str(upload_id),
+                           FILENAME: upload[FILENAME],
+                           CONTENT_TYPE: upload[CONTENT_TYPE],
+                           LENGTH: length,
+                           CRC32: running_crc}})
+    upload.update({STATUS: COMPLETE, LENGTH: length, CRC32: running_crc})
+    return to_view(upload)
+
+
+def iter_file(upload_id):
+    """
+    Yield a completed file's bytes a chunk at a time, for streaming.
+    """
+    for chunk in iter_chunks(upload_id):
+        yield bytes(chunk[DATA])
+
+
+def delete_upload(upload_id) -> bool:
+    obj_id = to_obj_id(upload_id)
+    if not obj_id:
+        return False
+    dbc.delete_many(CHUNKS_COLLECT, {UPLOAD_ID: obj_id})
+    return dbc.delete(UPLOADS_COLLECT, {dbc.MONGO_ID: obj_id}) > 0
+
+
+def delete_uploads(filt: dict) -> int:
+    """
+    Delete every upload matching filt, with its chunks. Returns the
+    number of uploads deleted.
+    """
+    upload_ids = [to_obj_id(upload[dbc.MONGO_ID]) for upload in
+                  dbc.read_many(UPLOADS_COLLECT, filt,
+                                projection={dbc.MONGO_ID: 1})]
+    if not upload_ids:
+        return 0
+    dbc.delete_many(CHUNKS_COLLECT, {UPLOAD_ID: {'$in': upload_ids}})
+    return dbc.delete_many(UPLOADS_COLLECT,
+                           {dbc.MONGO_ID: {'$in': upload_ids}})
+
+
+def delete_manuscript_uploads(manu_ids: list) -> int:
+    return delete_uploads({MANU_ID: {'$in': [str(manu_id)
+                                             for manu_id in manu_ids]}})
+
+
+def expire_uploads(hours: float = EXPIRE_HOURS) -> int:
+    """
+    Delete uploads started more than `hours` ago and never completed.
+    """
+    cutoff = ms.get_est_time() - timedelta(hours=hours)
+    return delete_uploads({STATUS: {'$in': [UPLOADING, COMPLETING]},
+                           CREATED: {'$lt': cutoff}})
+
+
+def content_disposition(filename: str) -> str:
+    """
+    An attachment header that can't be broken out of by the filename:
+    an ASCII fallback with quotes, backslashes and control characters
+    replaced, and the real name percent-encoded per RFC 6266.
+    """
+    fallback = re.sub(r'[^\x20-\x7e]|["\\]', '_', filename)
+    return (f'attachment; filename="{fallback}"; '
+            f"filename*=UTF-8''{quote(filename, safe='')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Delete uploads that were never completed.')
+    parser.add_argument('--hours', type=float, default=EXPIRE_HOURS,
+                        help='How long ago an upload must have started')
+    args = parser.parse_args()
+    print(f'Expired {expire_uploads(args.hours)} uploads.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+"""
+Versioned data migrations that run online, in batches, alongside live
+traffic. A migration picks the docs in one collection that still need
+changing with a filter and says how to change each one. The runner
+walks the matches in _id order a batch at a time and sends each batch
+as one bulk write. Progress is saved in the migrations collection after
+every batch, so a stopped run picks up where it left off.
+
+Each update is guarded by the migration's filter, so a doc that a
+request changed since we read it is left alone. That also makes it
+safe to run the same migration twice.
+
+Migrations register themselves with @migration(...) in the modules
+listed in MIGRATION_MODULES. Run them with `python -m data.migrations`.
+"""
+import argparse
+import importlib
+import time
+from datetime import datetime
+
+from bson.objectid import ObjectId
+from pymongo import UpdateOne
+
+import data.db_connect as dbc
+
+MIGRATIONS_COLLECT = 'migrations'
+
+NAME = 'name'
+STATUS = 'status'
+LAST_ID = 'last_id'
+MIGRATED = 'migrated'
+STARTED = 'started'
+FINISHED = 'finished'
+
+RUNNING = 'running'
+DONE = 'done'
+
+BATCH_SIZE = 500
+PAUSE_SECS = 0.0
+
+MIGRATION_MODULES = ['data.manuscripts.migrations']
+
+# version: {name, collection, filt, projection, fn}
+MIGRATIONS = {}
+
+MONGO_ID = dbc.MONGO_ID
+
+dbc.connect_db()
+
+
+def migration(version: int, collection: str, filt: dict,
+              projection: dict = None):
+    """
+    Register `fn(doc) -> update` as migration `version`. It is called
+    for each doc in `collection` matching `filt` and returns the update
+    document for it, or None to leave it be.
+    """
+    def register(fn):
+        if version in MIGRATIONS:
+            raise ValueError(f'Migration {version} is already defined')
+        MIGRATIONS[version] = {
+            NAME: fn.__name__,
+            'collection': collection,
+            'filt': filt,
+            'projection': projection,
+            'fn': fn,
+        }
+        return fn
+    return register
+
+
+def load_migrations():
+    for module in MIGRATION_MODULES:
+        importlib.import_module(module)
+
+
+def get_status() -> dict:
+    """
+    {version: progress doc} for every migration that has been started.
+    """
+    return {doc[MONGO_ID]: doc
+            for doc in dbc.read_many(MIGRATIONS_COLLECT, {})}
+
+
+def start(version: int) -> dict:
+    dbc.update_one(MIGRATIONS_COLLECT, {MONGO_ID: version},
+                   {'$setOnInsert': {NAME: MIGRATIONS[version][NAME],
+                                     STATUS: RUNNING,
+                                     LAST_ID: None,
+                                     MIGRATED: 0,
+                                     STARTED: datetime.now()}},
+                   upsert=True)
+    return dbc.read_one(MIGRATIONS_COLLECT, {MONGO_ID: version})
+
+
+def migrate_batch(mig: dict, after: ObjectId, batch_size: int) -> tuple:
+    """
+    Migrate the next batch after `after`.
+    Returns (last _id seen or None when done, docs changed).
+    """
+    filt = mig['filt']
+    if after:
+        filt = {**filt, MONGO_ID: {'$gt': after}}
+    docs = dbc.read_many(mig['collection'], filt,
+                         projection=mig['projection'],
+                         sort=[(MONGO_ID, 1)], limit=batch_size)
+    if not docs:
+        return None, 0
+    ops = []
+    for doc in docs:
+        update = mig['fn'](doc)
+        if update:
+            ops.append(UpdateOne({**mig['filt'],
+                                  MONGO_ID: ObjectId(doc[MONGO_ID])},
+                                 update))
+    result = dbc.bulk_write(mig['collection'], ops)
+    return (ObjectId(docs[-1][MONGO_ID]),
+            result.modified_count if result else 0)
+
+
+def run_migration(version: int, batch_size: int = BATCH_SIZE,
+                  pause_secs: float = PAUSE_SECS, progress=None) -> int:
+    """
+    Run one migration to the end, resuming from its last checkpoint.
+    `progress(version, migrated)` is called after each batch.
+    Returns the number of docs it has changed in all.
+    """
+    mig = MIGRATIONS[version]
+    status = start(version)
+    if status[STATUS] == DONE:
+        return status[MIGRATED]
+    last_id = status[LAST_ID]
+    migrated = status[MIGRATED]
+    while True:
+        last_id, changed = migrate_batch(mig, last_id, batch_size)
+        if last_id is None:
+            break
+        migrated += changed
+        dbc.update_one(MIGRATIONS_COLLECT, {MONGO_ID: version},
+                       {'$set': {LAST_ID: last_id, MIGRATED: migrated}})
+        if progress:
+            progress(version, migrated)
+        if pause_secs:
+            time.sleep(pause_secs)
+    dbc.update_one(MIGRATIONS_COLLECT, {MONGO_ID: version},
+                   {'$set': {STATUS: DONE, FINISHED: datetime.now()}})
+    return migrated
+
+
+def migrate(to_version: int = None, batch_size: int = BATCH_SIZE,
+            pause_secs: float = PAUSE_SECS, progress=None) -> list:
+    """
+    Run every migration up to `to_version` (default: all) in order.
+    Returns the versions that were run.
+    """
+    load_migrations()
+    ran = []
+    for version in sorted(MIGRATIONS):
+        if to_version is not None and version > to_version:
+            break
+        run_migration(version, batch_size, pause_secs, progress)
+        ran.append(version)
+    return ran
+
+
+def print_progress(version: int, migrated: int):
+    print(f'Migration {version}: {migrated} docs changed so far.')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run data migrations.')
+    parser.add_argument('--to', type=int, help='Stop after this version')
+    parser.add_argument('--batch', type=int, default=BATCH_SIZE)
+    parser.add_argument('--pause', type=float, default=PAUSE_SECS,
+                        help='Seconds to sleep between batches')
+    parser.add_argument('--status', action='store_true',
+                        help='Show progress instead of migrating')
+    args = parser.parse_args()
+    if args.status:
+        load_migrations()
+        status = get_status()
+        for version in sorted(MIGRATIONS):
+            doc = status.get(version, {})
+            print(f'{version}: {MIGRATIONS[version][NAME]} '
+                  f'{doc.get(STATUS, "pending")} ({doc.get(MIGRATED, 0)})')
+        return
+    migrate(args.to, args.batch, args.pause, print_progress)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,12 @@
-#!/bin/sh
-# Script to backup production database to JSON files.
-
-. ./common.sh
-
-for collection in ${GameCollections[@]}; do
-    echo "Restoring $collection"
-    $IMP --db=$DB --collection $collection --drop --file $BKUP_DIR/$collection.json
-done
+#!/bin/sh
+# Script to restore the database from a backup made by bkup.sh.
+# Usage: restore.sh <backup directory> [--db name] [--collection name]
+
+. "$(dirname "$0")/common.sh"
+
+if [ -z "$1" ]
+then
+    echo "Usage: $0 <backup directory> [options]"
+    exit 1
+fi
+python3 -m data.backup restore "$@"
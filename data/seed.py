@@ -0,0 +1,338 @@
+"""
+Fill a dev or test database with realistic synthetic data, at up to
+millions of documents, so scaling problems show up before production.
+  - people, with roles drawn from data/roles.py,
+  - text pages,
+  - manuscripts, each walked through the query.STATE_TABLE workflow
+    from its submission date to today with the transition odds and
+    dwell times from simulation.py, leaving a matching history doc.
+Bodies follow a Zipf vocabulary and lognormal lengths. Manuscripts
+are generated and bulk-inserted in chunks by a pool of processes, each
+chunk with its near-duplicate signatures; indexes, counters, referee
+workloads and the SLA summary are built once at the end.
+  python -m data.seed --manuscripts 1000000 --procs 8
+Seeded people have @example.org emails. The same --seed makes the same
+people and pages, so a second run skips the ones already there and adds
+only manuscripts.
+"""
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+import pymongo as pm
+from bson.objectid import ObjectId
+
+import data.db_connect as dbc
+import data.manuscripts.counters as cntrs
+import data.manuscripts.manuscripts as ms
+import data.manuscripts.query as qry
+import data.manuscripts.referees as refs
+import data.manuscripts.similarity as simlr
+import data.manuscripts.simulation as sim
+import data.manuscripts.sla as sla
+import data.people as ppl
+import data.roles as rls
+import data.text as txt
+
+DEFAULT_MANUSCRIPTS = 10_000
+MANUSCRIPTS_PER_PERSON = 5
+DEFAULT_PAGES = 100
+DEFAULT_PROCS = os.cpu_count() or 2
+CHUNK_SIZE = 5000
+DEFAULT_SPAN_DAYS = 3 * 365  # submissions are spread over this long
+DEFAULT_WORDS = 3000  # median manuscript length
+WORDS_SIGMA = 0.5
+MAX_WORDS = 30_000
+VOCAB_SIZE = 20_000
+ZIPF_A = 1.2
+
+EMAIL_DOMAIN = 'example.org'
+AFFILIATIONS = ['NYU', 'Columbia', 'MIT', 'Stanford', 'Oxford', 'ETH Zurich',
+                'University of Tokyo', 'McGill', 'UCL', 'Tsinghua']
+
+# Most people only write; some referee, a few edit.
+ROLE_WEIGHTS = {
+    rls.AUTHOR_CODE: .70,
+    rls.RE_CODE: .22,
+    rls.ED_CODE: .04,
+    rls.ME_CODE: .02,
+    rls.CE_CODE: .02,
+}
+AUTHOR_REFEREE_ODDS = .3  # referees who also submit
+MAX_REFEREES = 3
+
+# set per worker process by init_worker()
+_people = None
+_vocab = None
+
+
+def make_vocab(rng, size: int = VOCAB_SIZE) -> np.ndarray:
+    letters = np.array(list('abcdefghijklmnopqrstuvwxyz'))
+    lengths = rng.integers(3, 11, size)
+    return np.array([''.join(rng.choice(letters, length))
+                     for length in lengths])
+
+
+def make_words(rng, vocab: np.ndarray, count: int) -> str:
+    picks = np.minimum(rng.zipf(ZIPF_A, count), len(vocab)) - 1
+    return ' '.join(vocab[picks].tolist())
+
+
+def make_person(rng, vocab: np.ndarray, num: int) -> dict:
+    roles = [rng.choice(list(ROLE_WEIGHTS), p=list(ROLE_WEIGHTS.values()))]
+    if roles[0] == rls.RE_CODE and rng.random() < AUTHOR_REFEREE_ODDS:
+        roles.append(rls.AUTHOR_CODE)
+    first, last = (word.title() for word in rng.choice(vocab, 2))
+    return {
+        ppl.NAME: f'{first} {last}',
+        ppl.AFFILIATION: str(rng.choice(AFFILIATIONS)),
+        ppl.EMAIL: f'{first.lower()}.{last.lower()}.{num}@{EMAIL_DOMAIN}',
+        ppl.ROLES: [str(role) for role in roles],
+    }
+
+
+def make_people(rng, vocab: np.ndarray, count: int) -> list:
+    people = [make_person(rng, vocab, num) for num in range(count)]
+    # every role needs somebody in it, however small the run
+    for num, role in enumerate(ROLE_WEIGHTS):
+        if count > num:
+            people[num][ppl.ROLES] = [role]
+    return people
+
+
+def get_role_pools(people: list) -> dict:
+    """
+    {role: [(name, email)]}, so workers can pick people by role.
+    """
+    pools = {role: [] for role in ROLE_WEIGHTS}
+    for person in people:
+        for role in person[ppl.ROLES]:
+            pools[role].append((person[ppl.NAME], person[ppl.EMAIL]))
+    return pools
+
+
+def get_actions() -> dict:
+    """
+    {(state, next state): the action that makes that move}.
+    """
+    actions = {}
+    for state, row in qry.STATE_TABLE.items():
+        for action, entry in row.items():
+            if action in qry.OVERRIDE_ACTIONS:
+                continue
+            for target in qry.get_targets(entry):
+                actions.setdefault((state, target), action)
+    return actions
+
+
+ACTIONS = get_actions()
+
+
+def walk(rng, created: datetime, now: datetime) -> list:
+    """
+    Walk one manuscript through the workflow from `created` until it
+    finishes or catches up with `now`. Returns its moves as
+    [(from, to, entered from, left)].
+    """
+    moves = []
+    state, entered = qry.SUBMITTED, created
+    while state in sim.DEFAULT_TRANSITION_PROBS:
+        mean = sim.DEFAULT_DWELL_DAYS[state]
+        shape = sim.DEFAULT_DWELL_SHAPE
+        left = entered + timedelta(days=rng.gamma(shape, mean / shape))
+        if left > now:
+            break
+        odds = sim.DEFAULT_TRANSITION_PROBS[state]
+        target = str(rng.choice(list(odds), p=list(odds.values())))
+        moves.append((state, target, entered, left))
+        state, entered = target, left
+    return moves
+
+
+def pick(rng, pool: list, count: int = 1) -> list:
+    if not pool:
+        return []
+    return [pool[i] for i in rng.choice(len(pool), min(count, len(pool)),
+                                        replace=False)]
+
+
+def make_manuscript(rng, vocab: np.ndarray, pools: dict, now: datetime,
+                    span_days: float, words: int) -> tuple:
+    """
+    One manuscript and its history doc, with their ids already set.
+    """
+    manu_id, his_id = ObjectId(), ObjectId()
+    created = now - timedelta(days=rng.uniform(0, span_days))
+    moves = walk(rng, created, now)
+    author = pick(rng, pools[rls.AUTHOR_CODE])
+    editors = [{ms.EDITOR_EMAIL: email, ms.EDITOR_ROLE: rls.ED_CODE}
+               for _, email in pick(rng, pools[rls.ED_CODE])]
+    editor_emails = [editor[ms.EDITOR_EMAIL] for editor in editors]
+    referees = []
+    history = []
+    for old_state, new_state, entered, left in moves:
+        if ACTIONS[(old_state, new_state)] == qry.ASSIGN_REF:
+            count = int(rng.integers(1, MAX_REFEREES + 1))
+            referees = [email for _, email
+                        in pick(rng, pools[rls.RE_CODE], count)]
+        history.append({
+            ms.HIST_FROM: old_state,
+            ms.HIST_TO: new_state,
+            ms.HIST_ACTION: ACTIONS[(old_state, new_state)],
+            ms.HIST_AT: left,
+            ms.HIST_ENTERED: entered,
+            ms.HIST_EDITORS: editor_emails,
+        })
+    num_words = int(min(MAX_WORDS,
+                        rng.lognormal(np.log(words), WORDS_SIGMA)))
+    manu = {
+        ms.MONGO_ID: manu_id,
+        ms.AUTHOR_NAME: author[0][0] if author else 'Anonymous',
+        ms.MANUSCRIPT_CREATED: created,
+        ms.LATEST_VERSION: {
+            ms.STATE: moves[-1][1] if moves else qry.SUBMITTED,
+            ms.STATE_SINCE: moves[-1][3] if moves else created,
+            ms.TITLE: make_words(rng, vocab,
+                                 int(rng.integers(4, 12))).capitalize(),
+            ms.VERSION: 1,
+            ms.TEXT: make_words(rng, vocab, num_words),
+            ms.WORD_COUNT: num_words,
+            ms.REFEREES: referees,
+            ms.EDITORS: editors,
+            ms.EDITOR_COMMENTS: {},
+        },
+        ms.MANUSCRIPT_HISTORY_FK: his_id,
+    }
+    his = {ms.MONGO_ID: his_id, ms.MANUSCRIPT_FK: manu_id,
+           ms.HISTORY: history}
+    return manu, his
+
+
+def init_worker(people: list, vocab: np.ndarray):
+    global _people, _vocab
+    dbc.connect_db()
+    _people = get_role_pools(people)
+    _vocab = vocab
+
+
+def seed_chunk(seed: int, chunk: int, count: int, now: datetime,
+               span_days: float, words: int) -> int:
+    """
+    Generate and insert one chunk of manuscripts. Runs in a worker.
+    """
+    rng = np.random.default_rng([seed, chunk])
+    pairs = [make_manuscript(rng, _vocab, _people, now, span_days, words)
+             for _ in range(count)]
+    dbc.create_many(ms.MANUSCRIPT_HISTORY_COLLECT, [his for _, his in pairs])
+    dbc.create_many(ms.MANUSCRIPTS_COLLECT, [manu for manu, _ in pairs])
+    simlr.index_manuscripts((manu[ms.MONGO_ID],
+                             manu[ms.LATEST_VERSION][ms.TEXT])
+                            for manu, _ in pairs)
+    return count
+
+
+def insert_new(collection: str, key: str, docs: list) -> int:
+    """
+    Insert the docs whose `key` isn't in the collection yet, a chunk at
+    a time. Returns the number inserted.
+    """
+    inserted = 0
+    for start in range(0, len(docs), CHUNK_SIZE):
+        chunk = docs[start:start + CHUNK_SIZE]
+        there = {doc[key] for doc in dbc.read_many(
+            collection, {key: {'$in': [doc[key] for doc in chunk]}},
+            projection={key: 1})}
+        chunk = [doc for doc in chunk if doc[key] not in there]
+        if not chunk:
+            continue
+        try:
+            inserted += len(dbc.create_many(collection, chunk).inserted_ids)
+        except pm.errors.BulkWriteError as err:
+            # someone else added some since we looked
+            if not dbc.only_duplicates(err):
+                raise
+            inserted += err.details['nInserted']
+    return inserted
+
+
+def seed_pages(rng, vocab: np.ndarray, count: int) -> int:
+    return insert_new(txt.TEXT_COLLECTION, txt.KEY, [
+        {txt.KEY: f'SeedPage{num}',
+         txt.TITLE: make_words(rng, vocab, 3).title(),
+         txt.TEXT: make_words(rng, vocab, int(rng.integers(50, 500)))}
+        for num in range(count)])
+
+
+def seed(manuscripts: int = DEFAULT_MANUSCRIPTS, people: int = None,
+         pages: int = DEFAULT_PAGES, procs: int = DEFAULT_PROCS,
+         span_days: float = DEFAULT_SPAN_DAYS, words: int = DEFAULT_WORDS,
+         seed: int = 0, progress=None) -> dict:
+    """
+    Insert the requested numbers of documents and rebuild what derives
+    from them. Returns how many of each were inserted: people and pages
+    from an earlier run with the same seed are reused.
+    `progress(done, total)` is called as manuscript chunks land.
+    """
+    rng = np.random.default_rng(seed)
+    vocab = make_vocab(rng)
+    if people is None:
+        people = max(len(ROLE_WEIGHTS),
+                     manuscripts // MANUSCRIPTS_PER_PERSON)
+    folks = make_people(rng, vocab, people)
+    people = insert_new(ppl.PEOPLE_COLLECT, ppl.EMAIL,
+                        [dict(person) for person in folks])
+    pages = seed_pages(rng, vocab, pages)
+    now = datetime.now()
+    chunks = [(num, min(CHUNK_SIZE, manuscripts - start))
+              for num, start in enumerate(range(0, manuscripts, CHUNK_SIZE))]
+    done = 0
+    with ProcessPoolExecutor(
+            max_workers=procs,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_worker, initargs=(folks, vocab)) as pool:
+        futures = [pool.submit(seed_chunk, seed, num, count, now, span_days,
+                               words)
+                   for num, count in chunks]
+        for future in futures:
+            done += future.result()
+            if progress:
+                progress(done, manuscripts)
+    ms.ensure_indexes()
+    cntrs.reconcile()
+    refs.reconcile()
+    sla.rebuild()
+    return {ppl.PEOPLE_COLLECT: people, txt.TEXT_COLLECTION: pages,
+            ms.MANUSCRIPTS_COLLECT: manuscripts}
+
+
+def print_progress(done: int, total: int):
+    print(f'Seeded {done}/{total} manuscripts.')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Fill the database with synthetic data.')
+    parser.add_argument('--manuscripts', type=int,
+                        default=DEFAULT_MANUSCRIPTS)
+    parser.add_argument('--people', type=int,
+                        help='Default: one per '
+                             f'{MANUSCRIPTS_PER_PERSON} manuscripts')
+    parser.add_argument('--pages', type=int, default=DEFAULT_PAGES)
+    parser.add_argument('--procs', type=int, default=DEFAULT_PROCS)
+    parser.add_argument('--span-days', type=float, default=DEFAULT_SPAN_DAYS)
+    parser.add_argument('--words', type=int, default=DEFAULT_WORDS,
+                        help='Median words per manuscript')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    counts = seed(args.manuscripts, args.people, args.pages, args.procs,
+                  args.span_days, args.words, args.seed, print_progress)
+    print(f'{counts} in {time.perf_counter() - start:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
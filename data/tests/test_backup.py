@@ -0,0 +1,65 @@
+import gzip
+import hashlib
+
+from unittest.mock import patch
+
+import pymongo as pm
+import pytest
+from bson.objectid import ObjectId
+
+import data.backup as bkup
+import data.db_connect as dbc
+
+TEST_COLLECT = 'test_backup_docs'
+RESTORE_DB = 'seDB_restore_test'
+LINES = [b'{"a": 1}\n', b'{"a": 2}\n']
+
+
+@pytest.fixture
+def gz_file(tmp_path):
+    with gzip.open(tmp_path / 'part.ndjson.gz', 'wb') as out:
+        out.writelines(LINES)
+    return {bkup.FILE: 'part.ndjson.gz', bkup.COUNT: len(LINES),
+            bkup.SHA256: hashlib.sha256(b''.join(LINES)).hexdigest()}
+
+
+def test_verify_file(tmp_path, gz_file):
+    bkup.verify_file(tmp_path, gz_file)
+
+
+def test_verify_file_bad_count(tmp_path, gz_file):
+    with pytest.raises(ValueError):
+        bkup.verify_file(tmp_path, {**gz_file, bkup.COUNT: 3})
+
+
+@patch('data.db_connect.create_many', autospec=True,
+       side_effect=pm.errors.BulkWriteError({
+           'nInserted': 3, 'writeErrors': [{'code': dbc.DUPLICATE_KEY}]}))
+def test_insert_batch_skips_duplicates(mock_create):
+    assert bkup.insert_batch(TEST_COLLECT, [{}] * 4) == 3
+
+
+@patch('data.db_connect.create_many', autospec=True,
+       side_effect=pm.errors.BulkWriteError({
+           'nInserted': 0, 'writeErrors': [{'code': 121}]}))
+def test_insert_batch_raises_other_errors(mock_create):
+    with pytest.raises(pm.errors.BulkWriteError):
+        bkup.insert_batch(TEST_COLLECT, [{}])
+
+
+def test_dump_and_restore(tmp_path):
+    dbc.delete_many(TEST_COLLECT, {})
+    docs = [{'n': i, 'ref': ObjectId()} for i in range(25)]
+    dbc.create_many(TEST_COLLECT, [dict(doc) for doc in docs])
+    dbc.create_index(TEST_COLLECT, [('n', 1)], unique=True)
+    manifest = bkup.dump(tmp_path, [TEST_COLLECT])
+    assert manifest[bkup.COLLECTIONS][TEST_COLLECT][bkup.COUNT] == 25
+    loaded = bkup.restore(tmp_path, db=RESTORE_DB)
+    assert loaded == {TEST_COLLECT: 25}
+    restored = dbc.read_many(TEST_COLLECT, {}, db=RESTORE_DB,
+                             sort=[('n', 1)])
+    assert [doc['ref'] for doc in restored] == [doc['ref'] for doc in docs]
+    assert any(spec['name'] == 'n_1'
+               for spec in dbc.list_indexes(TEST_COLLECT, db=RESTORE_DB))
+    dbc.drop_collection(TEST_COLLECT)
+    dbc.drop_collection(TEST_COLLECT, db=RESTORE_DB)
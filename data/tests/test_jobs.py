@@ -0,0 +1,125 @@
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from unittest.mock import patch
+
+import pytest
+from bson.objectid import ObjectId
+
+import data.db_connect as dbc
+import data.jobs as jobs
+
+# unique to this run, so a live worker or another test run can't take
+# our jobs and we never take theirs
+TEST_KIND = f'test_job_{ObjectId()}'
+FLAKY_KIND = f'test_flaky_job_{ObjectId()}'
+
+
+@jobs.handler(TEST_KIND)
+def double(num: int) -> int:
+    return 2 * num
+
+
+@jobs.handler(FLAKY_KIND)
+def fail(**kwargs):
+    raise RuntimeError('always fails')
+
+
+@pytest.fixture
+def empty_queue():
+    yield
+    dbc.delete_many(jobs.JOBS_COLLECT,
+                    {jobs.KIND: {'$in': [TEST_KIND, FLAKY_KIND]}})
+
+
+def test_handler_registers():
+    assert jobs.HANDLERS[TEST_KIND] is double
+
+
+def test_execute():
+    assert jobs.execute(TEST_KIND, {'num': 4}) == 8
+
+
+def test_execute_unknown_kind():
+    with pytest.raises(ValueError):
+        jobs.execute('no_such_kind', {})
+
+
+def test_read_one_bad_id():
+    assert jobs.read_one('not an id') is None
+    assert jobs.read_one(str(ObjectId())) is None
+
+
+def claim_own(job_id: str) -> dict:
+    job = jobs.claim([TEST_KIND, FLAKY_KIND])
+    assert job[dbc.MONGO_ID] == job_id
+    return job
+
+
+def test_run_job(empty_queue):
+    job_id = jobs.enqueue(TEST_KIND, {'num': 21})
+    assert jobs.read_one(job_id)[jobs.STATUS] == jobs.QUEUED
+    jobs.run_job(claim_own(job_id))
+    job = jobs.read_one(job_id)
+    assert job[jobs.STATUS] == jobs.DONE
+    assert job[jobs.RESULT] == 42
+    assert job[jobs.ATTEMPTS] == 1
+
+
+def test_failed_job_retries_then_fails(empty_queue):
+    job_id = jobs.enqueue(FLAKY_KIND, max_attempts=2)
+    jobs.run_job(claim_own(job_id))
+    job = jobs.read_one(job_id)
+    assert job[jobs.STATUS] == jobs.QUEUED
+    assert job[jobs.ERROR] == 'RuntimeError: always fails'
+    assert 'Traceback' in job[jobs.TRACEBACK]
+    # not runnable until its backoff is over
+    assert jobs.claim([FLAKY_KIND]) is None
+    dbc.update(jobs.JOBS_COLLECT, {dbc.MONGO_ID: ObjectId(job_id)},
+               {jobs.RUN_AFTER: jobs.datetime.now()})
+    jobs.run_job(claim_own(job_id))
+    assert jobs.read_one(job_id)[jobs.STATUS] == jobs.FAILED
+
+
+def expire_lease(job_id: str):
+    dbc.update(jobs.JOBS_COLLECT, {dbc.MONGO_ID: ObjectId(job_id)},
+               {jobs.LEASED_UNTIL: jobs.datetime.now()
+                - jobs.timedelta(seconds=1)})
+
+
+def test_stale_run_cannot_finish(empty_queue):
+    job_id = jobs.enqueue(TEST_KIND, {'num': 1})
+    first = claim_own(job_id)
+    expire_lease(job_id)
+    second = claim_own(job_id)
+    assert not jobs.finish(first, result='stale')
+    assert jobs.finish(second, result=2)
+    assert jobs.read_one(job_id)[jobs.RESULT] == 2
+
+
+def test_renew_keeps_job(empty_queue):
+    job_id = jobs.enqueue(TEST_KIND, {'num': 1})
+    job = claim_own(job_id)
+    expire_lease(job_id)
+    assert jobs.renew([job]) == 1
+    assert jobs.claim([TEST_KIND]) is None
+
+
+def test_expired_last_attempt_fails(empty_queue):
+    job_id = jobs.enqueue(TEST_KIND, {'num': 1}, max_attempts=1)
+    claim_own(job_id)
+    expire_lease(job_id)
+    assert jobs.claim([TEST_KIND]) is None
+    assert jobs.fail_expired() >= 1
+    assert jobs.read_one(job_id)[jobs.STATUS] == jobs.FAILED
+
+
+def test_record_spots_broken_pool():
+    future = Future()
+    future.set_exception(BrokenProcessPool('child died'))
+    job = {dbc.MONGO_ID: str(ObjectId())}
+    running = {future: job}
+    with patch.object(jobs, 'finish', autospec=True) as mock_finish:
+        assert jobs.record([future], running)
+    assert not running
+    assert isinstance(mock_finish.call_args.kwargs['error'],
+                      BrokenProcessPool)
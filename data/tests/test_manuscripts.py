@@ -1,6 +1,8 @@
 import data.db_connect as dbc
 import data.manuscripts.manuscripts as manu
 from bson.objectid import ObjectId
+from datetime import datetime
+from unittest.mock import patch
 import pytest
 
 @pytest.fixture
@@ -94,3 +96,161 @@ def test_full_success_path(fsm_manuscript):
     assert manu.transition_manuscript_state(manu_id, "DON") == "AUR"
     assert manu.transition_manuscript_state(manu_id, "DON") == "FORM"
     assert manu.transition_manuscript_state(manu_id, "DON") == "PUB"
+
+
+def test_validate_bulk_item_good():
+    item = {"id": str(ObjectId()), "action": "ARF", "ref": "ref1"}
+    assert manu.validate_bulk_item(item) is None
+
+
+def test_validate_bulk_item_bad():
+    good_id = str(ObjectId())
+    assert manu.validate_bulk_item({"id": "nope", "action": "REJ"})
+    assert manu.validate_bulk_item({"id": good_id, "action": "BAD"})
+    assert manu.validate_bulk_item({"id": good_id, "action": "ARF"})
+    assert manu.validate_bulk_item({"id": good_id, "action": "EDITOR_MOVE",
+                                    "target_state": "NOPE"})
+
+
+def test_transition_manuscripts(sample_manuscript, fsm_manuscript):
+    missing_id = str(ObjectId())
+    items = [
+        {"id": str(sample_manuscript["_id"]), "action": "REJ"},
+        {"id": str(fsm_manuscript["_id"]), "action": "ARF", "ref": "ref1"},
+        {"id": missing_id, "action": "REJ"},
+        {"id": str(fsm_manuscript["_id"]), "action": "WIT"},
+        {"id": "bad id", "action": "REJ"},
+    ]
+    results = manu.transition_manuscripts(items)
+    assert [res["ok"] for res in results] == [True, True, False, False, False]
+    assert results[0]["state"] == "REJ"
+    assert results[1]["state"] == "REV"
+    assert "error" in results[2]
+    fetched = manu.read_one_manuscript(sample_manuscript["_id"])
+    assert fetched["latest_version"]["state"] == "REJ"
+    assert manu.read_one_manuscript(fsm_manuscript["_id"])[
+        "latest_version"]["referees"] == ["ref1"]
+
+
+def test_transition_manuscripts_invalid_for_state(sample_manuscript):
+    results = manu.transition_manuscripts(
+        [{"id": str(sample_manuscript["_id"]), "action": "DON"}])
+    assert not results[0]["ok"]
+    assert "Invalid action" in results[0]["error"]
+
+
+def test_transition_manuscripts_too_many():
+    with pytest.raises(ValueError):
+        manu.transition_manuscripts(
+            [{"id": str(ObjectId()), "action": "REJ"}]
+            * (manu.MAX_BULK_ITEMS + 1))
+
+
+def test_state_change_update_stamps_token():
+    token = ObjectId()
+    old = {"latest_version": {"state": "REV", "last_transition": None}}
+    filt = manu.transition_filter(ObjectId(), "REV", None)
+    assert filt["latest_version.last_transition"] is None
+    update = manu.state_change_update(old, "REV", "REV", "ARF",
+                                      datetime.now(), token)
+    assert update["$set"]["latest_version.last_transition"] == token
+    assert update["$push"]["latest_version.recent_transitions"][
+        "$each"] == [token]
+
+
+def test_transition_manuscripts_same_state_race(fsm_manuscript):
+    manu_id = str(fsm_manuscript["_id"])
+    manu.transition_manuscript_state(manu_id, "ARF", ref="ref1")
+    real = manu.query.handle_action
+
+    def racing(**kwargs):
+        # another request adds a referee between our read and our write
+        dbc.update(manu.MANUSCRIPTS_COLLECT, {"_id": ObjectId(manu_id)},
+                   {"latest_version.last_transition": ObjectId()})
+        return real(**kwargs)
+    with patch.object(manu.query, "handle_action", side_effect=racing):
+        results = manu.transition_manuscripts(
+            [{"id": manu_id, "action": "ARF", "ref": "ref2"}])
+    assert not results[0]["ok"]
+    assert "concurrently" in results[0]["error"]
+    assert manu.read_one_manuscript(manu_id)[
+        "latest_version"]["referees"] == ["ref1"]
+
+
+def test_read_states(sample_manuscript):
+    manu_id = sample_manuscript["_id"]
+    states = manu.read_states([manu_id, str(ObjectId()), "not an id"])
+    assert states == {manu_id: sample_manuscript["latest_version"]["state"]}
+
+
+def test_read_states_no_valid_ids():
+    assert manu.read_states(["not an id"]) == {}
+
+
+TEST_EDITOR = "queue_editor@nyu.edu"
+
+
+def test_get_editor_emails():
+    assert manu.get_editor_emails(
+        {"editors": [{"email": TEST_EDITOR, "role": "ED"}]}) == [TEST_EDITOR]
+    assert manu.get_editor_emails({"editors": {TEST_EDITOR: "ED"}}) == [
+        TEST_EDITOR]
+    assert manu.get_editor_emails({}) == []
+
+
+def test_clamp_page():
+    assert manu.clamp_page(0, 10_000) == (1, manu.MAX_PAGE_SIZE)
+
+
+def test_to_summary(sample_manuscript):
+    summary = manu.to_summary(sample_manuscript)
+    assert "text" not in summary
+    assert summary["title"] == "Test Manuscript"
+    assert isinstance(summary["manuscript_created"], str)
+
+
+def test_assign_editor_bad_email(sample_manuscript):
+    with pytest.raises(ValueError):
+        manu.assign_editor(sample_manuscript["_id"], "not an email")
+
+
+def test_editor_queue(sample_manuscript):
+    manu_id = sample_manuscript["_id"]
+    assert manu.assign_editor(manu_id, TEST_EDITOR)
+    # a second assignment is a no-op
+    assert not manu.assign_editor(manu_id, TEST_EDITOR)
+    queue = manu.read_editor_queue(TEST_EDITOR)
+    assert manu_id in [res["_id"] for res in queue["results"]]
+    assert manu.read_editor_queue(TEST_EDITOR, states=["PUB"])["total"] == 0
+    assert manu.remove_editor(manu_id, TEST_EDITOR)
+    queue = manu.read_editor_queue(TEST_EDITOR)
+    assert manu_id not in [res["_id"] for res in queue["results"]]
+
+
+def test_read_manuscripts_by_author(sample_manuscript):
+    second = manu.create_manuscript("Test Author", "Second", "More text.")
+    try:
+        newest = manu.read_manuscripts_by_author("Test Author", page_size=1)
+        assert newest["total"] >= 2
+        assert newest["results"][0]["_id"] == str(second["_id"])
+        assert "text" not in newest["results"][0]
+        oldest = manu.read_manuscripts_by_author("Test Author", page_size=1,
+                                                 ascending=True)
+        assert oldest["results"][0]["_id"] != str(second["_id"])
+    finally:
+        manu.delete_manuscript(second["_id"])
+
+
+def test_assign_ref_picks_a_referee(sample_manuscript):
+    import data.people as ppl
+    import data.manuscripts.recommend as rec
+    ppl.create("Auto Ref", "NYU", "auto_ref@nyu.edu", "RE")
+    rec.mark_stale()
+    try:
+        new_state = manu.transition_manuscript_state(
+            sample_manuscript["_id"], "ARF")
+        assert new_state == "REV"
+        latest = manu.read_one_manuscript(sample_manuscript["_id"])
+        assert latest["latest_version"]["referees"]
+    finally:
+        ppl.delete("auto_ref@nyu.edu")
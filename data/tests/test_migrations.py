@@ -0,0 +1,70 @@
+import pytest
+
+import data.db_connect as dbc
+import data.manuscripts.migrations as ms_mig
+import data.migrations as mig
+
+TEST_COLLECT = 'test_migration_docs'
+TEST_VERSION = 9001
+OLD = 'old'
+NEW = 'new'
+FLD = 'value'
+
+
+@mig.migration(TEST_VERSION, TEST_COLLECT, {FLD: OLD})
+def old_to_new(doc: dict) -> dict:
+    return {'$set': {FLD: NEW}}
+
+
+@pytest.fixture
+def old_docs():
+    dbc.delete_many(TEST_COLLECT, {})
+    dbc.delete(mig.MIGRATIONS_COLLECT, {mig.MONGO_ID: TEST_VERSION})
+    dbc.create_many(TEST_COLLECT, [{FLD: OLD} for _ in range(7)])
+    yield
+    dbc.delete_many(TEST_COLLECT, {})
+    dbc.delete(mig.MIGRATIONS_COLLECT, {mig.MONGO_ID: TEST_VERSION})
+
+
+def test_duplicate_version():
+    with pytest.raises(ValueError):
+        mig.migration(TEST_VERSION, TEST_COLLECT, {})(old_to_new)
+
+
+def test_state_migration_registered():
+    mig.load_migrations()
+    assert mig.MIGRATIONS[1]['fn'] is ms_mig.state_names_to_codes
+    assert ms_mig.state_names_to_codes(
+        {'latest_version': {'state': 'Referee Review'}}) == {
+            '$set': {'latest_version.state': 'REV'}}
+
+
+def test_editor_migration_registered():
+    mig.load_migrations()
+    assert mig.MIGRATIONS[3]['fn'] is ms_mig.editors_to_array
+    assert ms_mig.editors_to_array(
+        {'latest_version': {'editors': {'ed@nyu.edu': 'ED'}}}) == {
+            '$set': {'latest_version.editors': [
+                {'email': 'ed@nyu.edu', 'role': 'ED'}]}}
+
+
+def test_run_migration(old_docs):
+    calls = []
+    migrated = mig.run_migration(TEST_VERSION, batch_size=3,
+                                 progress=lambda ver, cnt: calls.append(cnt))
+    assert migrated == 7
+    assert calls == [3, 6, 7]
+    assert dbc.count(TEST_COLLECT, {FLD: NEW}) == 7
+    status = mig.get_status()[TEST_VERSION]
+    assert status[mig.STATUS] == mig.DONE
+
+
+def test_run_migration_resumes(old_docs):
+    mig.start(TEST_VERSION)
+    first = dbc.read_many(TEST_COLLECT, {}, sort=[(mig.MONGO_ID, 1)],
+                          limit=2)
+    # pretend an earlier run got through the first two docs
+    dbc.update_one(mig.MIGRATIONS_COLLECT, {mig.MONGO_ID: TEST_VERSION},
+                   {'$set': {mig.LAST_ID: mig.ObjectId(first[-1]['_id'])}})
+    assert mig.run_migration(TEST_VERSION) == 5
+    assert dbc.count(TEST_COLLECT, {FLD: OLD}) == 2
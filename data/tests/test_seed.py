@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import numpy as np
+import pymongo as pm
+import pytest
+
+import data.manuscripts.manuscripts as ms
+import data.manuscripts.query as qry
+import data.people as ppl
+import data.roles as rls
+import data.seed as sd
+import data.text as txt
+
+NOW = datetime(2024, 6, 1)
+
+
+@pytest.fixture(scope='module')
+def rng():
+    return np.random.default_rng(0)
+
+
+@pytest.fixture(scope='module')
+def vocab(rng):
+    return sd.make_vocab(rng, 500)
+
+
+@pytest.fixture(scope='module')
+def pools(rng, vocab):
+    return sd.get_role_pools(sd.make_people(rng, vocab, 200))
+
+
+def test_role_weights_are_real_roles():
+    assert all(rls.is_valid(role) for role in sd.ROLE_WEIGHTS)
+    assert sum(sd.ROLE_WEIGHTS.values()) == pytest.approx(1)
+
+
+def test_make_people(rng, vocab):
+    people = sd.make_people(rng, vocab, 50)
+    assert len({person[ppl.EMAIL] for person in people}) == 50
+    for person in people:
+        assert ppl.is_valid_email(person[ppl.EMAIL])
+        assert all(rls.is_valid(role) for role in person[ppl.ROLES])
+
+
+def test_every_role_filled(pools):
+    assert all(pools[role] for role in sd.ROLE_WEIGHTS)
+
+
+def test_walk_follows_workflow(rng):
+    for _ in range(200):
+        moves = sd.walk(rng, NOW - timedelta(days=1000), NOW)
+        state = qry.SUBMITTED
+        for old_state, new_state, entered, left in moves:
+            assert old_state == state
+            assert new_state in qry.NEXT_STATES[old_state]
+            assert entered <= left <= NOW
+            state = new_state
+
+
+def test_make_manuscript(rng, vocab, pools):
+    manu, his = sd.make_manuscript(rng, vocab, pools, NOW, 365, 200)
+    latest = manu[ms.LATEST_VERSION]
+    assert qry.is_valid_state(latest[ms.STATE])
+    assert manu[ms.MANUSCRIPT_HISTORY_FK] == his[ms.MONGO_ID]
+    assert his[ms.MANUSCRIPT_FK] == manu[ms.MONGO_ID]
+    assert len(latest[ms.TEXT].split()) == latest[ms.WORD_COUNT]
+    if his[ms.HISTORY]:
+        assert his[ms.HISTORY][-1][ms.HIST_TO] == latest[ms.STATE]
+        assert his[ms.HISTORY][-1][ms.HIST_AT] == latest[ms.STATE_SINCE]
+
+
+@patch('data.db_connect.create_many', autospec=True)
+@patch('data.db_connect.read_many', autospec=True,
+       return_value=[{txt.KEY: 'SeedPage1'}])
+def test_insert_new_skips_existing(mock_read, mock_create):
+    mock_create.return_value.inserted_ids = ['x']
+    docs = [{txt.KEY: 'SeedPage0'}, {txt.KEY: 'SeedPage1'}]
+    assert sd.insert_new(txt.TEXT_COLLECTION, txt.KEY, docs) == 1
+    assert mock_create.call_args.args[1] == [{txt.KEY: 'SeedPage0'}]
+
+
+@patch('data.db_connect.create_many', autospec=True,
+       side_effect=pm.errors.BulkWriteError({
+           'nInserted': 1, 'writeErrors': [{'code': 11000}]}))
+@patch('data.db_connect.read_many', autospec=True, return_value=[])
+def test_insert_new_races(mock_read, mock_create):
+    docs = [{txt.KEY: 'SeedPage0'}, {txt.KEY: 'SeedPage1'}]
+    assert sd.insert_new(txt.TEXT_COLLECTION, txt.KEY, docs) == 1
@@ -3,25 +3,40 @@ This is the file containing all of the endpoints for our flask app.
 The endpoint called `endpoints` will return all available endpoints.
 """
 
+import math
 from http import HTTPStatus
 
-from flask import Flask, request
+from flask import Flask, Response, request, stream_with_context
 from flask_restx import Resource, Api, fields  # Namespace
 from flask_cors import CORS
 
 import werkzeug.exceptions as wz
+from bson.objectid import ObjectId
 
 import data.people as ppl
+import data.roles as rls
 import data.text as txt
+import data.manuscripts.counters as cntrs
+import data.manuscripts.filters as fltr
 import data.manuscripts.manuscripts as ms
+import data.manuscripts.recommend as rec
+import data.manuscripts.referees as refs
+import data.manuscripts.search as srch
+import data.manuscripts.simulation as sim
+import data.manuscripts.sla as sla
+import data.manuscripts.tasks as tsks
+import data.manuscripts.uploads as upl
+import data.jobs as jobs
 from data.manuscripts import query
 from security import security as sec
+from server import metrics
 
 
 app = Flask(__name__)
 
 CORS(app)
 api = Api(app)
+metrics.init_app(app)
 
 DATE = "2024-09-24"
 DATE_RESP = "Date"
@@ -31,6 +46,7 @@ ENDPOINT_EP = "/endpoints"
 ENDPOINT_RESP = "Available endpoints"
 HELLO_EP = "/hello"
 HELLO_RESP = "hello"
+METRICS_EP = "/metrics"
 MESSAGE = "Message"
 PEOPLE_EP = "/people"
 PUBLISHER = "Palgave"
@@ -51,6 +67,34 @@ MANUSCRIPTS_DEL_EP = f"{MANUSCRIPTS_EP}/<id>"
 MANUSCRIPTS_UPDATE_EP = f"{MANUSCRIPTS_EP}/update"
 MANUSCRIPTS_RECEIVE_ACTION_EP = f"{MANUSCRIPTS_EP}/receive_action"
 MANUSCRIPTS_VALID_ACTIONS_EP = f"{MANUSCRIPTS_EP}/<id>/valid_actions"
+MANUSCRIPTS_BATCH_VALID_ACTIONS_EP = f"{MANUSCRIPTS_EP}/valid_actions"
+MAX_BATCH_IDS = 500
+MANUSCRIPTS_SEARCH_EP = f"{MANUSCRIPTS_EP}/search"
+MANUSCRIPTS_QUERY_EP = f"{MANUSCRIPTS_EP}/query"
+MANUSCRIPTS_COUNTS_EP = f"{MANUSCRIPTS_EP}/counts"
+MANUSCRIPTS_BULK_ACTION_EP = f"{MANUSCRIPTS_EP}/bulk_action"
+MANUSCRIPTS_FORECAST_EP = f"{MANUSCRIPTS_EP}/forecast"
+MANUSCRIPTS_SLA_EP = f"{MANUSCRIPTS_EP}/sla"
+MANUSCRIPTS_QUEUE_EP = f"{MANUSCRIPTS_EP}/queue/<string:email>"
+MANUSCRIPTS_EDITORS_EP = f"{MANUSCRIPTS_EP}/<id>/editors"
+MANUSCRIPTS_EDITOR_EP = f"{MANUSCRIPTS_EP}/<id>/editors/<string:email>"
+MANUSCRIPTS_RECOMMEND_EP = f"{MANUSCRIPTS_EP}/<id>/recommended_referees"
+MAX_FORECAST_DAYS = 366
+MAX_FORECAST_ARRIVALS = 10_000  # per day; the arrays grow with it
+
+MANUSCRIPTS_UPLOADS_EP = f"{MANUSCRIPTS_EP}/<id>/uploads"
+UPLOADS_EP = "/uploads"
+UPLOAD_EP = f"{UPLOADS_EP}/<string:upload_id>"
+UPLOAD_CHUNK_EP = f"{UPLOAD_EP}/chunks/<int:index>"
+UPLOAD_COMPLETE_EP = f"{UPLOAD_EP}/complete"
+UPLOAD_FILE_EP = f"{UPLOAD_EP}/file"
+
+JOBS_EP = "/jobs"
+JOB_EP = f"{JOBS_EP}/<string:job_id>"
+
+REFEREES_EP = "/referees"
+REFEREES_SUGGEST_EP = f"{REFEREES_EP}/suggest"
+REFEREE_WORKLOAD_EP = f"{REFEREES_EP}/<string:email>/workload"
 
 
 MANUSCRIPT_UPDATE_FLDS = api.model(
@@ -99,26 +143,42 @@ class ManuscriptCreate(Resource):
         print(manu)
         if not manu:
             raise wz.InternalServerError("Manuscript creation failed.")
+        # word counts and duplicate checks happen in a worker; poll
+        # the job to see them
+        job_id = tsks.enqueue_processing(manu[ms.MONGO_ID])
 
         return {
+            "id": str(manu[ms.MONGO_ID]),
             "author": manu[ms.AUTHOR_NAME],
             "title": manu[ms.LATEST_VERSION][ms.TITLE],
             "text": manu[ms.LATEST_VERSION][ms.TEXT],
+            "job_id": job_id,
         }
 
 @api.route(f"{MANUSCRIPTS_EP}/author/<string:author_name>")
 class ManuscriptRetrieveByAuthor(Resource):
 
-
+    @api.doc(params={
+        "page": "Page number, starting at 1",
+        "page_size": f"Results per page (max {ms.MAX_PAGE_SIZE})",
+        "order": "'desc' (newest first, the default) or 'asc'",
+    })
     @api.response(HTTPStatus.OK, "Manuscripts retrieved successfully")
+    @api.response(HTTPStatus.BAD_REQUEST, "Bad paging or order")
     @api.response(HTTPStatus.NOT_FOUND, "No manuscripts found for the given author")
     def get(self, author_name):
         """
-        Retrieve all manuscripts for the specified author name.
+        Retrieve one page of an author's manuscripts by submission date.
         """
-        manuscripts = ms.read_manuscripts_by_author(author_name)
-
-        if not manuscripts:
+        page, page_size = get_page_args()
+        order = request.args.get("order", "desc")
+        if order not in ("asc", "desc"):
+            raise wz.BadRequest("order must be 'asc' or 'desc'")
+        manuscripts = ms.read_manuscripts_by_author(
+            author_name, page=page, page_size=page_size,
+            ascending=order == "asc")
+
+        if not manuscripts[ms.TOTAL]:
             raise wz.NotFound(f"No manuscripts found for author '{author_name}'.")
 
         return manuscripts
@@ -177,6 +237,241 @@ class ManuscriptRetrieveAll(Resource):
         return all_manu, HTTPStatus.OK
 
 
+def get_page_args(default_page_size: int = ms.DEFAULT_PAGE_SIZE) -> tuple:
+    try:
+        return (int(request.args.get("page", 1)),
+                int(request.args.get("page_size", default_page_size)))
+    except ValueError:
+        raise wz.BadRequest("page and page_size must be integers")
+
+
+@api.route(MANUSCRIPTS_SEARCH_EP)
+class ManuscriptSearch(Resource):
+    """
+    Ranked full-text search over manuscript title, author and text.
+    """
+
+    @api.doc(params={
+        "q": "Search terms",
+        "page": "Page number, starting at 1",
+        "page_size": f"Results per page (max {srch.MAX_PAGE_SIZE})",
+    })
+    @api.response(HTTPStatus.OK, "Search results")
+    @api.response(HTTPStatus.BAD_REQUEST, "Missing or invalid query")
+    def get(self):
+        """
+        Search manuscripts, best match first.
+        """
+        query_str = request.args.get("q", "").strip()
+        if not query_str:
+            raise wz.BadRequest("Missing search query 'q'")
+        page, page_size = get_page_args(srch.DEFAULT_PAGE_SIZE)
+        return srch.search(query_str, page=page,
+                           page_size=page_size), HTTPStatus.OK
+
+
+@api.route(MANUSCRIPTS_QUERY_EP)
+class ManuscriptQuery(Resource):
+    """
+    List manuscripts matching a set of filters.
+    """
+
+    @api.doc(params={
+        fltr.STATE: "Only these states (repeat for more than one)",
+        fltr.AUTHOR: "Author name",
+        fltr.EDITOR: "Assigned editor's email",
+        fltr.REFEREE: "Assigned referee",
+        fltr.CREATED_AFTER: "ISO date; created on or after",
+        fltr.CREATED_BEFORE: "ISO date; created before",
+        fltr.ORDER: "'desc' (newest first, the default) or 'asc'",
+        "page": "Page number, starting at 1",
+        "page_size": f"Results per page (max {ms.MAX_PAGE_SIZE})",
+    })
+    @api.response(HTTPStatus.OK, "One page of matching manuscripts")
+    @api.response(HTTPStatus.BAD_REQUEST, "Bad or unsupported filters")
+    def get(self):
+        """
+        Retrieve manuscripts by state, author, editor, referee and date.
+        """
+        page, page_size = get_page_args()
+        params = {key: request.args.get(key) for key in request.args
+                  if key not in ("page", "page_size")}
+        if fltr.STATE in request.args:
+            params[fltr.STATE] = request.args.getlist(fltr.STATE)
+        try:
+            return fltr.filter_manuscripts(params, page=page,
+                                           page_size=page_size), HTTPStatus.OK
+        except ValueError as err:
+            raise wz.BadRequest(str(err))
+
+
+@api.route(MANUSCRIPTS_COUNTS_EP)
+class ManuscriptCounts(Resource):
+    """
+    How many manuscripts are in each state, for editorial dashboards.
+    """
+
+    @api.doc(params={"editor": "Only count this editor's manuscripts"})
+    @api.response(HTTPStatus.OK, "Manuscript counts by state")
+    def get(self):
+        """
+        Retrieve the number of manuscripts in each state.
+        """
+        editor = request.args.get("editor", cntrs.ALL_EDITORS).strip()
+        return {
+            "editor": editor,
+            "counts": cntrs.get_counts(editor),
+        }, HTTPStatus.OK
+
+
+@api.route(MANUSCRIPTS_FORECAST_EP)
+class ManuscriptForecast(Resource):
+    """
+    Forecast per-state queue depths by simulating the workflow.
+    """
+
+    @api.doc(params={
+        "days": f"Days to simulate (default {sim.DEFAULT_DAYS})",
+        "arrivals_per_day": "Mean new submissions per day "
+                            f"(default {sim.DEFAULT_ARRIVALS_PER_DAY})",
+        "seed": "Random seed, for repeatable runs",
+    })
+    @api.response(HTTPStatus.OK, "Occupancy series and decision times")
+    @api.response(HTTPStatus.BAD_REQUEST, "Invalid parameters")
+    def get(self):
+        """
+        Simulate from today's counts and return the forecast.
+        """
+        try:
+            days = int(request.args.get("days", sim.DEFAULT_DAYS))
+            arrivals = float(request.args.get("arrivals_per_day",
+                                              sim.DEFAULT_ARRIVALS_PER_DAY))
+            seed = request.args.get("seed")
+            seed = int(seed) if seed is not None else None
+        except ValueError:
+            raise wz.BadRequest("days, arrivals_per_day and seed "
+                                "must be numbers")
+        if (not 0 < days <= MAX_FORECAST_DAYS or not math.isfinite(arrivals)
+                or not 0 <= arrivals <= MAX_FORECAST_ARRIVALS):
+            raise wz.BadRequest(f"days must be 1-{MAX_FORECAST_DAYS} and "
+                                "arrivals_per_day "
+                                f"0-{MAX_FORECAST_ARRIVALS}")
+        probs, dwell_days = sim.estimate_from_history()
+        result = sim.simulate(days=days, arrivals_per_day=arrivals,
+                              initial=cntrs.get_counts(), probs=probs,
+                              dwell_days=dwell_days, seed=seed)
+        return {
+            "days": days,
+            "occupancy": sim.get_occupancy_series(result),
+            "days_to_decision": sim.get_decision_percentiles(result),
+            "undecided": result[sim.UNDECIDED],
+        }, HTTPStatus.OK
+
+
+@api.route(MANUSCRIPTS_SLA_EP)
+class ManuscriptSLA(Resource):
+    """
+    How long manuscripts sit in each state, from the SLA summary.
+    """
+
+    @api.doc(params={
+        "state": "Only these states (repeat for more than one; default "
+                 f"{', '.join(sla.TRACKED_STATES)})",
+        "editor": "Only this editor's manuscripts",
+        "month": "Only this month, as YYYY-MM",
+    })
+    @api.response(HTTPStatus.OK, "Median and p90 days in state, by month")
+    @api.response(HTTPStatus.BAD_REQUEST, "Invalid state or month")
+    def get(self):
+        """
+        Retrieve median and p90 time in state. The summary is refreshed
+        by `python -m data.manuscripts.sla`, not by this request.
+        """
+        editor = request.args.get("editor", sla.ALL_EDITORS).strip()
+        try:
+            return {
+                "editor": editor,
+                "sla": sla.get_sla(request.args.getlist("state") or None,
+                                   editor=editor,
+                                   month=request.args.get("month")),
+            }, HTTPStatus.OK
+        except ValueError as err:
+            raise wz.BadRequest(str(err))
+
+
+@api.route(MANUSCRIPTS_QUEUE_EP)
+class ManuscriptEditorQueue(Resource):
+    """
+    An editor's own queue of manuscripts.
+    """
+
+    @api.doc(params={
+        "state": "Only these states (repeat for more than one)",
+        "page": "Page number, starting at 1",
+        "page_size": f"Results per page (max {ms.MAX_PAGE_SIZE})",
+    })
+    @api.response(HTTPStatus.OK, "One page of the editor's manuscripts")
+    def get(self, email):
+        """
+        Retrieve the manuscripts assigned to an editor, newest first.
+        """
+        page, page_size = get_page_args()
+        states = request.args.getlist("state") or None
+        return ms.read_editor_queue(email.strip(), states=states, page=page,
+                                    page_size=page_size), HTTPStatus.OK
+
+
+@api.route(MANUSCRIPTS_EDITORS_EP)
+class ManuscriptEditors(Resource):
+    """
+    Assign editors to a manuscript.
+    """
+
+    @api.expect(api.model(
+        "AssignEditor",
+        {
+            "email": fields.String(required=True),
+            "role": fields.String(required=False),
+        }
+    ))
+    @api.response(HTTPStatus.OK, "Editor assigned")
+    @api.response(HTTPStatus.BAD_REQUEST, "Invalid email or role")
+    @api.response(HTTPStatus.NOT_FOUND,
+                  "No such manuscript, or editor already assigned")
+    def post(self, id):
+        """
+        Assign an editor to a manuscript
+        """
+        data = request.get_json()
+        email = data.get("email", "").strip()
+        role = data.get("role") or rls.ED_CODE
+        try:
+            assigned = ms.assign_editor(id.strip(), email, role)
+        except ValueError as err:
+            raise wz.BadRequest(str(err))
+        if not assigned:
+            raise wz.NotFound(f"No manuscript with ID {id} without "
+                              f"editor {email}")
+        return {"message": f"{email} assigned to {id}"}, HTTPStatus.OK
+
+
+@api.route(MANUSCRIPTS_EDITOR_EP)
+class ManuscriptEditor(Resource):
+    """
+    Take an editor off a manuscript.
+    """
+
+    @api.response(HTTPStatus.OK, "Editor removed")
+    @api.response(HTTPStatus.NOT_FOUND, "Editor not on that manuscript")
+    def delete(self, id, email):
+        """
+        Remove an editor from a manuscript
+        """
+        if not ms.remove_editor(id.strip(), email.strip()):
+            raise wz.NotFound(f"{email} is not an editor of {id}")
+        return {"message": f"{email} removed from {id}"}, HTTPStatus.OK
+
+
 @api.route(MANUSCRIPTS_UPDATE_EP)
 class ManuscriptUpdate(Resource):
     """
@@ -198,6 +493,8 @@ class ManuscriptUpdate(Resource):
 
         if not manuscript_id or not title or not text:
             raise wz.BadRequest("Missing required fields")
+        if not ObjectId.is_valid(manuscript_id):
+            raise wz.BadRequest(f"Invalid manuscript id '{manuscript_id}'")
 
         try:
             updated = ms.update_manuscript(manuscript_id, title, text)
@@ -210,8 +507,11 @@ class ManuscriptUpdate(Resource):
                 "message": "Manuscript updated successfully",
                 "id": manuscript_id,
                 "title": title,
-                "text": text
+                "text": text,
+                "job_id": tsks.enqueue_processing(manuscript_id),
             }, HTTPStatus.OK
+        except wz.HTTPException:
+            raise
         except Exception as e:
             raise wz.InternalServerError(str(e))
 
@@ -251,6 +551,51 @@ class ManuscriptReceiveAction(Resource):
             raise wz.BadRequest(str(e))
 
 
+MANUSCRIPT_TRANSITION_FLDS = api.model(
+    "BulkManuscriptTransition",
+    {
+        "id": fields.String(required=True),
+        "action": fields.String(required=True),
+        "ref": fields.String(required=False),
+        "target_state": fields.String(required=False),
+    }
+)
+
+
+@api.route(MANUSCRIPTS_BULK_ACTION_EP)
+class ManuscriptBulkAction(Resource):
+    """
+    Apply actions to many manuscripts in one request.
+    """
+
+    @api.expect(api.model(
+        "BulkManuscriptAction",
+        {
+            "items": fields.List(fields.Nested(MANUSCRIPT_TRANSITION_FLDS),
+                                 required=True),
+        }
+    ))
+    @api.response(HTTPStatus.OK, "Per-item results")
+    @api.response(HTTPStatus.BAD_REQUEST, "Malformed request")
+    def post(self):
+        """
+        Transition many manuscripts; each item succeeds or fails alone.
+        """
+        data = request.get_json()
+        items = data.get("items") if isinstance(data, dict) else None
+        if not isinstance(items, list) or not items:
+            raise wz.BadRequest("Expected a non-empty list of 'items'")
+        try:
+            results = ms.transition_manuscripts(items)
+        except ValueError as err:
+            raise wz.BadRequest(str(err))
+        return {
+            "succeeded": sum(1 for res in results if res[ms.BULK_OK]),
+            "failed": sum(1 for res in results if not res[ms.BULK_OK]),
+            "results": results,
+        }, HTTPStatus.OK
+
+
 @api.route(MANUSCRIPTS_VALID_ACTIONS_EP)
 class ManuscriptValidActions(Resource):
     """
@@ -270,11 +615,7 @@ class ManuscriptValidActions(Resource):
                 raise wz.NotFound(f"No manuscript found with ID {id}")
 
             curr_state = manu[ms.LATEST_VERSION][ms.STATE]
-            curr_state_code = query.STATE_NAME_TO_CODE.get(
-                curr_state,
-                curr_state
-            )
-            valid_actions = list(ms.get_valid_actions(curr_state_code))
+            valid_actions = list(ms.get_valid_actions(curr_state))
             return {
                 "current_state": curr_state,
                 "valid_actions": valid_actions
@@ -284,6 +625,282 @@ class ManuscriptValidActions(Resource):
             raise wz.InternalServerError(str(e))
 
 
+@api.route(MANUSCRIPTS_BATCH_VALID_ACTIONS_EP)
+class ManuscriptBatchValidActions(Resource):
+    """
+    Get valid actions for many manuscripts at once, e.g. a whole queue.
+    """
+
+    @api.expect(api.model(
+        "BatchValidActions",
+        {"ids": fields.List(fields.String, required=True)},
+    ))
+    @api.response(HTTPStatus.OK, "Valid actions keyed by manuscript ID")
+    @api.response(HTTPStatus.BAD_REQUEST, "Malformed request")
+    def post(self):
+        """
+        Retrieve the current state and valid actions for each ID
+        """
+        data = request.get_json()
+        ids = data.get("ids") if isinstance(data, dict) else None
+        if not isinstance(ids, list) or not ids:
+            raise wz.BadRequest("Expected a non-empty list of 'ids'")
+        if len(ids) > MAX_BATCH_IDS:
+            raise wz.BadRequest(f"At most {MAX_BATCH_IDS} ids per request")
+        ids = [str(manu_id).strip() for manu_id in ids]
+        manu_states = ms.read_states(ids)
+        results = {}
+        for manu_id, curr_state in manu_states.items():
+            results[manu_id] = {
+                "current_state": curr_state,
+                "valid_actions": list(
+                    query.VALID_ACTIONS_BY_STATE.get(curr_state, ())),
+            }
+        return {
+            "results": results,
+            "not_found": [manu_id for manu_id in ids
+                          if manu_id not in manu_states],
+        }, HTTPStatus.OK
+
+
+@api.route(MANUSCRIPTS_UPLOADS_EP)
+class ManuscriptUploads(Resource):
+    """
+    Start a chunked file upload for a manuscript.
+    """
+
+    @api.expect(api.model(
+        "StartUpload",
+        {
+            "filename": fields.String(required=True),
+            "content_type": fields.String(required=False),
+            "size": fields.Integer(required=True),
+        },
+    ))
+    @api.response(HTTPStatus.CREATED, "Upload started")
+    @api.response(HTTPStatus.BAD_REQUEST, "Malformed request")
+    @api.response(HTTPStatus.NOT_FOUND, "No such manuscript")
+    def post(self, id):
+        """
+        Open an upload; send the file to its chunks endpoint next.
+        """
+        data = request.get_json() or {}
+        try:
+            upload = upl.start_upload(
+                id, str(data.get("filename", "")).strip(),
+                data.get("size"),
+                content_type=data.get("content_type",
+                                      upl.DEFAULT_CONTENT_TYPE))
+        except ValueError as err:
+            raise wz.BadRequest(str(err))
+        if not upload:
+            raise wz.NotFound(f"No manuscript found: {id}")
+        return upload, HTTPStatus.CREATED
+
+
+@api.route(UPLOAD_EP)
+class Upload(Resource):
+    """
+    Check on or abandon an upload.
+    """
+
+    @api.response(HTTPStatus.OK, "Upload status, with any missing chunks")
+    @api.response(HTTPStatus.NOT_FOUND, "No such upload")
+    def get(self, upload_id):
+        """
+        Retrieve which chunks have arrived, to resume an upload.
+        """
+        upload = upl.read_upload(upload_id)
+        if not upload:
+            raise wz.NotFound(f"No such upload: {upload_id}")
+        return upl.to_view(upload), HTTPStatus.OK
+
+    @api.response(HTTPStatus.OK, "Upload deleted")
+    @api.response(HTTPStatus.NOT_FOUND, "No such upload")
+    def delete(self, upload_id):
+        """
+        Delete an upload and all of its chunks.
+        """
+        if not upl.delete_upload(upload_id):
+            raise wz.NotFound(f"No such upload: {upload_id}")
+        return {"message": f"Upload {upload_id} deleted."}, HTTPStatus.OK
+
+
+@api.route(UPLOAD_CHUNK_EP)
+class UploadChunk(Resource):
+    """
+    Send one chunk of a file as the raw request body.
+    """
+
+    @api.response(HTTPStatus.OK, "Chunk stored")
+    @api.response(HTTPStatus.BAD_REQUEST, "Bad index, size or state")
+    @api.response(HTTPStatus.NOT_FOUND, "No such upload")
+    def put(self, upload_id, index):
+        """
+        Store chunk `index`. Resending a chunk replaces it.
+        """
+        try:
+            chunk = upl.put_chunk(upload_id, index, request.stream)
+        except ValueError as err:
+            raise wz.BadRequest(str(err))
+        if not chunk:
+            raise wz.NotFound(f"No such upload: {upload_id}")
+        return chunk, HTTPStatus.OK
+
+
+@api.route(UPLOAD_COMPLETE_EP)
+class UploadComplete(Resource):
+    """
+    Finish an upload and attach it to its manuscript.
+    """
+
+    @api.expect(api.model(
+        "CompleteUpload",
+        {"crc32": fields.Integer(required=False)},
+    ))
+    @api.response(HTTPStatus.OK, "Upload complete")
+    @api.response(HTTPStatus.BAD_REQUEST, "Chunks missing or checksum wrong")
+    @api.response(HTTPStatus.NOT_FOUND, "No such upload")
+    def post(self, upload_id):
+        """
+        Verify every chunk arrived and the checksum matches.
+        """
+        data = request.get_json(silent=True) or {}
+        try:
+            upload = upl.complete_upload(upload_id, crc32=data.get("crc32"))
+        except ValueError as err:
+            raise wz.BadRequest(str(err))
+        if not upload:
+            raise wz.NotFound(f"No such upload: {upload_id}")
+        return upload, HTTPStatus.OK
+
+
+@api.route(UPLOAD_FILE_EP)
+class UploadFile(Resource):
+    """
+    Download an uploaded file.
+    """
+
+    @api.response(HTTPStatus.OK, "The file")
+    @api.response(HTTPStatus.NOT_FOUND, "No such completed upload")
+    def get(self, upload_id):
+        """
+        Stream the file back a chunk at a time.
+        """
+        upload = upl.read_upload(upload_id)
+        if not upload or upload[upl.STATUS] != upl.COMPLETE:
+            raise wz.NotFound(f"No completed upload: {upload_id}")
+        return Response(
+            stream_with_context(upl.iter_file(upload_id)),
+            mimetype=upload[upl.CONTENT_TYPE],
+            headers={
+                "Content-Length": str(upload[upl.LENGTH]),
+                "Content-Disposition":
+                    upl.content_disposition(upload[upl.FILENAME]),
+            })
+
+
+@api.route(JOB_EP)
+class Job(Resource):
+    """
+    Poll a background job.
+    """
+
+    @api.response(HTTPStatus.OK, "Success")
+    @api.response(HTTPStatus.NOT_FOUND, "No such job")
+    def get(self, job_id):
+        """
+        Retrieve a job's status, and its result or error once finished.
+        """
+        job = jobs.read_one(job_id)
+        if not job:
+            raise wz.NotFound(f"No such job: {job_id}")
+        # the traceback is for the worker's logs, not for clients
+        job.pop(jobs.TRACEBACK, None)
+        return job, HTTPStatus.OK
+
+
+@api.route(REFEREES_SUGGEST_EP)
+class RefereeSuggestions(Resource):
+    """
+    Suggest the least-loaded referees for a new assignment.
+    """
+
+    @api.doc(params={
+        "k": f"How many to suggest (max {refs.MAX_SUGGESTIONS})",
+        "exclude": "Emails to leave out (repeat for more than one)",
+        "manu_id": "Leave out referees already on this manuscript",
+    })
+    @api.response(HTTPStatus.OK, "Referees, least loaded first")
+    @api.response(HTTPStatus.BAD_REQUEST, "Malformed request")
+    @api.response(HTTPStatus.NOT_FOUND, "No such manuscript")
+    def get(self):
+        """
+        Retrieve referees ordered by open and recent reviews.
+        """
+        try:
+            k = int(request.args.get("k", refs.DEFAULT_SUGGESTIONS))
+        except ValueError:
+            raise wz.BadRequest("'k' must be an integer")
+        exclude = request.args.getlist("exclude")
+        manu_id = request.args.get("manu_id")
+        if manu_id:
+            manu = ms.read_one_manuscript(manu_id.strip())
+            if not manu:
+                raise wz.NotFound(f"No manuscript found: {manu_id}")
+            exclude += manu[ms.LATEST_VERSION].get(ms.REFEREES, [])
+        return {
+            "referees": refs.suggest_referees(k, exclude=exclude),
+        }, HTTPStatus.OK
+
+
+@api.route(MANUSCRIPTS_RECOMMEND_EP)
+class ManuscriptRecommendedReferees(Resource):
+    """
+    Referees whose past reviews are closest to a manuscript's text.
+    """
+
+    @api.doc(params={"k": "How many to recommend"})
+    @api.response(HTTPStatus.OK, "Referees, best match first")
+    @api.response(HTTPStatus.BAD_REQUEST, "Malformed request")
+    @api.response(HTTPStatus.NOT_FOUND, "No such manuscript")
+    def get(self, id):
+        """
+        Retrieve referees ranked by TF-IDF similarity to the manuscript.
+        """
+        try:
+            k = int(request.args.get("k", rec.DEFAULT_K))
+        except ValueError:
+            raise wz.BadRequest("'k' must be an integer")
+        manu = ms.read_one_manuscript(id)
+        if not manu:
+            raise wz.NotFound(f"No manuscript found: {id}")
+        latest = manu[ms.LATEST_VERSION]
+        return {
+            "referees": rec.recommend(
+                latest.get(ms.TEXT, ""), k=max(1, k),
+                exclude=latest.get(ms.REFEREES, [])),
+        }, HTTPStatus.OK
+
+
+@api.route(REFEREE_WORKLOAD_EP)
+class RefereeWorkload(Resource):
+    """
+    One referee's review load.
+    """
+
+    @api.response(HTTPStatus.OK, "Success")
+    @api.response(HTTPStatus.NOT_FOUND, "No such person")
+    def get(self, email):
+        """
+        Retrieve a referee's active, completed and recent review counts.
+        """
+        workload = refs.get_workload(email.strip())
+        if not workload:
+            raise wz.NotFound(f"No such person: {email}")
+        return workload, HTTPStatus.OK
+
+
 get_valid_actions_by_state = query.get_valid_actions_by_state
 VALID_STATES = query.VALID_STATES
 
@@ -339,6 +956,21 @@ class Endpoints(Resource):
         return {ENDPOINT_RESP: endpoints}
 
 
+@api.route(METRICS_EP)
+class Metrics(Resource):
+    """
+    Request counts, latencies, sizes and DB calls per route, for
+    Prometheus to scrape.
+    """
+
+    def get(self):
+        """
+        Metrics in the Prometheus text format.
+        """
+        return Response(metrics.render(),
+                        content_type=metrics.CONTENT_TYPE)
+
+
 @api.route(TITLE_EP)
 class JournalTitle(Resource):
     """
@@ -0,0 +1,169 @@
+"""
+Per-route request metrics, served in the Prometheus text format.
+init_app() hooks every request to record, by method and route template
+(e.g. /manuscripts/<id>):
+  - requests by status code,
+  - latency, response size and data-layer calls, as histograms,
+  - data-layer calls by db_connect helper,
+so we can see which endpoints spend our Mongo budget.
+The numbers live in this process; with several workers each one has
+its own, and Prometheus adds them up across the scrape targets.
+"""
+import threading
+import time
+
+from flask import g, request
+
+import data.db_connect as dbc
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+UNMATCHED = '<unmatched>'
+# any other method is counted as OTHER, so clients can't mint labels
+METHODS = {'GET', 'PUT', 'POST', 'DELETE', 'PATCH', 'HEAD', 'OPTIONS'}
+OTHER_METHOD = 'OTHER'
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+DB_CALL_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+REQUESTS = 'http_requests_total'
+LATENCY = 'http_request_duration_seconds'
+SIZE = 'http_response_size_bytes'
+DB_CALLS = 'http_request_db_calls'
+DB_CALLS_BY_HELPER = 'db_calls_total'
+
+HELP = {
+    REQUESTS: ('counter', 'Requests served, by route and status.'),
+    LATENCY: ('histogram', 'Time to serve a request.'),
+    SIZE: ('histogram', 'Response body size.'),
+    DB_CALLS: ('histogram', 'db_connect calls made by one request.'),
+    DB_CALLS_BY_HELPER: ('counter', 'db_connect calls, by route and '
+                                    'helper.'),
+}
+
+lock = threading.Lock()
+# {(method, route, status): count}
+requests = {}
+# {metric: {(method, route): [bucket counts..., +Inf count, sum]}}
+histograms = {LATENCY: {}, SIZE: {}, DB_CALLS: {}}
+BUCKETS = {LATENCY: LATENCY_BUCKETS, SIZE: SIZE_BUCKETS,
+           DB_CALLS: DB_CALL_BUCKETS}
+# {(method, route, helper): count}
+db_calls = {}
+
+
+def reset():
+    with lock:
+        requests.clear()
+        db_calls.clear()
+        for hist in histograms.values():
+            hist.clear()
+
+
+def observe(metric: str, labels: tuple, value: float):
+    """
+    Add value to a histogram. Call with the lock held.
+    """
+    buckets = BUCKETS[metric]
+    hist = histograms[metric].setdefault(labels, [0] * (len(buckets) + 2))
+    for i, bound in enumerate(buckets):
+        if value <= bound:
+            hist[i] += 1
+            break
+    else:
+        hist[len(buckets)] += 1
+    hist[-1] += value
+
+
+def record(method: str, route: str, status: int, secs: float, size: int,
+           calls: dict):
+    labels = (method, route)
+    with lock:
+        key = (method, route, status)
+        requests[key] = requests.get(key, 0) + 1
+        observe(LATENCY, labels, secs)
+        observe(SIZE, labels, size)
+        observe(DB_CALLS, labels, sum(calls.values()))
+        for helper, count in calls.items():
+            key = (method, route, helper)
+            db_calls[key] = db_calls.get(key, 0) + count
+
+
+def start_request():
+    g.metrics_start = time.perf_counter()
+    g.metrics_calls = dbc.start_counting()
+
+
+def end_request(response):
+    start = g.pop('metrics_start', None)
+    if start is None:
+        return response
+    calls = g.pop('metrics_calls', {})
+    dbc.stop_counting()
+    route = request.url_rule.rule if request.url_rule else UNMATCHED
+    # streamed responses don't know their size up front
+    size = 0 if response.is_streamed else response.calculate_content_length()
+    method = request.method if request.method in METHODS else OTHER_METHOD
+    record(method, route, response.status_code,
+           time.perf_counter() - start, size or 0, dict(calls))
+    return response
+
+
+def init_app(app):
+    app.before_request(start_request)
+    app.after_request(end_request)
+
+
+def escape(value) -> str:
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+def format_labels(**labels) -> str:
+    return '{' + ','.join(f'{name}="{escape(value)}"'
+                          for name, value in labels.items()) + '}'
+
+
+def format_bound(bound) -> str:
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+def render() -> str:
+    """
+    Everything recorded so far, in the Prometheus text format.
+    """
+    with lock:
+        snap_requests = dict(requests)
+        snap_hists = {metric: {labels: list(hist)
+                               for labels, hist in hists.items()}
+                      for metric, hists in histograms.items()}
+        snap_calls = dict(db_calls)
+    lines = []
+
+    def header(metric: str):
+        kind, text = HELP[metric]
+        lines.append(f'# HELP {metric} {text}')
+        lines.append(f'# TYPE {metric} {kind}')
+
+    header(REQUESTS)
+    for (method, route, status), count in sorted(snap_requests.items()):
+        labels = format_labels(method=method, route=route, status=status)
+        lines.append(f'{REQUESTS}{labels} {count}')
+    for metric in (LATENCY, SIZE, DB_CALLS):
+        header(metric)
+        bounds = (*BUCKETS[metric], float('inf'))
+        for (method, route), hist in sorted(snap_hists[metric].items()):
+            total = 0
+            for bound, count in zip(bounds, hist):
+                total += count
+                labels = format_labels(method=method, route=route,
+                                       le=format_bound(bound))
+                lines.append(f'{metric}_bucket{labels} {total}')
+            labels = format_labels(method=method, route=route)
+            lines.append(f'{metric}_sum{labels} {hist[-1]}')
+            lines.append(f'{metric}_count{labels} {total}')
+    header(DB_CALLS_BY_HELPER)
+    for (method, route, helper), count in sorted(snap_calls.items()):
+        labels = format_labels(method=method, route=route, helper=helper)
+        lines.append(f'{DB_CALLS_BY_HELPER}{labels} {count}')
+    return '\n'.join(lines) + '\n'
@@ -13,6 +13,7 @@ import pytest
 
 from data.people import NAME
 import data.manuscripts.manuscripts as ms
+import data.manuscripts.simulation as sim
 
 import server.endpoints as ep
 from datetime import datetime
@@ -113,6 +114,7 @@ MOCK_DATE = datetime.now()
 MOCK_STATE = "Submitted"
 MOCK_EDITORS_OBJ = {}
 MOCK_COMMENTS_OBJ = {}
+MOCK_JOB_ID = str(ObjectId())
 
 mock_manuscript = {
     "_id": MOCK_MANU_ID,
@@ -129,15 +131,18 @@ mock_manuscript = {
 }
 
 
+@patch("data.manuscripts.tasks.enqueue_processing", autospec=True,
+       return_value=MOCK_JOB_ID)
 @patch(
     "data.manuscripts.manuscripts.create_manuscript",
     autospec=True,
     return_value={
+        "_id": MOCK_MANU_ID,
         "author": MOCK_AUTHOR,
         "latest_version": {"title": MOCK_TITLE, "text": MOCK_TEXT},
     },
 )
-def test_create_manuscripts(mock_create):
+def test_create_manuscripts(mock_create, mock_enqueue):
     # mock post payload
     payload = {"author": MOCK_AUTHOR, "title": MOCK_TITLE, "text": MOCK_TEXT}
 
@@ -154,6 +159,8 @@ def test_create_manuscripts(mock_create):
     assert data["author"] == MOCK_AUTHOR
     assert data["title"] == MOCK_TITLE
     assert data["text"] == MOCK_TEXT
+    assert data["job_id"] == MOCK_JOB_ID
+    mock_enqueue.assert_called_once_with(MOCK_MANU_ID)
 
     # Optionally, print the response for debugging.
     print(data)
@@ -386,3 +393,329 @@ def test_security_permission_check_denied(mock_is_permitted):
     assert response.status_code == HTTPStatus.FORBIDDEN
     resp_json = response.get_json()
     assert resp_json["message"] == "User does not have permission."
+
+
+@patch("data.manuscripts.search.search", autospec=True,
+       return_value={"total": 1, "page": 1, "page_size": 10,
+                     "results": [{"title": MOCK_TITLE}]})
+def test_search_manuscripts(mock_search):
+    resp = TEST_CLIENT.get(f"{ep.MANUSCRIPTS_SEARCH_EP}?q=manuscript&page=2")
+    assert resp.status_code == HTTPStatus.OK
+    assert resp.get_json()["results"][0]["title"] == MOCK_TITLE
+    mock_search.assert_called_once_with("manuscript", page=2, page_size=10)
+
+
+def test_search_manuscripts_no_query():
+    resp = TEST_CLIENT.get(ep.MANUSCRIPTS_SEARCH_EP)
+    assert resp.status_code == HTTPStatus.BAD_REQUEST
+
+
+@patch("data.manuscripts.counters.get_counts", autospec=True,
+       return_value={"SUB": 3, "REV": 1})
+def test_manuscript_counts(mock_counts):
+    resp = TEST_CLIENT.get(f"{ep.MANUSCRIPTS_COUNTS_EP}?editor=ed@nyu.edu")
+    assert resp.status_code == HTTPStatus.OK
+    resp_json = resp.get_json()
+    assert resp_json["counts"]["SUB"] == 3
+    mock_counts.assert_called_once_with("ed@nyu.edu")
+
+
+@patch("data.manuscripts.manuscripts.transition_manuscripts", autospec=True)
+def test_bulk_action(mock_bulk):
+    ok_id, bad_id = str(ObjectId()), str(ObjectId())
+    mock_bulk.return_value = [
+        {"id": ok_id, "ok": True, "state": "REJ"},
+        {"id": bad_id, "ok": False, "error": "No manuscript found"},
+    ]
+    items = [{"id": ok_id, "action": "REJ"}, {"id": bad_id, "action": "REJ"}]
+    resp = TEST_CLIENT.post(ep.MANUSCRIPTS_BULK_ACTION_EP,
+                            json={"items": items})
+    assert resp.status_code == HTTPStatus.OK
+    resp_json = resp.get_json()
+    assert resp_json["succeeded"] == 1
+    assert resp_json["failed"] == 1
+    mock_bulk.assert_called_once_with(items)
+
+
+def test_bulk_action_no_items():
+    resp = TEST_CLIENT.post(ep.MANUSCRIPTS_BULK_ACTION_EP, json={"items": []})
+    assert resp.status_code == HTTPStatus.BAD_REQUEST
+
+
+@patch("data.manuscripts.simulation.estimate_from_history", autospec=True,
+       return_value=(sim.DEFAULT_TRANSITION_PROBS, sim.DEFAULT_DWELL_DAYS))
+@patch("data.manuscripts.counters.get_counts", autospec=True,
+       return_value={"SUB": 10, "REV": 5})
+def test_manuscript_forecast(mock_counts, mock_estimate):
+    resp = TEST_CLIENT.get(f"{ep.MANUSCRIPTS_FORECAST_EP}?days=30&seed=1")
+    assert resp.status_code == HTTPStatus.OK
+    resp_json = resp.get_json()
+    assert len(resp_json["occupancy"]["SUB"]) == 31
+    assert "50" in resp_json["days_to_decision"]
+
+
+def test_manuscript_forecast_bad_days():
+    resp = TEST_CLIENT.get(f"{ep.MANUSCRIPTS_FORECAST_EP}?days=0")
+    assert resp.status_code == HTTPStatus.BAD_REQUEST
+
+
+@pytest.mark.parametrize("arrivals", ["nan", "inf", "-1", "1e9"])
+def test_manuscript_forecast_bad_arrivals(arrivals):
+    resp = TEST_CLIENT.get(f"{ep.MANUSCRIPTS_FORECAST_EP}"
+                           f"?arrivals_per_day={arrivals}")
+    assert resp.status_code == HTTPStatus.BAD_REQUEST
+
+
+@patch("data.manuscripts.manuscripts.read_states", autospec=True)
+def test_batch_valid_actions(mock_read_states):
+    sub_id, rev_id, missing_id = (str(ObjectId()) for _ in range(3))
+    mock_read_states.return_value = {sub_id: "Submitted", rev_id: "REV"}
+    resp = TEST_CLIENT.post(ep.MANUSCRIPTS_BATCH_VALID_ACTIONS_EP,
+                            json={"ids": [sub_id, rev_id, missing_id]})
+    assert resp.status_code == HTTPStatus.OK
+    resp_json = resp.get_json()
+    assert "ARF" in resp_json["results"][sub_id]["valid_actions"]
+    assert "DRF" in resp_json["results"][rev_id]["valid_actions"]
+    assert resp_json["not_found"] == [missing_id]
+    mock_read_states.assert_called_once_with([sub_id, rev_id, missing_id])
+
+
+def test_batch_valid_actions_too_many():
+    resp = TEST_CLIENT.post(ep.MANUSCRIPTS_BATCH_VALID_ACTIONS_EP,
+                            json={"ids": ["x"] * (ep.MAX_BATCH_IDS + 1)})
+    assert resp.status_code == HTTPStatus.BAD_REQUEST
+
+
+@patch("data.manuscripts.manuscripts.read_editor_queue", autospec=True,
+       return_value={"total": 0, "page": 1, "page_size": 20, "results": []})
+def test_editor_queue(mock_queue):
+    resp = TEST_CLIENT.get("/manuscripts/queue/ed@nyu.edu?state=SUB&state=REV")
+    assert resp.status_code == HTTPStatus.OK
+    mock_queue.assert_called_once_with("ed@nyu.edu", states=["SUB", "REV"],
+                                       page=1, page_size=20)
+
+
+@patch("data.manuscripts.manuscripts.assign_editor", autospec=True,
+       return_value=True)
+def test_assign_editor(mock_assign):
+    manu_id = str(ObjectId())
+    resp = TEST_CLIENT.post(f"/manuscripts/{manu_id}/editors",
+                            json={"email": "ed@nyu.edu"})
+    assert resp.status_code == HTTPStatus.OK
+    mock_assign.assert_called_once_with(manu_id, "ed@nyu.edu", "ED")
+
+
+@patch("data.manuscripts.manuscripts.assign_editor", autospec=True,
+       side_effect=ValueError("Invalid role: XX"))
+def test_assign_editor_bad_role(mock_assign):
+    resp = TEST_CLIENT.post(f"/manuscripts/{ObjectId()}/editors",
+                            json={"email": "ed@nyu.edu", "role": "XX"})
+    assert resp.status_code == HTTPStatus.BAD_REQUEST
+
+
+@patch("data.manuscripts.manuscripts.remove_editor", autospec=True,
+       return_value=False)
+def test_remove_editor_not_assigned(mock_remove):
+    resp = TEST_CLIENT.delete(f"/manuscripts/{ObjectId()}/editors/ed@nyu.edu")
+    assert resp.status_code == HTTPStatus.NOT_FOUND
+
+
+@patch("data.manuscripts.referees.suggest_referees", autospec=True,
+       return_value=[{"email": "ref@nyu.edu", "active": 0}])
+@patch("data.manuscripts.manuscripts.read_one_manuscript", autospec=True)
+def test_suggest_referees(mock_read, mock_suggest):
+    mock_read.return_value = {"latest_version": {"referees": ["busy@nyu.edu"]}}
+    resp = TEST_CLIENT.get(f"{ep.REFEREES_SUGGEST_EP}?k=3&exclude=me@nyu.edu"
+                           f"&manu_id={ObjectId()}")
+    assert resp.status_code == HTTPStatus.OK
+    assert resp.get_json()["referees"][0]["email"] == "ref@nyu.edu"
+    mock_suggest.assert_called_once_with(
+        3, exclude=["me@nyu.edu", "busy@nyu.edu"])
+
+
+def test_suggest_referees_bad_k():
+    resp = TEST_CLIENT.get(f"{ep.REFEREES_SUGGEST_EP}?k=lots")
+    assert resp.status_code == HTTPStatus.BAD_REQUEST
+
+
+@patch("data.manuscripts.referees.get_workload", autospec=True,
+       return_value=None)
+def test_referee_workload_not_found(mock_workload):
+    resp = TEST_CLIENT.get("/referees/nobody@nyu.edu/workload")
+    assert resp.status_code == HTTPStatus.NOT_FOUND
+
+
+@patch("data.manuscripts.manuscripts.read_manuscripts_by_author",
+       autospec=True,
+       return_value={"total": 0, "page": 1, "page_size": 20, "results": []})
+def test_manuscripts_by_author_none(mock_read):
+    resp = TEST_CLIENT.get("/manuscripts/author/Nobody?order=asc&page=2")
+    assert resp.status_code == HTTPStatus.NOT_FOUND
+    mock_read.assert_called_once_with("Nobody", page=2, page_size=20,
+                                      ascending=True)
+
+
+def test_manuscripts_by_author_bad_order():
+    resp = TEST_CLIENT.get("/manuscripts/author/Somebody?order=sideways")
+    assert resp.status_code == HTTPStatus.BAD_REQUEST
+
+
+@patch("data.manuscripts.filters.filter_manuscripts", autospec=True,
+       return_value={"total": 0, "page": 1, "page_size": 20, "results": []})
+def test_manuscript_query(mock_filter):
+    resp = TEST_CLIENT.get(f"{ep.MANUSCRIPTS_QUERY_EP}?state=SUB&state=REV"
+                           "&editor=ed@nyu.edu&page=2")
+    assert resp.status_code == HTTPStatus.OK
+    mock_filter.assert_called_once_with(
+        {"state": ["SUB", "REV"], "editor": "ed@nyu.edu"},
+        page=2, page_size=20)
+
+
+@patch("data.manuscripts.filters.filter_manuscripts", autospec=True,
+       side_effect=ValueError("Unknown filters: title"))
+def test_manuscript_query_bad_filter(mock_filter):
+    resp = TEST_CLIENT.get(f"{ep.MANUSCRIPTS_QUERY_EP}?title=x")
+    assert resp.status_code == HTTPStatus.BAD_REQUEST
+
+
+@patch("data.manuscripts.recommend.recommend", autospec=True,
+       return_value=[{"email": "bio@nyu.edu", "score": 0.5}])
+@patch("data.manuscripts.manuscripts.read_one_manuscript", autospec=True)
+def test_recommended_referees(mock_read, mock_recommend):
+    mock_read.return_value = {"latest_version": {"text": "Enzymes",
+                                                 "referees": ["a@nyu.edu"]}}
+    manu_id = str(ObjectId())
+    resp = TEST_CLIENT.get(f"/manuscripts/{manu_id}/recommended_referees?k=3")
+    assert resp.status_code == HTTPStatus.OK
+    assert resp.get_json()["referees"][0]["email"] == "bio@nyu.edu"
+    mock_recommend.assert_called_once_with("Enzymes", k=3,
+                                           exclude=["a@nyu.edu"])
+
+
+def test_update_manuscript_bad_id():
+    resp = TEST_CLIENT.post("/manuscripts/update",
+                            json={"id": "not-an-id", "title": "T",
+                                  "text": "Text"})
+    assert resp.status_code == HTTPStatus.BAD_REQUEST
+
+
+@patch("data.manuscripts.manuscripts.update_manuscript", autospec=True,
+       return_value=False)
+def test_update_manuscript_not_found(mock_update):
+    resp = TEST_CLIENT.post("/manuscripts/update",
+                            json={"id": str(ObjectId()), "title": "T",
+                                  "text": "Text"})
+    assert resp.status_code == HTTPStatus.NOT_FOUND
+
+
+@patch("data.manuscripts.manuscripts.read_one_manuscript", autospec=True,
+       return_value=None)
+def test_recommended_referees_not_found(mock_read):
+    resp = TEST_CLIENT.get(f"/manuscripts/{ObjectId()}/recommended_referees")
+    assert resp.status_code == HTTPStatus.NOT_FOUND
+
+
+@patch("data.jobs.read_one", autospec=True,
+       return_value={"_id": MOCK_JOB_ID, "status": "done",
+                     "result": {"word_count": 2}})
+def test_get_job(mock_read):
+    resp = TEST_CLIENT.get(f"/jobs/{MOCK_JOB_ID}")
+    assert resp.status_code == HTTPStatus.OK
+    assert resp.get_json()["status"] == "done"
+    mock_read.assert_called_once_with(MOCK_JOB_ID)
+
+
+@patch("data.jobs.read_one", autospec=True,
+       return_value={"_id": MOCK_JOB_ID, "status": "failed",
+                     "error": "RuntimeError: boom",
+                     "traceback": "Traceback (most recent call last): ..."})
+def test_get_job_hides_traceback(mock_read):
+    resp = TEST_CLIENT.get(f"/jobs/{MOCK_JOB_ID}")
+    assert resp.status_code == HTTPStatus.OK
+    assert resp.get_json()["error"] == "RuntimeError: boom"
+    assert "traceback" not in resp.get_json()
+
+
+@patch("data.jobs.read_one", autospec=True, return_value=None)
+def test_get_job_not_found(mock_read):
+    resp = TEST_CLIENT.get(f"/jobs/{MOCK_JOB_ID}")
+    assert resp.status_code == HTTPStatus.NOT_FOUND
+
+
+@patch("data.manuscripts.uploads.put_chunk", autospec=True,
+       return_value={"n": 3, "length": 5, "crc32": 1})
+def test_put_upload_chunk(mock_put):
+    upload_id = str(ObjectId())
+    resp = TEST_CLIENT.put(f"/uploads/{upload_id}/chunks/3", data=b"hello",
+                           content_type="application/octet-stream")
+    assert resp.status_code == HTTPStatus.OK
+    args = mock_put.call_args.args
+    assert args[:2] == (upload_id, 3)
+    assert args[2].read() == b"hello"
+
+
+@patch("data.manuscripts.uploads.complete_upload", autospec=True,
+       side_effect=ValueError("Chunk 1 is missing"))
+def test_complete_upload_missing_chunk(mock_complete):
+    resp = TEST_CLIENT.post(f"/uploads/{ObjectId()}/complete", json={})
+    assert resp.status_code == HTTPStatus.BAD_REQUEST
+    assert "Chunk 1" in resp.get_json()["message"]
+
+
+@patch("data.manuscripts.uploads.start_upload", autospec=True,
+       return_value=None)
+def test_start_upload_no_manuscript(mock_start):
+    resp = TEST_CLIENT.post(f"/manuscripts/{ObjectId()}/uploads",
+                            json={"filename": "paper.docx", "size": 10})
+    assert resp.status_code == HTTPStatus.NOT_FOUND
+
+
+def test_start_upload_no_size():
+    resp = TEST_CLIENT.post(f"/manuscripts/{ObjectId()}/uploads",
+                            json={"filename": "paper.docx"})
+    assert resp.status_code == HTTPStatus.BAD_REQUEST
+
+
+def test_start_upload_bad_size():
+    resp = TEST_CLIENT.post(f"/manuscripts/{ObjectId()}/uploads",
+                            json={"filename": "paper.docx", "size": "big"})
+    assert resp.status_code == HTTPStatus.BAD_REQUEST
+
+
+@patch("data.manuscripts.uploads.iter_file", autospec=True,
+       return_value=iter([b"hi"]))
+@patch("data.manuscripts.uploads.read_upload", autospec=True,
+       return_value={"status": "complete", "content_type": "text/plain",
+                     "length": 2, "filename": 'x"\r\nSet-Cookie: a=b'})
+def test_upload_file_quotes_filename(mock_read, mock_iter):
+    resp = TEST_CLIENT.get(f"/uploads/{ObjectId()}/file")
+    assert resp.status_code == HTTPStatus.OK
+    assert "Set-Cookie" not in resp.headers
+    assert "filename*=UTF-8''x%22%0D%0ASet-Cookie" in \
+        resp.headers["Content-Disposition"]
+
+
+@patch("data.manuscripts.sla.get_sla", autospec=True,
+       return_value={"REV": {"count": 4, "median_days": 12.0,
+                             "p90_days": 30.0, "months": {}}})
+def test_get_sla(mock_sla):
+    resp = TEST_CLIENT.get("/manuscripts/sla?state=REV&month=2024-03")
+    assert resp.status_code == HTTPStatus.OK
+    assert resp.get_json()["sla"]["REV"]["median_days"] == 12.0
+    mock_sla.assert_called_once_with(["REV"], editor="", month="2024-03")
+
+
+@patch("data.manuscripts.sla.get_sla", autospec=True,
+       side_effect=ValueError("month must look like YYYY-MM"))
+def test_get_sla_bad_month(mock_sla):
+    resp = TEST_CLIENT.get("/manuscripts/sla?month=March")
+    assert resp.status_code == HTTPStatus.BAD_REQUEST
+
+
+def test_metrics():
+    TEST_CLIENT.get(ep.HELLO_EP)
+    resp = TEST_CLIENT.get(ep.METRICS_EP)
+    assert resp.status_code == OK
+    assert resp.content_type.startswith("text/plain")
+    text = resp.get_data(as_text=True)
+    assert f'route="{ep.HELLO_EP}",status="200"' in text
@@ -0,0 +1,83 @@
+from flask import Flask
+
+import data.db_connect as dbc
+import server.metrics as mtr
+
+
+@dbc.counted
+def fake_read():
+    return 'doc'
+
+
+def make_app():
+    app = Flask(__name__)
+    mtr.init_app(app)
+
+    @app.route('/things/<thing_id>')
+    def thing(thing_id):
+        fake_read()
+        fake_read()
+        return {'id': thing_id}
+
+    return app
+
+
+def setup_function():
+    mtr.reset()
+
+
+def test_counted_only_while_counting():
+    dbc.stop_counting()
+    assert fake_read() == 'doc'
+    counts = dbc.start_counting()
+    fake_read()
+    assert counts == {'fake_read': 1}
+    dbc.stop_counting()
+    fake_read()
+    assert counts == {'fake_read': 1}
+
+
+def test_observe_buckets():
+    mtr.observe(mtr.DB_CALLS, ('GET', '/x'), 3)
+    mtr.observe(mtr.DB_CALLS, ('GET', '/x'), 1000)
+    hist = mtr.histograms[mtr.DB_CALLS][('GET', '/x')]
+    assert hist[mtr.DB_CALL_BUCKETS.index(5)] == 1
+    assert hist[len(mtr.DB_CALL_BUCKETS)] == 1
+    assert hist[-1] == 1003
+
+
+def test_request_recorded_by_route_template():
+    client = make_app().test_client()
+    client.get('/things/1')
+    client.get('/things/2')
+    client.get('/nowhere')
+    assert mtr.requests[('GET', '/things/<thing_id>', 200)] == 2
+    assert mtr.requests[('GET', mtr.UNMATCHED, 404)] == 1
+    assert mtr.db_calls[('GET', '/things/<thing_id>', 'fake_read')] == 4
+
+
+def test_unknown_method_is_other():
+    client = make_app().test_client()
+    client.open('/things/1', method='BREW')
+    client.open('/things/1', method='SPAM')
+    assert mtr.requests[(mtr.OTHER_METHOD, mtr.UNMATCHED, 405)] == 2
+    assert not any(method in ('BREW', 'SPAM')
+                   for method, _, _ in mtr.requests)
+
+
+def test_render():
+    client = make_app().test_client()
+    client.get('/things/1')
+    text = mtr.render()
+    labels = 'method="GET",route="/things/<thing_id>"'
+    assert (f'{mtr.REQUESTS}{{{labels},status="200"}} 1') in text
+    assert f'{mtr.LATENCY}_count{{{labels}}} 1' in text
+    assert f'{mtr.DB_CALLS}_bucket{{{labels},le="2.0"}} 1' in text
+    assert f'{mtr.DB_CALLS}_bucket{{{labels},le="1.0"}} 0' in text
+    assert (f'{mtr.DB_CALLS_BY_HELPER}{{{labels},helper="fake_read"}} 2'
+            in text)
+    assert f'# TYPE {mtr.LATENCY} histogram' in text
+
+
+def test_escape():
+    assert mtr.escape('a"b\\c\nd') == 'a\\"b\\\\c\\nd'